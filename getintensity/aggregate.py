@@ -1,18 +1,35 @@
 import math
+import logging
 import geojson
+import numpy as np
+import pandas as pd
 
-from .thirdparty.utm import from_latlon, to_latlon, OutOfRangeError
+from .thirdparty.utm import from_latlon, to_latlon, OutOfRangeError, \
+    to_latlon_array
+from .thirdparty.utm.conversion import latlon_to_zone_number
+from .grids import get_grid, utm_span, cell_sums, cells_dataframe, \
+    cell_counts, finest_grid, UtmGrid
+from .metrics import RunMetrics
+from .logs import WarningCounter
+
+logger = logging.getLogger(__name__)
 
 PRECISION = 6  # Maximum precision of lat/lon coordinates of output
 
+PRODUCTTYPES = ['geo_1km', 'geo_10km']
+
 
-def aggregate(df, producttype, minresps=0):
+def aggregate(df, producttype, minresps=0, metrics=None, zone=None):
     """
 
     :synopsis: Aggregate entries into geocoded boxes
     :param entries: :obj:`list` of dict entries
-    :param producttype: The product type (geo_1km, geo_10km)
-    :param bool debug: If true, store debugging info
+    :param producttype: The product type (geo_1km, geo_10km, or another
+        grid, see :py:obj:`getintensity.grids.get_grid`)
+    :param int minresps: Minimum number of responses per box
+    :param metrics: (optional) :py:obj:`RunMetrics` to record this stage
+    :param int zone: (optional) UTM zone to project all entries in, see
+        :py:obj:`getUtmArrayFromCoordinates`
     :returns: `GeoJSON` :py:obj:`FeatureCollection`, see below
 
     The return value is a list of geocoded blocks.
@@ -38,54 +55,152 @@ def aggregate(df, producttype, minresps=0):
 
     """
 
-    # producttype is either 'geo_1km', '10km'
-    if '_1km' in producttype or producttype == '1km':
-        resolutionMeters = 1000
+    metrics = metrics or RunMetrics()
+    with metrics.stage('aggregate_' + producttype,
+                       rows_in=len(df)) as stage:
+        agg_df = _aggregate(df, producttype, minresps, zone)
+        stage.rows_out = len(agg_df)
+
+    return agg_df
 
-    elif '_10km' in producttype or producttype == '10km':
-        resolutionMeters = 10000
 
-    else:
-        resolutionMeters = None
+def _aggregate(df, producttype, minresps, zone=None):
 
-    if not resolutionMeters:
+    # producttype is e.g. 'geo_1km', 'geo_10km' (see grids.get_grid)
+    try:
+        grid = get_grid(producttype, zone)
+    except ValueError:
         raise ValueError('Aggregate: got unknown type ' + producttype)
 
-    # Loop through each entry, compute the bin it belongs to
-
-    def _getutm(x):
-        # Get UTM for each location
-        return getUtmFromCoordinates(x.LAT, x.LON, resolutionMeters)
-    df['LOCATION'] = df.apply(_getutm, axis=1)
+    # Compute the bin each entry belongs to. Entries are grouped by
+    # integer keys; names are only built for each bin.
+    keys = grid.assign(df['LAT'].values, df['LON'].values)
+    nolocation = keys < 0
+    keys = keys[~nolocation]
+    bins, inverse = np.unique(keys, return_inverse=True)
+    locations = np.full(len(df), None, dtype=object)
+    locations[~nolocation] = grid.names(bins)[inverse]
+    df['LOCATION'] = locations
 
     # Drop rows with no location data
-    df = df[~df['LOCATION'].isnull()]
-    print('Geocoded %s got %i entries with valid locations.' %
-          (producttype, len(df.index)))
-
-    by_locs = df.groupby('LOCATION')
-    agg_df = by_locs.agg(INTENSITY=('INTENSITY', 'mean'),
-                         NRESP=('INTENSITY', 'count'))
-    agg_df = agg_df[agg_df['NRESP'] >= minresps]
-    print('Aggregated to %i locations with %i+ responses.' %
-          (len(agg_df.index), minresps))
-
-    # Get center of each UTM location
-    def _getCenter(row):
-        results = getUtmPolyFromString(row.name, resolutionMeters)
-        if not results:
-            return None, None
-        # This returns lon/lat; need to reverse it
-        data = results['center']['coordinates'][::-1]
-        return data
-
-    # getUtmPolyFromString returns lon/lat
-    agg_df[['LAT', 'LON']] = agg_df.apply(
-                _getCenter, axis=1, result_type='expand')
+    warnings = WarningCounter(logger, 'aggregate_' + producttype)
+    warnings.count('no valid UTM location', nolocation.sum())
+    warnings.report()
+
+    logger.info('Geocoded %s got %i entries with valid locations.',
+                producttype, len(keys))
+
+    sums = cell_sums(keys, df['INTENSITY'].values[~nolocation])
+    agg_df = cells_dataframe(grid, sums, minresps)
+    logger.info('Aggregated to %i locations with %i+ responses.',
+                len(agg_df.index), minresps)
 
     return agg_df
 
 
+def aggregate_adaptive(df, producttypes=PRODUCTTYPES, minresps=0,
+                       metrics=None, zone=None, mixed=False, preferred=None):
+    """
+
+    :synopsis: Aggregate entries at the resolution with the most boxes
+    :param df: :py:obj:`DataFrame` with LAT, LON and INTENSITY columns
+    :param producttypes: Product types to choose from, e.g. ['geo_1km',
+        'geo_10km'] (one must roll up into all the others, see
+        :py:obj:`getintensity.grids`)
+    :param int minresps: Minimum number of responses per box
+    :param metrics: (optional) :py:obj:`RunMetrics` to record this stage
+    :param int zone: (optional) UTM zone, see :py:obj:`aggregate`
+    :param bool mixed: Use the finest boxes where they have minresps
+        responses, and the coarsest elsewhere
+    :param preferred: (optional) Product type used if resolutions tie,
+        e.g. the network's preferred_resolution (see
+        :py:obj:`getintensity.registry.Network`)
+    :returns: (:py:obj:`DataFrame` as returned by :py:obj:`aggregate`,
+        product type or 'mixed')
+
+    The number of boxes with minresps or more responses at each
+    resolution is counted in one pass over the entries (keys of the
+    finest grid, rolled up into the others). Only the boxes of the
+    resolution with the most are then computed; ties go to the preferred
+    product type, or else the finest.
+
+    In mixed mode, entries in the finest boxes with fewer than minresps
+    responses are aggregated into the coarsest boxes instead, so each
+    entry is counted once. Since boxes of different sizes can have the
+    same UTM string, the span in meters is added to the UTM strings,
+    e.g. '560000 4200000 34 S 1000'.
+
+    """
+
+    metrics = metrics or RunMetrics()
+    name = 'aggregate_' + ('mixed' if mixed else 'auto')
+    with metrics.stage(name, rows_in=len(df)) as stage:
+        grids = [get_grid(producttype, zone) for producttype in producttypes]
+        finest = finest_grid(grids)
+
+        keys = finest.assign(df['LAT'].values, df['LON'].values)
+        nolocation = keys < 0
+        warnings = WarningCounter(logger, name)
+        warnings.count('no valid UTM location', nolocation.sum())
+        warnings.report()
+
+        intensities = df['INTENSITY'].values[~nolocation]
+        keys = keys[~nolocation]
+        counted = ~np.isnan(intensities.astype(float))
+        cells, counts = np.unique(keys[counted], return_counts=True)
+
+        if mixed:
+            coarsest = [grid for grid in grids
+                        if all([other.is_parent(grid) for other in grids])]
+            agg_df = _aggregate_mixed(keys, intensities, cells, counts,
+                                      finest, coarsest[0], minresps)
+            producttype = 'mixed'
+        else:
+            nboxes = [(cell_counts(finest, cells, counts, grid) >=
+                       minresps).sum() for grid in grids]
+            best = max(range(len(grids)), key=lambda i: (
+                nboxes[i], producttypes[i] == preferred, grids[i] is finest,
+                -i))
+            grid = grids[best]
+            producttype = producttypes[best]
+            logger.info('Boxes with %i+ responses: %s; using %s.',
+                        minresps, ', '.join(['%s %i' % pair for pair in
+                                             zip(producttypes, nboxes)]),
+                        producttype)
+
+            if grid is not finest:
+                keys = finest.parent(keys, grid)
+                intensities = intensities[keys >= 0]
+                keys = keys[keys >= 0]
+            agg_df = cells_dataframe(grid, cell_sums(keys, intensities),
+                                     minresps)
+
+        stage.rows_out = len(agg_df)
+
+    return agg_df, producttype
+
+
+def _aggregate_mixed(keys, intensities, cells, counts, fine, coarse,
+                     minresps):
+    # Dense boxes of the fine grid, and the rest in the coarse grid
+    dense = np.isin(keys, cells[counts >= minresps])
+    fine_df = cells_dataframe(
+        fine, cell_sums(keys[dense], intensities[dense]), minresps)
+
+    parents = fine.parent(keys[~dense], coarse)
+    sparse = intensities[~dense][parents >= 0]
+    coarse_df = cells_dataframe(
+        coarse, cell_sums(parents[parents >= 0], sparse), minresps)
+
+    for grid, cells_df in ((fine, fine_df), (coarse, coarse_df)):
+        if isinstance(grid, UtmGrid):
+            cells_df.index = cells_df.index + ' %i' % grid.span
+    logger.info('Aggregated to %i %s and %i %s locations with %i+ '
+                'responses.', len(fine_df), fine.name, len(coarse_df),
+                coarse.name, minresps)
+    return pd.concat([fine_df, coarse_df])
+
+
 # --------------------
 # UTM Helper Functions
 # ---------------------
@@ -103,11 +218,12 @@ def getUtmFromCoordinates(lat, lon, span):
     package. If :py:obj:`span` is specified, the output resolution is degraded
     via the :py:obj:`floor` function.
 
-    :py:obj:`span` accepts the values 'geo_10km', 'geo_1km', or the size of
-    the UTM box in meters (should be a power of 10).
+    :py:obj:`span` accepts the values 'geo_10km', 'geo_1km' (or any other
+    'geo_<N>km', e.g. 'geo_2.5km'), or the size of the UTM box in meters.
 
     This will NOT filter the location based on precision of the input
-    coordinates.
+    coordinates. Locations that cannot be converted return None; this
+    is called for each row so it does not log anything.
 
     """
 
@@ -124,31 +240,99 @@ def getUtmFromCoordinates(lat, lon, span):
     y = myFloor(y, span)
 
     if not x or not y or not zonenum:
-        print('WARNING: Cannot get UTM for', lat, lon)
         return None
 
     utm = '{} {} {} {}'.format(x, y, zonenum, zoneletter)
     return utm
 
 
+def getUtmArrayFromCoordinates(lats, lons, span, zone=None):
+    """
+
+    :synopsis: Convert arrays of lat/lon coordinates to UTM strings
+    :param lats: Latitudes (array-like)
+    :param lons: Longitudes (array-like)
+    :param span: Size of the UTM box, see :py:obj:`getUtmFromCoordinates`
+    :param int zone: (optional) UTM zone to project all locations in
+    :returns: :py:obj:`numpy.ndarray` of UTM strings, None for locations
+        that cannot be converted
+
+    Vectorized version of :py:obj:`getUtmFromCoordinates`, with the same
+    results.
+
+    By default each location is projected in its own zone, so boxes next
+    to a zone boundary are cut by it (into slivers on each side). If
+    :py:obj:`zone` is set (e.g. the zone of the epicenter, see
+    :py:obj:`getUtmZone`), all locations are projected in that zone, so
+    the boxes of an event are a single uniform grid. Locations too far
+    from that zone for a valid easting still use their own zone.
+
+    """
+
+    grid = UtmGrid(_floatSpan(span), zone)
+    keys = grid.assign(lats, lons)
+    valid = keys >= 0
+    locs = np.full(len(keys), None, dtype=object)
+    locs[valid] = grid.names(keys[valid])
+    return locs
+
+
+def getUtmCenters(utms, span):
+    """
+
+    :synopsis: Compute the (lat/lon) centers of UTM strings
+    :param utms: UTM strings (array-like)
+    :param int span: The size of the UTM box in meters
+    :returns: (lats, lons) :py:obj:`numpy.ndarray`
+
+    Vectorized version of the center of :py:obj:`getUtmPolyFromString`.
+
+    """
+
+    if not len(utms):
+        return np.array([]), np.array([])
+
+    parts = pd.Series(utms).str.split(' ', expand=True)
+    x = parts[0].astype(np.int64).values
+    y = parts[1].astype(np.int64).values
+    zones = parts[2].astype(int).values
+    lats, lons = to_latlon_array(x + span / 2, y + span / 2, zones,
+                                 parts[3].values.astype(str))
+    return lats.round(PRECISION), lons.round(PRECISION)
+
+
+def getUtmZone(lat, lon):
+    """
+
+    :synopsis: Get the UTM zone number of a location
+    :param float lat: Latitude
+    :param float lon: Longitude
+    :returns: int, for the zone parameter of :py:obj:`aggregate`
+
+    """
+
+    return latlon_to_zone_number(lat, lon)
+
+
 def _floatSpan(span):
 
-    if span == 'geo_1km' or span == '1km' or span == 1000:
-        span = 1000
-    elif span == 'geo_10km' or span == '10km' or span == 10000:
-        span = 10000
-    else:
+    try:
+        span = utm_span(span)
+    except ValueError:
         raise TypeError('Invalid span value ' + str(span))
 
     return span
 
 
-def getUtmPolyFromString(utm, span):
+def getUtmPolyFromString(utm, span, clip=True):
     """
 
     :synopsis: Compute the (lat/lon) bounds and center from a UTM string
     :param utm: A UTM string
     :param int span: The size of the UTM box in meters
+    :param bool clip: Cut boxes at the eastern boundary of their zone;
+        set to False for boxes aggregated in a fixed zone, which can be
+        outside of it
     :return: :py:obj:`dict`, see below
 
     Get the bounding box polygon and center point for a UTM string suitable
@@ -178,7 +362,7 @@ def getUtmPolyFromString(utm, span):
     def _reverse(tup, eastborder=None):
 
         (y, x) = tup
-        if eastborder and x > ebound:
+        if clip and eastborder and x > ebound:
             x = ebound
         x = round(x, PRECISION)
         y = round(y, PRECISION)
@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = 'raw/eventids.json'
+
+
+class IdCache:
+    """
+
+    Persistent cache of external event IDs, e.g.::
+
+      cache = IdCache('eventids.json')
+      extid = cache.get('emsc', 'nc72282711')
+      if extid is None:
+          extid = ...  # Ask the network
+          cache.set('emsc', 'nc72282711', extid)
+          cache.save()
+
+    The file is a JSON object of {network: {eventid: extid}}. Without a
+    filename the cache is kept in memory only.
+
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.ids = {}
+        self.changed = False
+
+        if filename and os.path.exists(filename):
+            with open(filename, 'r') as f:
+                self.ids = json.load(f)
+
+    def get(self, network, eventid):
+        return self.ids.get(network, {}).get(eventid)
+
+    def set(self, network, eventid, extid):
+        if self.get(network, eventid) == extid:
+            return
+        self.ids.setdefault(network, {})[eventid] = extid
+        self.changed = True
+
+    def save(self):
+        if not self.filename or not self.changed:
+            return
+
+        # Write then rename, so batch runs never see a partial file
+        outdir = os.path.dirname(os.path.abspath(self.filename))
+        os.makedirs(outdir, exist_ok=True)
+        fd, tmpfile = tempfile.mkstemp(prefix='.tmp.', dir=outdir)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.ids, f, indent=1, sort_keys=True)
+            os.replace(tmpfile, self.filename)
+        except BaseException:
+            os.remove(tmpfile)
+            raise
+        self.changed = False
+
+
+def resolve_extids(retriever, eventids, network, cache):
+    """
+
+    :synopsis: Look up the external IDs of several events
+    :param retriever: Function taking an event ID and returning the
+        external ID, or None if not found
+    :param eventids: :py:obj:`list` of event IDs
+    :param str network: Network of the external IDs
+    :param cache: :py:obj:`IdCache`
+    :returns: :py:obj:`dict` of {eventid: extid}, None if not found
+
+    Only events missing from the cache are looked up, then the cache is
+    saved once at the end.
+
+    """
+
+    extids = {}
+    missing = []
+    for eventid in eventids:
+        extid = cache.get(network, eventid)
+        if extid is None:
+            missing.append(eventid)
+        extids[eventid] = extid
+
+    if missing:
+        logger.info('Looking up %i of %i %s IDs.',
+                    len(missing), len(eventids), network)
+    for eventid in missing:
+        extid = retriever(eventid)
+        if extid:
+            cache.set(network, eventid, extid)
+        extids[eventid] = extid
+
+    cache.save()
+    return extids
@@ -0,0 +1,204 @@
+import logging
+import os
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = 'raw/catalog.sqlite'
+QUERY_SIZE = 500  # event IDs per query
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    network TEXT NOT NULL,
+    eventid TEXT NOT NULL,
+    time TEXT,
+    lat REAL,
+    lon REAL,
+    depth REAL,
+    magnitude REAL,
+    PRIMARY KEY (network, eventid)
+);
+CREATE TABLE IF NOT EXISTS ids (
+    eventid TEXT NOT NULL,
+    network TEXT NOT NULL,
+    extid TEXT NOT NULL,
+    PRIMARY KEY (eventid, network)
+);
+CREATE INDEX IF NOT EXISTS ids_extid ON ids (extid);
+CREATE TABLE IF NOT EXISTS products (
+    network TEXT NOT NULL,
+    eventid TEXT NOT NULL,
+    product TEXT NOT NULL,
+    nstations INTEGER,
+    updated REAL,
+    PRIMARY KEY (network, eventid, product)
+);
+"""
+
+
+class EventCatalog:
+    """
+
+    Local SQLite catalog of the events seen by previous runs, e.g.::
+
+      catalog = EventCatalog('raw/catalog.sqlite')
+      catalog.add_event('neic', 'us70004jxe', origin)
+      catalog.add_ids('ga', {'us70004jxe': 'ga2019nsodfc'})
+      catalog.get_network('ga2019nsodfc')   # 'ga'
+
+    It holds three tables, all indexed so lookups do not scan:
+
+    ========  ==========================================================
+    events    Origin (time, lat, lon, depth, magnitude) of each event
+    ids       External ID of each Comcat event in each network
+    products  Intensity data found for an event (e.g. 'dyfi') and its
+              number of stations
+    ========  ==========================================================
+
+    The catalog is filled in as data is fetched, so batch jobs can check
+    which events are known to have data without the network.
+
+    """
+
+    def __init__(self, filename=':memory:'):
+        self.filename = filename
+        if filename != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(filename)),
+                        exist_ok=True)
+        self.db = sqlite3.connect(filename)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def add_event(self, network, eventid, origin=None):
+        """
+
+        :synopsis: Add or update an event
+        :param str network: Network of the event ID
+        :param str eventid: Event ID
+        :param dict origin: (optional) Origin from
+            :py:obj:`getintensity.tools.IntensityParser.get_origin`
+
+        """
+
+        origin = origin or {}
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (network, eventid, origin.get('time'), origin.get('lat'),
+                 origin.get('lon'), origin.get('depth'),
+                 origin.get('magnitude')))
+
+    def add_ids(self, network, extids):
+        """
+
+        :synopsis: Add the external IDs of Comcat events
+        :param str network: Network of the external IDs
+        :param dict extids: {eventid: extid}, None values are ignored
+
+        """
+
+        rows = [(eventid, network, extid)
+                for eventid, extid in extids.items() if extid]
+        with self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO ids VALUES (?, ?, ?)', rows)
+            self.db.executemany(
+                'INSERT OR IGNORE INTO events (network, eventid) '
+                'VALUES (?, ?)', [(network, row[2]) for row in rows])
+
+    def add_product(self, network, eventid, product, nstations=None):
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?)',
+                (network, eventid, product, nstations, time.time()))
+
+    def get_event(self, network, eventid):
+        row = self.db.execute(
+            'SELECT time, lat, lon, depth, magnitude FROM events '
+            'WHERE network = ? AND eventid = ?',
+            (network, eventid)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('time', 'lat', 'lon', 'depth', 'magnitude'), row))
+
+    def get_network(self, eventid):
+        """
+
+        :synopsis: Get the network of a known event ID
+        :param str eventid: Event ID from any network
+        :returns: Network, or None if the ID is not in the catalog
+
+        """
+
+        row = self.db.execute(
+            'SELECT network FROM ids WHERE extid = ? LIMIT 1',
+            (eventid,)).fetchone()
+        if row is None:
+            row = self.db.execute(
+                'SELECT network FROM events WHERE eventid = ? LIMIT 1',
+                (eventid,)).fetchone()
+        return row[0] if row else None
+
+    def get_extid(self, eventid, network):
+        row = self.db.execute(
+            'SELECT extid FROM ids WHERE eventid = ? AND network = ?',
+            (eventid, network)).fetchone()
+        return row[0] if row else None
+
+    def get_extids(self, eventids, network):
+        """
+
+        :synopsis: Get the known external IDs of several events
+        :param eventids: :py:obj:`list` of Comcat event IDs
+        :param str network: Network of the external IDs
+        :returns: :py:obj:`dict` of {eventid: extid} of the events in the
+            catalog
+
+        """
+
+        extids = {}
+        eventids = list(eventids)
+        # SQLite limits the number of parameters of a query
+        for start in range(0, len(eventids), QUERY_SIZE):
+            chunk = eventids[start:start + QUERY_SIZE]
+            rows = self.db.execute(
+                'SELECT eventid, extid FROM ids WHERE network = ? AND '
+                'eventid IN (%s)' % ', '.join(['?'] * len(chunk)),
+                [network] + chunk).fetchall()
+            extids.update(rows)
+        return extids
+
+    def get_eventid(self, extid):
+        # Comcat event ID of an external ID
+        row = self.db.execute(
+            'SELECT eventid FROM ids WHERE extid = ? LIMIT 1',
+            (extid,)).fetchone()
+        return row[0] if row else None
+
+    def plan(self, eventids, network):
+        """
+
+        :synopsis: Check which events are known to have data in a network
+        :param eventids: :py:obj:`list` of Comcat event IDs
+        :param str network: Network to check
+        :returns: :py:obj:`dict` of {eventid: (extid, nstations)}; extid
+            is None if unknown, nstations is None if no data was found
+
+        """
+
+        plan = {}
+        for eventid in eventids:
+            extid = eventid if network == 'neic' else \
+                self.get_extid(eventid, network)
+            nstations = None
+            if extid:
+                row = self.db.execute(
+                    'SELECT MAX(nstations) FROM products '
+                    'WHERE network = ? AND eventid = ?',
+                    (network, extid)).fetchone()
+                nstations = row[0]
+            plan[eventid] = (extid, nstations)
+        return plan
@@ -3,10 +3,18 @@
 import pandas as pd
 import numpy as np
 import json
+import logging
+import os
+import re
 from io import StringIO
 
 from libcomcat.classes import DetailEvent
 
+from getintensity.metrics import RunMetrics
+from getintensity.registry import Network
+
+logger = logging.getLogger(__name__)
+
 netid = 'DYFI'
 source = 'USGS (Did You Feel It?)'
 reference = 'USGS Did You Feel It? System'
@@ -15,6 +23,13 @@ default_outfile = 'dyfi_dat.xml'
 TIMEOUT = 60
 MIN_RESPONSES = 3  # minimum number of DYFI responses per grid
 
+# Types of the numeric properties of geocoded geojson features
+NUMERIC_PROPERTIES = {
+    'cdi': np.float64,
+    'dist': np.float64,
+    'stddev': np.float64,
+    'nresp': np.int64,
+}
 
 # For legacy DYFI events only (cdi_geo.txt files)
 DYFI_COLUMNS_REPLACE = {
@@ -23,7 +38,8 @@ DYFI_COLUMNS_REPLACE = {
     'Latitude': 'lat',
     'Longitude': 'lon',
     'No. of responses': 'nresp',
-    'Hypocentral distance': 'distance'
+    'Hypocentral distance': 'distance',
+    'Suspect?': 'suspect'
 }
 
 OLD_DYFI_COLUMNS_REPLACE = {
@@ -32,10 +48,34 @@ OLD_DYFI_COLUMNS_REPLACE = {
     'Latitude': 'lat',
     'Longitude': 'lon',
     'No. of responses': 'nresp',
-    'Epicentral distance': 'distance'
+    'Epicentral distance': 'distance',
+    'Suspect?': 'suspect'
 }
 
 
+class NeicNetwork(Network):
+
+    netid = netid
+    source = source
+    reference = reference
+    default_outfile = default_outfile
+
+    preferred_resolution = 'geo_1km'
+    external_ids = False
+    max_concurrency = 4
+    file_patterns = [r'dyfi_geo_', r'cdi_geo\.txt']
+
+    def fetch(self, extid):
+        return get_dyfi_dataframe_from_comcat(self.parser, extid)
+
+    def get_file_parser(self, inputfile):
+        if '.geojson' in inputfile:
+            return _parse_dyfi_geocoded_json
+        elif re.search(r'\.csv$|\.txt$', inputfile):
+            return _parse_dyfi_geocoded_csv
+        return None
+
+
 # This should be called as a method of IntensityParser hence the 'self'
 def get_dyfi_dataframe_from_comcat(self, extid):
     df = None
@@ -47,14 +87,21 @@ def get_dyfi_dataframe_from_comcat(self, extid):
         config = self.config['neic']
         template = config['template']
         url = template.replace('[EID]', extid)
-        print('Checking URL:', url)
-        detail = DetailEvent(url)
+        logger.info('Checking URL: %s', url)
+        with self.metrics.stage('fetch', network='neic'):
+            detail = DetailEvent(url)
 
     if detail is None:
         msg = 'Error getting data from Comcat'
         return None, msg
 
-    df, msg = _parse_dyfi_detail(detail)
+    # Use the event we already have to compute distances
+    if self.origin is None:
+        self.origin = _get_origin(detail)
+
+    df, msg = _parse_dyfi_detail(
+        detail, self.metrics,
+        preferred=self.get_network('neic').preferred_resolution)
     if df is None:
         msg = msg or 'Error parsing Comcat data'
         return None, msg
@@ -62,8 +109,47 @@ def get_dyfi_dataframe_from_comcat(self, extid):
     return df, None
 
 
-def _parse_dyfi_detail(detail):
+# This should be called as a method of IntensityParser hence the 'self'
+def get_origin_from_comcat(self, eventid):
+    # Get the origin from the cached event record in the raw directory,
+    # or from Comcat (then cache it)
+    data_path = self.get_option('directories', 'data_path', '.')
+    rawfile = os.path.join(data_path, 'raw', 'origin.%s.json' % eventid)
+    if os.path.exists(rawfile):
+        with open(rawfile, 'r') as f:
+            origin = json.load(f)
+        # Records cached before the time was added are fetched again
+        if 'time' in origin:
+            logger.info('Read origin of %s from %s.', eventid, rawfile)
+            return origin
+
+    template = self.config['neic']['template']
+    url = template.replace('[EID]', eventid)
+    logger.info('Checking URL: %s', url)
+    with self.metrics.stage('fetch_origin', network='neic'):
+        detail = DetailEvent(url)
+    origin = _get_origin(detail)
+
+    os.makedirs(os.path.dirname(rawfile), exist_ok=True)
+    with open(rawfile, 'w') as f:
+        json.dump(origin, f)
+    logger.info('Saving origin in %s', rawfile)
+    return origin
+
+
+def _get_origin(detail):
+    return {
+        'lat': detail.latitude,
+        'lon': detail.longitude,
+        'depth': detail.depth,
+        'time': detail.time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'magnitude': detail.magnitude,
+    }
+
+
+def _parse_dyfi_detail(detail, metrics=None, preferred=None):
 
+    metrics = metrics or RunMetrics()
     if not detail.hasProduct('dyfi'):
         msg = '%s has no DYFI product at this time.' % detail.url
         dataframe = None
@@ -74,41 +160,36 @@ def _parse_dyfi_detail(detail):
     # search the dyfi product, see which of the geocoded
     # files (1km or 10km) it has.  We're going to select the data from
     # whichever of the two has more entries with >= 3 responses,
-    # preferring 1km if there is a tie.
-    df_10k = pd.DataFrame({'a': []})
-    df_1k = pd.DataFrame({'a': []})
-
-    # get 10km data set, if exists
-    if len(dyfi.getContentsMatching('dyfi_geo_10km.geojson')):
-        bytes_10k, _ = dyfi.getContentBytes('dyfi_geo_10km.geojson')
-        df_10k = _parse_dyfi_geocoded_json(bytes_10k)
-        print('Found dyfi_geo_10km.geojson with', len(df_10k), 'stations.')
-
-    # get 1km data set, if exists
-    if len(dyfi.getContentsMatching('dyfi_geo_1km.geojson')):
-        print('Found dyfi_geo_1km.geojson')
-        bytes_1k, _ = dyfi.getContentBytes('dyfi_geo_1km.geojson')
-        df_1k = _parse_dyfi_geocoded_json(bytes_1k)
-        print('Found dyfi_geo_1km.geojson with', len(df_1k), 'stations.')
-
-    if len(df_1k) >= len(df_10k):
-        df = df_1k
-        print('Selecting geo_1km file.')
-    else:
-        df = df_10k
-        print('Selecting geo_10km file.')
-
-    if not len(df):
+    # preferring the preferred resolution (or 1km) if there is a tie.
+    jdicts = {}
+    for geotype in ('10km', '1km'):
+        filename = 'dyfi_geo_%s.geojson' % geotype
+        if len(dyfi.getContentsMatching(filename)):
+            data = _get_content(dyfi, filename, metrics)
+            with metrics.stage('parse', network='neic'):
+                jdicts[geotype] = _load_geocoded_json(data)
+
+    df = _select_geocoded_json(jdicts, metrics, 'neic', preferred)
+    if df is None or not len(df):
         # try to get the text file data set
         if not len(dyfi.getContentsMatching('cdi_geo.txt')):
             return (None, 'No geocoded datasets are available for this event.')
 
-        bytes_geo, _ = dyfi.getContentBytes('cdi_geo.txt')
-        df = _parse_dyfi_geocoded_csv(bytes_geo)
+        bytes_geo = _get_content(dyfi, 'cdi_geo.txt', metrics)
+        with metrics.stage('parse', network='neic') as stage:
+            df = _parse_dyfi_geocoded_csv(bytes_geo)
+            stage.rows_out = len(df)
 
     return df, ''
 
 
+def _get_content(product, filename, metrics):
+    with metrics.stage('fetch', network='neic') as stage:
+        data, _ = product.getContentBytes(filename)
+        stage.bytes += len(data)
+    return data
+
+
 def _parse_dyfi_geocoded_csv(bytes_data):
     # the dataframe we want has columns:
     # 'intensity', 'distance', 'lat', 'lon', 'station', 'nresp'
@@ -129,47 +210,105 @@ def _parse_dyfi_geocoded_csv(bytes_data):
         df = df.rename(index=str, columns=OLD_DYFI_COLUMNS_REPLACE)
     else:
         df = df.rename(index=str, columns=DYFI_COLUMNS_REPLACE)
-    df = df.drop(['Suspect?', 'City', 'State'], axis=1)
+    # The suspect column is used (then dropped) by validate()
+    df = df.drop(['City', 'State'], axis=1)
     df = df[df['nresp'] >= MIN_RESPONSES]
 
     return df
 
 
+def _select_geocoded_json(jdicts, metrics, network, preferred=None):
+    # Parse the geocoded file ('1km' or '10km' in jdicts) with the most
+    # entries with >= 3 responses. If there is a tie, prefer the network's
+    # preferred resolution (e.g. 'geo_1km'), or else 1km.
+    # The other file is only counted, not parsed.
+    counts = {}
+    for geotype, jdict in jdicts.items():
+        counts[geotype] = _count_geocoded_json(jdict)
+        logger.info('Found %s geocoded file with %i stations.',
+                    geotype, counts[geotype])
+    if not counts:
+        return None
+
+    geotype = max([geotype for geotype in ('1km', '10km')
+                   if geotype in counts],
+                  key=lambda geotype: (counts[geotype],
+                                       'geo_' + geotype == preferred))
+    logger.info('Selecting geo_%s file.', geotype)
+    with metrics.stage('parse', network=network) as stage:
+        df = _geocoded_json_dataframe(jdicts[geotype])
+        stage.rows_out = len(df) if df is not None else 0
+    return df
+
+
 def _parse_dyfi_geocoded_json(bytes_data):
+    return _geocoded_json_dataframe(_load_geocoded_json(bytes_data))
+
 
-    text_data = bytes_data.decode('utf-8')
-    jdict = json.loads(text_data)
-    if len(jdict['features']) == 0:
+def _load_geocoded_json(bytes_data):
+    return json.loads(bytes_data.decode('utf-8'))
+
+
+def _count_geocoded_json(jdict, minresps=MIN_RESPONSES):
+    # Number of entries _geocoded_json_dataframe() keeps
+    return sum([1 for feature in jdict['features']
+                if feature['properties'].get('nresp', 0) >= minresps])
+
+
+def _geocoded_json_dataframe(jdict):
+
+    features = jdict['features']
+    if len(features) == 0:
         return None
-    prop_columns = list(jdict['features'][0]['properties'].keys())
-    columns = ['lat', 'lon'] + prop_columns
-    arrays = [[] for col in columns]
-    df_dict = dict(zip(columns, arrays))
-    for feature in jdict['features']:
-        for column in prop_columns:
-            if column == 'name':
-                prop = feature['properties'][column]
-                prop = prop[0:prop.find('<br>')]
-            else:
-                prop = feature['properties'][column]
-
-            df_dict[column].append(prop)
-        # the geojson defines a box, so let's grab the center point
-        lons = [c[0] for c in feature['geometry']['coordinates'][0]]
-        lats = [c[1] for c in feature['geometry']['coordinates'][0]]
-        clon = np.mean(lons)
-        clat = np.mean(lats)
-        df_dict['lat'].append(clat)
-        df_dict['lon'].append(clon)
+
+    # Collect each property once per feature, then convert whole columns
+    prop_columns = list(features[0]['properties'].keys())
+    properties = [feature['properties'] for feature in features]
+    df_dict = {'lat': None, 'lon': None}
+    for column in prop_columns:
+        df_dict[column] = _property_array(
+            [props.get(column) for props in properties], column)
+    df_dict['lat'], df_dict['lon'] = _box_centers(features)
 
     df = pd.DataFrame(df_dict)
+    if 'name' in df.columns:
+        # e.g. 'UTM:(10S 043 436 10000)<br>UTM:(10S 043 436 10000)'
+        df['name'] = df['name'].str.split('<br>', n=1).str[0]
     df = df.rename(index=str, columns={
         'cdi': 'intensity',
         'dist': 'distance',
         'name': 'station',
         'stddev': 'intensity_stddev'
     })
-    if df is not None:
-        df = df[df['nresp'] >= MIN_RESPONSES]
+    df = df[df['nresp'] >= MIN_RESPONSES]
 
     return df
+
+
+def _property_array(values, column):
+    # Typed array of a numeric property (NaN if missing), or a list
+    dtype = NUMERIC_PROPERTIES.get(column)
+    if dtype is None:
+        return values
+    try:
+        return np.array(values, dtype=dtype)
+    except (TypeError, ValueError):
+        # e.g. missing numbers of responses
+        return np.array(values, dtype=np.float64)
+
+
+def _box_centers(features):
+    # the geojson defines a box, so let's grab the center point
+    rings = [feature['geometry']['coordinates'][0] for feature in features]
+    try:
+        coords = np.array(rings, dtype=np.float64)
+    except ValueError:
+        # Boxes with different numbers of points
+        coords = None
+    if coords is not None and coords.ndim == 3:
+        centers = coords.mean(axis=1)
+        return centers[:, 1], centers[:, 0]
+
+    lats = np.array([np.mean([c[1] for c in ring]) for ring in rings])
+    lons = np.array([np.mean([c[0] for c in ring]) for ring in rings])
+    return lats, lons
@@ -1,14 +1,21 @@
 #! /usr/bin/env python
 
-import urllib.request as request
 import urllib.error as urlerror
 import pandas as pd
-import numpy as np
 import zipfile
+import os
+import re
 import json
+import logging
+import functools
 from io import BytesIO, StringIO
 
-from getintensity.aggregate import aggregate
+from getintensity.aggregate import aggregate, aggregate_adaptive
+from getintensity.validate import validate, deduplicate
+from getintensity.registry import Network
+from getintensity.stations import set_station_format
+
+logger = logging.getLogger(__name__)
 
 netid = 'INTENSITY'
 source = 'European-Mediterranean Seismic Center'
@@ -16,10 +23,36 @@ reference = 'EMSC (aggregated)'
 default_outfile = 'emsc_ii_dat.xml'
 
 EMSC_COLUMNS = ['LON', 'LAT', 'INTENSITY_UNCORRECTED', 'INTENSITY']
-TIMEOUT = 60
 MIN_RESPONSES = 3  # minimum number of DYFI responses per grid
 
 
+class EmscNetwork(Network):
+
+    netid = netid
+    source = source
+    reference = reference
+    default_outfile = default_outfile
+
+    preferred_resolution = 'geo_1km'
+    max_concurrency = 2
+    file_patterns = [r'\d{8}_\d{7}\.txt']
+
+    def fetch(self, extid):
+        return get_dyfi_dataframe_from_emsc(self.parser, extid)
+
+    def get_file_parser(self, inputfile):
+        if '.geojson' in inputfile:
+            # Only import comcat (and libcomcat) if needed
+            from getintensity.comcat import _parse_dyfi_geocoded_json
+            return _parse_dyfi_geocoded_json
+        elif re.search(r'\.csv$|\.txt$', inputfile):
+            return functools.partial(process_emsc_csv, self.parser)
+        return None
+
+    def resolve_id(self, eventid):
+        return get_extid_from_emsc(self.parser, eventid)
+
+
 # This should be called as a method of IntensityParser, hence the 'self'
 def get_dyfi_dataframe_from_emsc(self, extid):
     df = None
@@ -32,27 +65,28 @@ def get_dyfi_dataframe_from_emsc(self, extid):
     url = template
     url = url.replace('[EID]', extid)
     try:
-        print('Attempting URL:')
-        print(url)
-        fh = request.urlopen(url, timeout=TIMEOUT)
-        rawdata = fh.read()
-        fh.close()
-        print('Retrieved %s from EMSC' % extid)
-    except urlerror.HTTPError as e:
-        print('Could not get data for %s from EMSC. Stopping.' % extid)
-        print('HTTPError: %s %s' % (e.code, e.reason))
-        exit()
+        logger.info('Attempting URL: %s', url)
+        with self.metrics.stage('fetch', network='emsc') as stage:
+            rawdata = self.fetch_url(url)
+            stage.bytes += len(rawdata)
+        logger.info('Retrieved %s from EMSC', extid)
+    except urlerror.URLError as e:
+        logger.error('Could not get data for %s from EMSC. Stopping.', extid)
+        logger.error('%s', e)
+        return None, 'Could not get data for %s from EMSC' % extid
 
     csvdata = parse_zip(rawdata)
+    if csvdata is None:
+        return None, 'No names found in EMSC zip'
     if not csvdata:
         msg = 'Could not unzip raw data'
         return None, msg
 
-    rawfile = 'raw/rawdata.emsc.%s.csv' % extid
+    rawfile = os.path.join(_raw_path(self), 'rawdata.emsc.%s.csv' % extid)
     with open(rawfile, 'w') as f:
         f.write(csvdata.decode('utf-8'))
 
-    df = process_emsc_csv(csvdata)
+    df = process_emsc_csv(self, csvdata)
     if df is None:
         msg = 'Could not decode EMSC data'
         return None, msg
@@ -67,14 +101,13 @@ def get_extid_from_emsc(self, inputid):
     url = url.replace('[EID]', inputid)
 
     try:
-        print('Attempting URL:')
-        print(url)
-        fh = request.urlopen(url, timeout=TIMEOUT)
-        rawdata = fh.read()
-        fh.close()
-    except urlerror.HTTPError as e:
-        print('Error accessing EMSC Eventid server. Stopping.')
-        print('HTTPError: %s %s' % (e.code, e.reason))
+        logger.info('Attempting URL: %s', url)
+        with self.metrics.stage('resolve_id', network='emsc') as stage:
+            rawdata = self.fetch_url(url)
+            stage.bytes += len(rawdata)
+    except urlerror.URLError as e:
+        logger.error('Error accessing EMSC Eventid server. Stopping.')
+        logger.error('%s', e)
         return None
 
     try:
@@ -82,51 +115,76 @@ def get_extid_from_emsc(self, inputid):
         jsondata = json.loads(rawdata)
         extid = jsondata[0]['id']
     except:
-        print('Unable to unpack EMSC Eventid server.')
+        logger.error('Unable to unpack EMSC Eventid server.')
         return
 
-    rawfile = 'raw/rawid.emsc.%s.json' % extid
+    rawfile = os.path.join(_raw_path(self), 'rawid.emsc.%s.json' % extid)
     with open(rawfile, 'w') as f:
         f.write(json.dumps(jsondata))
-    print('Saving raw data in', rawfile)
-    print('Retrieved', extid, 'from EMSC Eventid server.')
+    logger.info('Saving raw data in %s', rawfile)
+    logger.info('Retrieved %s from EMSC Eventid server.', extid)
     return extid
 
 
+def _raw_path(self):
+    # Raw data is saved in the raw directory of the data path
+    data_path = self.get_option('directories', 'data_path', '.')
+    raw_path = os.path.join(data_path, 'raw')
+    os.makedirs(raw_path, exist_ok=True)
+    return raw_path
+
+
 def parse_zip(bufferstr):
     """
-    parse binary object as zip file
+    parse binary object as zip file, returns None if it is empty
     """
 
     z = zipfile.ZipFile(BytesIO(bufferstr))
     filenames = z.namelist()
     if not filenames:
-        print('No names found.')
-        with open('tmp.badzipfile.zip', 'wb') as f:
-            f.write(bufferstr)
-        exit()
+        logger.error('No names found in EMSC zip.')
+        return None
 
     if len(filenames) > 1:
-        print('WARNING: >1 file found, using only the first available.')
+        logger.warning('>1 file found, using only the first available.')
 
     data = z.read(filenames[0])
     return data
 
 
-def process_emsc_csv(rawdata):
-
-    df = _parse_emsc_raw(rawdata)
-    df_10km = aggregate(df, producttype='geo_10km', minresps=MIN_RESPONSES)
-    df_1km = aggregate(df, producttype='geo_1km', minresps=MIN_RESPONSES)
-    if len(df_10km) > len(df_1km):
-        df = df_10km
-        print('Using 10km aggregation.')
+# This should be called as a method of IntensityParser, hence the 'self'
+def process_emsc_csv(self, rawdata):
+
+    metrics = self.metrics
+    with metrics.stage('parse_raw', network='emsc') as stage:
+        df = _parse_emsc_raw(rawdata)
+        stage.rows_out = len(df)
+
+    # Remove bad and (optionally) repeated reports before aggregating
+    df = validate(df, utm=True, network='emsc', metrics=metrics)
+    if self.get_option('emsc', 'deduplicate', 'no') == 'yes':
+        precision = int(self.get_option('emsc', 'dedup_precision', 3))
+        df = deduplicate(df, precision=precision, network='emsc',
+                         metrics=metrics)
+
+    # Use the resolution with the most boxes (the preferred one if they
+    # tie), unless set in config.ini
+    zone = self.get_zone(df)
+    resolution = self.get_option('emsc', 'resolution', 'auto')
+    if resolution in ('auto', 'mixed'):
+        df, producttype = aggregate_adaptive(
+            df, minresps=MIN_RESPONSES, metrics=metrics, zone=zone,
+            mixed=(resolution == 'mixed'),
+            preferred=self.get_network('emsc').preferred_resolution)
     else:
-        df = df_1km
-        print('Using 1km aggregation.')
+        df = aggregate(df, producttype=resolution, minresps=MIN_RESPONSES,
+                       metrics=metrics, zone=zone)
+        producttype = resolution
+    logger.info('Using %s aggregation.', producttype)
 
-    # This adds a 'station' column e.g. EMSC.UTM:(667000 7742000 50 K)
-    df['STATION'] = 'EMSC.UTM:(' + df.index + ')'
+    # Station IDs e.g. EMSC.UTM:(667000 7742000 50 K) are made from the
+    # index when written
+    set_station_format(df, 'EMSC.UTM:(%s)')
 
     return df
 
@@ -143,14 +201,3 @@ def _parse_emsc_raw(emscdata):
     df['LON'] = df['LON'].round(decimals=3)
 
     return df
-
-
-def _compute_stddev_bossu(df):
-    # From Bossu et al, SRL 2016 88 (1): 72–81.
-    # doi: https://doi.org/10.1785/0220160120
-    # This is no longer used; instead, compute stddev via
-    # Worden et al. using nresps
-    ii = df['INTENSITY']
-    stddevs = np.ones_like(ii) * 0.49
-    stddevs[ii >= 3.15] = 0.36
-    return stddevs
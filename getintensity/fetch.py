@@ -0,0 +1,55 @@
+import logging
+import socket
+import time
+import urllib.request as request
+import urllib.error as urlerror
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT = 60  # seconds
+RETRIES = 2  # Number of retries after the first attempt
+BACKOFF = 1.0  # seconds before the first retry, doubled for each retry
+
+# HTTP status codes worth retrying
+RETRY_STATUS = [429, 500, 502, 503, 504]
+
+
+def fetch_url(url, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF):
+    """
+
+    :synopsis: Read a URL, retrying temporary errors
+    :param str url: URL
+    :param float timeout: Timeout of each attempt, in seconds
+    :param int retries: Number of retries
+    :param float backoff: Wait before the first retry, in seconds; each
+        retry waits twice as long as the previous one
+    :returns: bytes
+    :raises: :py:obj:`urllib.error.HTTPError` or
+        :py:obj:`urllib.error.URLError` if all attempts fail
+
+    Server errors (5xx), 429 (too many requests), timeouts and connection
+    errors are retried. Other HTTP errors (e.g. 404) are raised at once.
+
+    """
+
+    attempt = 0
+    while True:
+        try:
+            with request.urlopen(url, timeout=timeout) as fh:
+                return fh.read()
+        except urlerror.HTTPError as e:
+            if e.code not in RETRY_STATUS or attempt >= retries:
+                raise
+            error = 'HTTP %i %s' % (e.code, e.reason)
+        except (urlerror.URLError, socket.timeout, ConnectionError) as e:
+            if attempt >= retries:
+                if isinstance(e, urlerror.URLError):
+                    raise
+                raise urlerror.URLError(e)
+            error = repr(e)
+
+        wait = backoff * 2 ** attempt
+        attempt += 1
+        logger.warning('Error reading %s (%s), retry %i of %i in %.1fs.',
+                       url, error, attempt, retries, wait)
+        time.sleep(wait)
@@ -0,0 +1,231 @@
+"""
+Fuse the data from several networks into a single station set.
+
+For events felt across borders, each network (DYFI, GA, EMSC) has its
+own stations, often overlapping. :py:obj:`fuse` fetches all networks at
+the same time, then :py:obj:`fuse_stations` bins their stations onto a
+common UTM grid (the same boxes as
+:py:obj:`getintensity.aggregate.aggregate`) and merges each box:
+
+=========  ===========================================================
+INTENSITY  Mean intensity weighted by the number of responses
+NRESP      Total number of responses
+NNETWORKS  Number of networks with stations in this box
+SOURCE     Sources of the stations in this box
+=========  ===========================================================
+
+Since each station's intensity is already the mean of its responses,
+the weighted mean is the mean of all responses in the box.
+
+"""
+
+import concurrent.futures
+import logging
+import numpy as np
+import pandas as pd
+
+from .grids import get_grid, cells_dataframe
+from .metrics import RunMetrics
+from .output import ATTRIBUTE_COLUMNS
+from .profiling import Profiler
+from .stations import format_stations
+from .tools import IntensityParser
+import getintensity.registry as registry
+
+logger = logging.getLogger(__name__)
+
+netid = 'FUSED'
+source = 'Fused intensity data'
+default_outfile = 'fused_ii_dat.xml'
+
+PRODUCTTYPE = 'geo_10km'
+MIN_RESPONSES = 3  # minimum number of responses per box
+
+
+def fuse(iparser, networks=None, producttype=PRODUCTTYPE,
+         minresps=MIN_RESPONSES):
+    """
+
+    :synopsis: Get the fused data of all networks for one event
+    :param iparser: :py:obj:`IntensityParser` for the event
+    :param networks: :py:obj:`list` of networks, default all
+    :param producttype: Common UTM grid, e.g. 'geo_10km' or 'geo_25km'
+        (see :py:obj:`getintensity.grids.utm_span`)
+    :param int minresps: Minimum number of responses per box
+    :returns: (:py:obj:`DataFrame`, None) or (None, error message)
+
+    The output attributes of :py:obj:`iparser` (netid, source, reference,
+    default_outfile) are set for the fused data.
+
+    """
+
+    networks = networks or registry.available_networks()
+    results = fetch_networks(iparser, networks)
+
+    dfs = {network: df for network, (df, msg) in results.items()
+           if df is not None and len(df)}
+    for network, (df, msg) in results.items():
+        if network not in dfs:
+            logger.warning('No data from %s: %s', network, msg)
+    if not dfs:
+        return None, 'No data found in any network'
+
+    df = fuse_stations(list(dfs.values()), producttype, minresps,
+                       metrics=iparser.metrics, zone=iparser.get_zone())
+    if not len(df):
+        return None, 'No fused locations with %i+ responses' % minresps
+
+    model = iparser.get_stddev_model('fused')
+    if model.applies(df):
+        df['INTENSITY_STDDEV'] = model.compute(df)
+    origin = iparser.find_origin()
+    if origin is not None:
+        df['DISTANCE'] = iparser._compute_distance(df, origin)
+
+    iparser.netid = netid
+    iparser.source = source
+    iparser.reference = 'Fused: ' + ', '.join(
+        [results[network][0].attrs.get('reference', network)
+         for network in dfs])
+    iparser.default_outfile = default_outfile
+    df.attrs.update(network='fused', netid=netid, source=source,
+                    reference=iparser.reference)
+
+    return df, None
+
+
+def fetch_networks(iparser, networks):
+    """
+
+    :synopsis: Fetch the data of an event from several networks at once
+    :param iparser: :py:obj:`IntensityParser` for the event
+    :param networks: :py:obj:`list` of networks
+    :returns: :py:obj:`dict` of {network: (DataFrame or None, message)}
+
+    External IDs are found first (usually from the ID cache), then each
+    network is fetched in its own thread, up to the network's
+    max_concurrency. Each thread uses its own parser; their stage metrics
+    and profiles are added to :py:obj:`iparser`'s afterwards.
+
+    """
+
+    results = {}
+    extids = {}
+    for network in networks:
+        extid = iparser.get_extid_from_network(iparser.eventid, network)
+        if extid:
+            extids[network] = extid
+        else:
+            results[network] = (None, 'No external ID found')
+
+    def _fetch(network):
+        child = IntensityParser(config=iparser.config,
+                                eventid=iparser.eventid, network=network)
+        child.origin = iparser.origin
+        if iparser.profiler:
+            child.profiler = Profiler(iparser.profiler.outdir,
+                                      interval=iparser.profiler.interval)
+        child.metrics = RunMetrics(
+            eventid=iparser.eventid,
+            trace_memory=iparser.metrics.trace_memory,
+            profiler=child.profiler)
+        try:
+            df, msg = child.get_dyfi_dataframe_from_network(
+                extids[network], network)
+        except Exception as e:
+            logger.exception('Error fetching %s', network)
+            df, msg = None, str(e)
+        return child, df, msg
+
+    if extids:
+        with concurrent.futures.ThreadPoolExecutor(len(extids)) as pool:
+            futures = {network: pool.submit(_fetch, network)
+                       for network in extids}
+        for network, future in futures.items():
+            child, df, msg = future.result()
+            iparser.metrics.stages.extend(child.metrics.stages)
+            if iparser.profiler:
+                iparser.profiler.merge(child.profiler)
+            # e.g. from the Comcat event, instead of looking it up again
+            if iparser.origin is None and child.origin is not None:
+                iparser.origin = child.origin
+            results[network] = (df, msg)
+
+    return {network: results[network] for network in networks}
+
+
+def fuse_stations(dfs, producttype=PRODUCTTYPE, minresps=MIN_RESPONSES,
+                  metrics=None, zone=None):
+    """
+
+    :synopsis: Merge the stations of several networks onto a common grid
+    :param dfs: :py:obj:`list` of postprocessed station
+        :py:obj:`DataFrame`, with LAT, LON, INTENSITY and NRESP columns,
+        and NETID and SOURCE columns or df.attrs
+    :param producttype: Common UTM grid, e.g. 'geo_10km'
+    :param int minresps: Minimum number of responses per box
+    :param metrics: (optional) :py:obj:`RunMetrics` to record this stage
+    :param int zone: (optional) UTM zone of the common grid, see
+        :py:obj:`getintensity.grids.get_grid`
+    :returns: :py:obj:`DataFrame` with one row per box, see above
+
+    Stations without NRESP count as one response. The NETID of the fused
+    stations is kept in df.attrs, like those of the networks.
+
+    Stations are binned by the integer keys of the grid, as in
+    :py:obj:`getintensity.aggregate.aggregate`; the sources, names and
+    centers are only computed for the boxes kept.
+
+    """
+
+    grid = get_grid(producttype, zone)
+    metrics = metrics or RunMetrics()
+    columns = ['LAT', 'LON', 'INTENSITY', 'NRESP', 'NETID', 'SOURCE']
+
+    frames = []
+    for df in dfs:
+        frame = df.reindex(columns=columns)
+        for column, attribute in ATTRIBUTE_COLUMNS:
+            if column not in df.columns:
+                frame[column] = df.attrs.get(attribute)
+        frames.append(frame)
+    df = pd.concat(frames, ignore_index=True)
+
+    with metrics.stage('fuse', rows_in=len(df)) as stage:
+        keys = grid.assign(df['LAT'].values, df['LON'].values)
+        located = keys >= 0
+        keys = keys[located]
+        df = df[located]
+
+        # Responses and intensities weighted by responses in each box
+        nresps = df['NRESP'].fillna(1).values.astype(float)
+        intensities = df['INTENSITY'].values.astype(float)
+        weighted = np.where(np.isnan(intensities), 0, intensities * nresps)
+        sums = pd.DataFrame({'SUM': weighted, 'NRESP': nresps},
+                            index=keys).groupby(level=0).sum()
+        sums = sums[sums['NRESP'] >= minresps]
+
+        # Networks and sources of the boxes kept
+        kept = np.isin(keys, sums.index.values)
+        by_keys = pd.DataFrame({
+            'NETID': df['NETID'].values[kept],
+            'SOURCE': df['SOURCE'].values[kept],
+        }, index=keys[kept]).groupby(level=0)
+        sums['NNETWORKS'] = by_keys['NETID'].nunique()
+        sums['SOURCE'] = by_keys['SOURCE'].agg(_join)
+
+        fused = cells_dataframe(grid, sums)
+        fused['STATION'] = format_stations(fused.index,
+                                           netid + '.UTM:(%s)')
+        fused = fused.reset_index(drop=True)
+        fused.attrs = {'netid': netid}
+
+        stage.rows_out = len(fused)
+
+    logger.info('Fused %i stations into %i %s locations.',
+                len(df), len(fused), producttype)
+    return fused
+
+
+def _join(values):
+    return ', '.join(sorted(set(values.dropna())))
@@ -1,19 +1,56 @@
 # Copy some functionality from shakemap.coremods.dyfi_dat
 
 import os
-import urllib.request as request
+import json
+import logging
+import datetime
 import urllib.error as urlerror
 
-from getintensity.comcat import _parse_dyfi_geocoded_json
+from getintensity.comcat import _parse_dyfi_geocoded_json, \
+    _load_geocoded_json, _select_geocoded_json
+from getintensity.registry import Network
+from getintensity.stations import format_stations
+
+logger = logging.getLogger(__name__)
 
 netid = 'GA'
 source = 'Geoscience Australia (Felt report)'
 reference = 'Geoscience Australia'
 default_outfile = 'ga_ii_dat.xml'
 
-TIMEOUT = 60
 MIN_RESPONSES = 3  # minimum number of DYFI responses per grid
 
+# Search window around the Comcat origin for get_extid_from_ga
+SEARCH_SECONDS = 60
+SEARCH_MAGNITUDE = 0.5
+SEARCH_RADIUS = 100  # km
+
+
+class GaNetwork(Network):
+
+    netid = netid
+    source = source
+    reference = reference
+    default_outfile = default_outfile
+
+    preferred_resolution = 'geo_1km'
+    max_concurrency = 2
+    file_patterns = [r'felt_reports_']
+
+    def fetch(self, extid):
+        return get_dyfi_dataframe_from_ga(self.parser, extid)
+
+    def get_file_parser(self, inputfile):
+        if '.geojson' in inputfile:
+            return _parse_dyfi_geocoded_json
+        return None
+
+    def resolve_id(self, eventid):
+        return get_extid_from_ga(self.parser, eventid)
+
+    def postprocess(self, df):
+        postprocess(df)
+
 
 # This should be called as a method of IntensityParser, hence the 'self'
 def get_dyfi_dataframe_from_ga(self, extid):
@@ -24,55 +61,123 @@ def get_dyfi_dataframe_from_ga(self, extid):
     config = self.config['ga']
     template = config['fetcher_template']
     template = template.replace('[EID]', extid)
-    df_by_geotype = {}
+    jdict_by_geotype = {}
 
-    print('Attempting to find GA ID with', extid)
+    logger.info('Attempting to find GA ID with %s', extid)
     for geotype in ('10km', '1km'):
         filename = 'felt_reports_%s_filtered.geojson' % geotype
         url = template
         url = url.replace('[EID]', extid)
         url = url.replace('[FILE]', filename)
         try:
-            print('Attempting URL:')
-            print(url)
-            fh = request.urlopen(url, timeout=TIMEOUT)
-            data = fh.read()
-            fh.close()
-            print('Retrieved %s from GA' % filename)
-        except urlerror.HTTPError as e:
-            print('Could not get data for %s from GA. Stopping.' % filename)
-            print('HTTPError: %s %s' % (e.code, e.reason))
-            exit()
-
-        df = _parse_dyfi_geocoded_json(data)
-        print('File %s has %i stations.' % (filename, len(df)))
-        df_by_geotype[geotype] = df
+            logger.info('Attempting URL: %s', url)
+            with self.metrics.stage('fetch', network='ga') as stage:
+                data = self.fetch_url(url)
+                stage.bytes += len(data)
+            logger.info('Retrieved %s from GA', filename)
+        except urlerror.URLError as e:
+            logger.error('Could not get data for %s from GA. Stopping.',
+                         filename)
+            logger.error('%s', e)
+            return None, 'Could not get %s from GA' % filename
+
+        with self.metrics.stage('parse', network='ga'):
+            jdict_by_geotype[geotype] = _load_geocoded_json(data)
 
         raw_path = data_path + '/raw'
         os.makedirs(raw_path, exist_ok=True)
         with open(raw_path + '/' + filename, 'w') as f:
             f.write(data.decode('utf-8'))
 
-    if len(df_by_geotype) < 1:
+    # Choose the most number of stations; only that file is parsed
+    df = _select_geocoded_json(
+        jdict_by_geotype, self.metrics, 'ga',
+        preferred=self.get_network('ga').preferred_resolution)
+    if df is None or not len(df):
         msg = 'Could not get geojson data from GA'
         return None, msg
 
-    # Choose the most number of stations
-    sortedlist = sorted(df_by_geotype.values(), key=len)
-    df = sortedlist[-1]
-
     return df, ''
 
 
-def getextid_from_ga(eventid):
-
-    raise NotImplementedError
+# This should be called as a method of IntensityParser, hence the 'self'
+def get_extid_from_ga(self, eventid):
+    # Search GA for events close to the Comcat origin in time, space and
+    # magnitude, and return the ID of the closest in time
+
+    origin = self.get_origin(eventid)
+    if not origin or not origin.get('time'):
+        logger.error('Cannot search GA without the origin of %s.', eventid)
+        return None
+
+    time = datetime.datetime.strptime(origin['time'], '%Y-%m-%dT%H:%M:%S')
+    window = datetime.timedelta(seconds=SEARCH_SECONDS)
+    magnitude = origin.get('magnitude') or 0
+    replace = {
+        '[MIN_MAG]': '%.1f' % (magnitude - SEARCH_MAGNITUDE),
+        '[MAX_MAG]': '%.1f' % (magnitude + SEARCH_MAGNITUDE),
+        '[STARTTIME]': (time - window).strftime('%Y-%m-%dT%H:%M:%S'),
+        '[ENDTIME]': (time + window).strftime('%Y-%m-%dT%H:%M:%S'),
+        '[LAT]': '%.4f' % origin['lat'],
+        '[LON]': '%.4f' % origin['lon'],
+        '[RADIUS]': '%i' % SEARCH_RADIUS,
+    }
+    url = self.config['ga']['search_template']
+    for key, value in replace.items():
+        url = url.replace(key, value)
+
+    try:
+        logger.info('Attempting URL: %s', url)
+        with self.metrics.stage('resolve_id', network='ga') as stage:
+            rawdata = self.fetch_url(url)
+            stage.bytes += len(rawdata)
+    except urlerror.URLError as e:
+        logger.error('Error accessing GA event search. Stopping.')
+        logger.error('%s', e)
+        return None
+
+    try:
+        events = _parse_ga_events(json.loads(rawdata.decode('utf-8')))
+    except (ValueError, TypeError, AttributeError):
+        logger.error('Unable to unpack GA event search.')
+        return None
+    if not events:
+        logger.error('No GA event found for %s.', eventid)
+        return None
+
+    def _delay(event):
+        if not event[1]:
+            return window.total_seconds()
+        evtime = datetime.datetime.strptime(event[1][0:19],
+                                            '%Y-%m-%dT%H:%M:%S')
+        return abs((evtime - time).total_seconds())
+
+    extid = min(events, key=_delay)[0]
+    logger.info('Retrieved %s from GA event search.', extid)
+    return extid
+
+
+def _parse_ga_events(jdata):
+    # Get a list of (event_id, event_time) from a GA event search,
+    # either a list of events or a page of 'results'
+    if isinstance(jdata, dict):
+        jdata = jdata.get('results', jdata.get('features', []))
+
+    events = []
+    for event in jdata:
+        if 'properties' in event:
+            event = event['properties']
+        extid = event.get('event_id') or event.get('id')
+        if extid:
+            events.append((str(extid), event.get('event_time')))
+    return events
 
 
 def postprocess(df):
-    if 'UTM' in df['location'][0]:
+    # In place: the location becomes the station code
+    if len(df) and 'UTM' in df['location'].iloc[0]:
         df['station'] = df['location']
     else:
-        df['station'] = 'UTM:(' + df['location'] + ')'
+        df['station'] = format_stations(df['location'], 'UTM:(%s)')
 
-    df = df.drop(columns=['location'])
+    df.drop(columns=['location'], inplace=True)
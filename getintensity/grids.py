@@ -0,0 +1,432 @@
+"""
+Grids for aggregating reports into cells.
+
+Each grid assigns an integer key (int64) to each location with
+:py:meth:`Grid.assign`, so reports can be grouped by key without building
+a string per report. Names (the station or location strings) and centers
+are only computed for the cells that are kept.
+
+================  ========================================================
+UtmGrid           UTM squares of any span in meters, e.g. 'geo_1km',
+                  'geo_2.5km', 'geo_25km'. Names are UTM strings, as
+                  returned by :py:obj:`getintensity.aggregate.aggregate`
+GeohashGrid       Geohash cells, e.g. 'geohash_5' (about 5 km). Names are
+                  geohash strings
+================  ========================================================
+
+Grids are hierarchical: the keys of a fine grid can be rolled up into a
+coarser grid of the same kind with :py:meth:`Grid.parent` (e.g. 1 km UTM
+squares into 10 km squares, or geohash_6 into geohash_5), with the same
+result as assigning the locations to the coarser grid.
+:py:obj:`aggregate_levels` uses this to aggregate several resolutions
+from a single pass over the reports.
+
+"""
+
+import re
+import numpy as np
+import pandas as pd
+
+from .thirdparty.utm import from_latlon_array, to_latlon_array
+
+PRECISION = 6  # Maximum precision of lat/lon coordinates of output
+
+# Range of valid UTM eastings (m)
+MIN_EASTING = 100000
+MAX_EASTING = 1000000
+
+ZONE_LETTERS = np.array(list('CDEFGHJKLMNPQRSTUVWX'))
+
+# UTM keys are ((zone * 32 + letter) * NY + y) * NX + x, where x and y are
+# the easting and northing divided by the span (at least 1 m)
+UTM_NX = MAX_EASTING
+UTM_NY = 10000001
+
+GEOHASH_ALPHABET = np.array(list('0123456789bcdefghjkmnpqrstuvwxyz'))
+MAX_GEOHASH_PRECISION = 12  # 60 bits
+
+
+def get_grid(producttype, zone=None):
+    """
+
+    :synopsis: Get the grid of a product type
+    :param producttype: 'geo_<N>km' or '<N>km' (UTM squares of N km, e.g.
+        geo_1km, geo_2.5km), the span of UTM squares in meters, or
+        'geohash_<P>' (geohash cells of P characters)
+    :param int zone: (optional) For UTM grids, the zone to project all
+        locations in (see :py:obj:`UtmGrid`)
+    :returns: :py:obj:`Grid`
+    :raises: ValueError for unknown product types
+
+    """
+
+    if isinstance(producttype, Grid):
+        return producttype
+    if isinstance(producttype, str):
+        match = re.match(r'geohash_(\d+)$', producttype)
+        if match:
+            return GeohashGrid(int(match.group(1)))
+    return UtmGrid(utm_span(producttype), zone)
+
+
+def utm_span(span):
+    """
+
+    :synopsis: Get the span in meters of UTM squares
+    :param span: 'geo_<N>km', '<N>km' or the span in meters
+    :returns: int
+    :raises: ValueError for invalid spans
+
+    """
+
+    if isinstance(span, str):
+        match = re.match(r'(geo_)?(\d+(\.\d+)?)km$', span)
+        meters = float(match.group(2)) * 1000 if match else 0
+    elif isinstance(span, (int, float, np.integer)):
+        meters = span
+    else:
+        meters = 0
+
+    if meters < 1 or meters != int(meters):
+        raise ValueError('Invalid span value ' + str(span))
+    return int(meters)
+
+
+class Grid:
+    """
+
+    Base class of the grids. Subclasses implement:
+
+    ======================  ==============================================
+    assign(lats, lons)      Keys of the cells of locations, -1 if invalid
+    names(keys)             Names of cells
+    centers(keys)           (lats, lons) of the centers of cells
+    parent(keys, grid)      Keys of the cells of a coarser grid
+    is_parent(grid)         True if this grid's cells can be rolled up
+                            into grid's
+    ======================  ==============================================
+
+    """
+
+    name = None
+
+    def assign(self, lats, lons):
+        raise NotImplementedError
+
+    def names(self, keys):
+        raise NotImplementedError
+
+    def centers(self, keys):
+        raise NotImplementedError
+
+    def parent(self, keys, grid):
+        raise NotImplementedError
+
+    def is_parent(self, grid):
+        return False
+
+    def __repr__(self):
+        return '<%s %s>' % (type(self).__name__, self.name)
+
+
+class UtmGrid(Grid):
+    """
+
+    UTM squares of any span in meters. Cell names are 'x y zone letter'
+    UTM strings, x and y being the easting and northing of the
+    southwest corner.
+
+    By default each location is projected in its own zone. If zone is
+    set, all locations are projected in that zone (those too far from it
+    for a valid easting still use their own zone).
+
+    """
+
+    def __init__(self, span, zone=None):
+        self.span = utm_span(span)
+        self.zone = zone
+        if self.span % 1000:
+            self.name = 'geo_%gkm' % (self.span / 1000)
+        else:
+            self.name = 'geo_%ikm' % (self.span // 1000)
+
+    def assign(self, lats, lons):
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+
+        x, y, zones, letters = from_latlon_array(
+            lats, lons, force_zone_number=self.zone)
+        if self.zone is not None:
+            with np.errstate(invalid='ignore'):
+                outside = ~((x >= MIN_EASTING) & (x < MAX_EASTING))
+            if outside.any():
+                x[outside], y[outside], zones[outside], letters[outside] = \
+                    from_latlon_array(lats[outside], lons[outside])
+
+        with np.errstate(invalid='ignore'):
+            valid = np.isfinite(x) & np.isfinite(y)
+            xi = np.where(valid, np.floor(x / self.span), 0).astype(np.int64)
+            yi = np.where(valid, np.floor(y / self.span), 0).astype(np.int64)
+        # As getUtmFromCoordinates, which rejects a zero easting or northing
+        valid &= (xi != 0) & (yi != 0) & (zones != 0)
+
+        letters = np.searchsorted(ZONE_LETTERS, letters)
+        keys = ((zones.astype(np.int64) * 32 + letters) * UTM_NY + yi) * \
+            UTM_NX + xi
+        return np.where(valid, keys, -1)
+
+    def split(self, keys):
+        # (eastings, northings, zones, letters) of the southwest corners
+        keys = np.asarray(keys, dtype=np.int64)
+        xi = keys % UTM_NX
+        yi = keys // UTM_NX % UTM_NY
+        zl = keys // UTM_NX // UTM_NY
+        return xi * self.span, yi * self.span, zl // 32, \
+            ZONE_LETTERS[zl % 32]
+
+    def names(self, keys):
+        if not len(keys):
+            return np.array([], dtype=object)
+        x, y, zones, letters = self.split(keys)
+
+        def _str(values):
+            return pd.Series(values).astype(str)
+
+        names = _str(x) + ' ' + _str(y) + ' ' + _str(zones) + ' ' + \
+            _str(letters)
+        return names.values.astype(object)
+
+    def centers(self, keys):
+        if not len(keys):
+            return np.array([]), np.array([])
+        x, y, zones, letters = self.split(keys)
+        lats, lons = to_latlon_array(x + self.span / 2, y + self.span / 2,
+                                     zones, letters)
+        return lats.round(PRECISION), lons.round(PRECISION)
+
+    def is_parent(self, grid):
+        return isinstance(grid, UtmGrid) and grid.zone == self.zone and \
+            grid.span % self.span == 0
+
+    def parent(self, keys, grid):
+        if not self.is_parent(grid):
+            raise ValueError('Cannot roll up %s into %s' % (self, grid))
+        keys = np.asarray(keys, dtype=np.int64)
+        factor = grid.span // self.span
+        xi = keys % UTM_NX // factor
+        yi = keys // UTM_NX % UTM_NY // factor
+        zl = keys // UTM_NX // UTM_NY
+        # Boxes with a zero easting or northing are invalid, see assign()
+        valid = (keys >= 0) & (xi != 0) & (yi != 0)
+        return np.where(valid, (zl * UTM_NY + yi) * UTM_NX + xi, -1)
+
+
+class GeohashGrid(Grid):
+    """
+
+    Geohash cells of a given precision (number of characters). Keys are
+    the geohash bits (5 per character), so the parent of a cell is its
+    key shifted right 5 bits per character dropped.
+
+    Approximate cell sizes at the equator: 4 is 39 x 20 km, 5 is 4.9 x
+    4.9 km, 6 is 1.2 x 0.6 km.
+
+    """
+
+    def __init__(self, precision):
+        precision = int(precision)
+        if not 1 <= precision <= MAX_GEOHASH_PRECISION:
+            raise ValueError('Invalid geohash precision %i' % precision)
+        self.precision = precision
+        self.name = 'geohash_%i' % precision
+        self.bits = 5 * precision
+        self.lon_bits = (self.bits + 1) // 2
+        self.lat_bits = self.bits // 2
+
+    def assign(self, lats, lons):
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        with np.errstate(invalid='ignore'):
+            valid = (lats >= -90) & (lats <= 90) & \
+                (lons >= -180) & (lons <= 180)
+        lons = np.where(valid, lons, 0)
+        lats = np.where(valid, lats, 0)
+
+        lon_i = _quantize(lons, -180, 360, self.lon_bits)
+        lat_i = _quantize(lats, -90, 180, self.lat_bits)
+        keys = _interleave(lon_i, lat_i, self.lon_bits, self.lat_bits)
+        return np.where(valid, keys, -1)
+
+    def names(self, keys):
+        keys = np.asarray(keys, dtype=np.int64)
+        names = np.full(len(keys), '', dtype='<U%i' % self.precision)
+        for i in range(self.precision):
+            shift = 5 * (self.precision - 1 - i)
+            names = np.char.add(names, GEOHASH_ALPHABET[(keys >> shift) & 31])
+        return names.astype(object)
+
+    def centers(self, keys):
+        keys = np.asarray(keys, dtype=np.int64)
+        lon_i, lat_i = _deinterleave(keys, self.lon_bits, self.lat_bits)
+        lons = -180 + (lon_i + 0.5) * 360 / 2 ** self.lon_bits
+        lats = -90 + (lat_i + 0.5) * 180 / 2 ** self.lat_bits
+        return lats.round(PRECISION), lons.round(PRECISION)
+
+    def is_parent(self, grid):
+        return isinstance(grid, GeohashGrid) and \
+            grid.precision <= self.precision
+
+    def parent(self, keys, grid):
+        if not self.is_parent(grid):
+            raise ValueError('Cannot roll up %s into %s' % (self, grid))
+        keys = np.asarray(keys, dtype=np.int64)
+        shift = 5 * (self.precision - grid.precision)
+        return np.where(keys >= 0, keys >> shift, -1)
+
+
+def _quantize(values, start, extent, bits):
+    n = 2 ** bits
+    i = np.floor((values - start) / extent * n).astype(np.int64)
+    return np.clip(i, 0, n - 1)
+
+
+def _interleave(lon_i, lat_i, lon_bits, lat_bits):
+    # Geohash bits, most significant first, alternate lon and lat
+    keys = np.zeros(len(lon_i), dtype=np.int64)
+    lon_left, lat_left = lon_bits, lat_bits
+    for bit in range(lon_bits + lat_bits):
+        if bit % 2 == 0:
+            lon_left -= 1
+            keys = (keys << 1) | ((lon_i >> lon_left) & 1)
+        else:
+            lat_left -= 1
+            keys = (keys << 1) | ((lat_i >> lat_left) & 1)
+    return keys
+
+
+def _deinterleave(keys, lon_bits, lat_bits):
+    lon_i = np.zeros(len(keys), dtype=np.int64)
+    lat_i = np.zeros(len(keys), dtype=np.int64)
+    nbits = lon_bits + lat_bits
+    for bit in range(nbits):
+        value = (keys >> (nbits - 1 - bit)) & 1
+        if bit % 2 == 0:
+            lon_i = (lon_i << 1) | value
+        else:
+            lat_i = (lat_i << 1) | value
+    return lon_i, lat_i
+
+
+def aggregate_levels(df, producttypes, minresps=0, zone=None):
+    """
+
+    :synopsis: Aggregate reports at several resolutions in one pass
+    :param df: :py:obj:`DataFrame` with LAT, LON and INTENSITY columns
+    :param producttypes: :py:obj:`list` of product types (see
+        :py:obj:`get_grid`) of the same kind, e.g. ['geo_1km',
+        'geo_10km']
+    :param int minresps: Minimum number of responses per cell
+    :param int zone: (optional) UTM zone, see :py:obj:`UtmGrid`
+    :returns: :py:obj:`dict` of {producttype: :py:obj:`DataFrame`}, as
+        returned by :py:obj:`getintensity.aggregate.aggregate`
+
+    Reports are only assigned to the finest grid; the cells of the other
+    grids are rolled up from its cells.
+
+    """
+
+    grids = {producttype: get_grid(producttype, zone)
+             for producttype in producttypes}
+    finest = finest_grid(grids.values())
+
+    keys = finest.assign(df['LAT'].values, df['LON'].values)
+    valid = keys >= 0
+    cells = cell_sums(keys[valid], df['INTENSITY'].values[valid])
+
+    results = {}
+    for producttype, grid in grids.items():
+        if grid is finest:
+            sums = cells
+        else:
+            parents = finest.parent(cells.index.values, grid)
+            sums = cells[parents >= 0].groupby(parents[parents >= 0]).sum()
+        results[producttype] = cells_dataframe(grid, sums, minresps)
+    return results
+
+
+def finest_grid(grids):
+    """
+
+    :synopsis: Get the grid whose cells roll up into all the others
+    :param grids: :py:obj:`list` of :py:obj:`Grid`
+    :returns: :py:obj:`Grid`
+    :raises: ValueError if there is none
+
+    """
+
+    grids = list(grids)
+    for grid in grids:
+        if all([grid.is_parent(other) for other in grids]):
+            return grid
+    raise ValueError('Cannot aggregate %s from one grid' %
+                     ', '.join([grid.name for grid in grids]))
+
+
+def cell_counts(grid, keys, counts, parent):
+    """
+
+    :synopsis: Count the responses of the cells of a coarser grid
+    :param grid: :py:obj:`Grid` of keys
+    :param keys: Unique keys of cells of grid
+    :param counts: Number of responses in each cell
+    :param parent: Coarser :py:obj:`Grid` (or grid itself)
+    :returns: Number of responses in each cell of parent (not in order)
+
+    """
+
+    if parent is grid:
+        return counts
+    parents = grid.parent(keys, parent)
+    valid = parents >= 0
+    _, inverse = np.unique(parents[valid], return_inverse=True)
+    return np.bincount(inverse, weights=counts[valid]).astype(np.int64)
+
+
+def cell_sums(keys, intensities):
+    # Sum of intensities and number of responses (not NaN) in each cell,
+    # by key
+    intensities = np.asarray(intensities, dtype=float)
+    counted = ~np.isnan(intensities)
+    return pd.DataFrame({'SUM': np.where(counted, intensities, 0),
+                         'NRESP': counted.astype(np.int64)},
+                        index=keys).groupby(level=0).sum()
+
+
+def cells_dataframe(grid, sums, minresps=0):
+    """
+
+    :synopsis: Get the aggregated cells from their sums
+    :param grid: :py:obj:`Grid`
+    :param sums: :py:obj:`DataFrame` with SUM (of intensities) and NRESP,
+        indexed by key; other columns are kept
+    :param int minresps: Minimum number of responses per cell
+    :returns: :py:obj:`DataFrame` with INTENSITY, NRESP, LAT and LON,
+        indexed by the cell names (LOCATION), sorted by name
+
+    """
+
+    sums = sums[sums['NRESP'] >= minresps]
+    keys = sums.index.values
+    lats, lons = grid.centers(keys)
+    with np.errstate(invalid='ignore'):
+        intensities = sums['SUM'].values / sums['NRESP'].values
+    cells = pd.DataFrame({
+        'INTENSITY': intensities,
+        'NRESP': sums['NRESP'].values.astype(np.int64),
+        'LAT': lats,
+        'LON': lons,
+    }, index=pd.Index(grid.names(keys), name='LOCATION'))
+    for column in sums.columns:
+        if column not in ('SUM', 'NRESP'):
+            cells[column] = sums[column].values
+    return cells.sort_index()
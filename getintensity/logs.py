@@ -0,0 +1,106 @@
+import collections
+import json
+import logging
+import sys
+
+LOGGER_NAME = 'getintensity'
+
+# Attributes of every LogRecord, anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message'}
+
+
+def setup_logging(level='INFO', json_format=False, stream=None):
+    """
+
+    :synopsis: Configure logging for the getintensity modules
+    :param level: Logging level name or number
+    :param bool json_format: Log one JSON object per line (batch mode)
+    :param stream: Output stream, default stdout
+    :returns: The getintensity :py:obj:`logging.Logger`
+
+    Plain text output is just the message for INFO, and 'LEVEL: message'
+    for other levels, matching the previous print() output.
+
+    """
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if json_format:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter())
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    return logger
+
+
+class TextFormatter(logging.Formatter):
+
+    def format(self, record):
+        message = super().format(record)
+        if record.levelno == logging.INFO:
+            return message
+        return '%s: %s' % (record.levelname, message)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+
+    Format each record as a JSON object with time, level, logger and
+    message, plus any fields passed with extra=, e.g.::
+
+      logger.info('Fetched data', extra={'network': 'ga', 'bytes': 1024})
+
+    """
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(data, default=str)
+
+
+class WarningCounter:
+    """
+
+    Count per-row problems so they can be logged once per stage instead
+    of once per row, e.g.::
+
+      warnings = WarningCounter(logger, 'aggregate')
+      warnings.count('cannot get UTM', nbad)
+      warnings.report()
+
+    """
+
+    def __init__(self, logger, stage):
+        self.logger = logger
+        self.stage = stage
+        self.counts = collections.Counter()
+
+    def count(self, reason, n=1):
+        if n:
+            self.counts[reason] += int(n)
+
+    def report(self, level=logging.WARNING):
+        for reason, n in sorted(self.counts.items()):
+            self.logger.log(level, '%s: %i entries with %s.',
+                            self.stage, n, reason,
+                            extra={'stage': self.stage, 'reason': reason,
+                                   'count': n})
+        counts = dict(self.counts)
+        self.counts.clear()
+        return counts
@@ -0,0 +1,241 @@
+import contextlib
+import json
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+PROMETHEUS_PREFIX = 'getintensity'
+
+
+class Stage:
+    """
+
+    Measurements for one stage of a run. The code being measured sets
+    :py:attr:`rows_in`, :py:attr:`rows_out` and adds to :py:attr:`bytes`;
+    the wall time and memory are filled in by :py:meth:`RunMetrics.stage`.
+
+    """
+
+    def __init__(self, name, network=None, rows_in=None):
+        self.name = name
+        self.network = network
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.bytes = 0
+        self.wall_time = None
+        self.peak_memory = None
+        self.max_rss = None
+        self.extra = {}
+
+        self._child_peak = 0
+
+    def todict(self):
+        data = {
+            'stage': self.name,
+            'network': self.network,
+            'wall_time': self.wall_time,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'bytes': self.bytes,
+            'peak_memory': self.peak_memory,
+            'max_rss': self.max_rss,
+        }
+        data.update(self.extra)
+        return data
+
+
+class RunMetrics:
+    """
+
+    Collect per-stage timing and metrics for a run, e.g.::
+
+      metrics = RunMetrics(eventid='us70004jxe')
+      with metrics.stage('fetch', network='ga') as stage:
+          data = fh.read()
+          stage.bytes += len(data)
+
+    Stages can be nested (e.g. aggregate inside parse). Each stage records
+    wall time, bytes transferred, rows in/out and memory:
+
+    ===========  ==========================================================
+    peak_memory  Peak traced python memory (bytes) during the stage,
+                 including its nested stages, only if trace_memory is set
+                 (this slows down the run)
+    max_rss      Maximum resident set size of the process (bytes) at the
+                 end of the stage
+    ===========  ==========================================================
+
+    tracemalloc has a single peak for the whole process, so the peaks of
+    stages running at the same time in other threads (e.g. the networks of
+    :py:obj:`getintensity.fusion.fuse`) are mixed up and are not valid.
+
+    If a :py:obj:`getintensity.profiling.Profiler` is given, each stage
+    is also profiled. Without one, stages are not profiled at all.
+
+    """
+
+    def __init__(self, eventid=None, trace_memory=False, profiler=None):
+        self.eventid = eventid
+        self.trace_memory = trace_memory
+        self.profiler = profiler
+        self.stages = []
+        self.start_time = time.time()
+
+        self._stack = []
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name, network=None, rows_in=None):
+        if network is None and self._stack:
+            network = self._stack[-1].network
+
+        stage = Stage(name, network=network, rows_in=rows_in)
+        self.stages.append(stage)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            # Keep the peak the enclosing stage reached so far
+            if self._stack:
+                parent = self._stack[-1]
+                parent._child_peak = max(parent._child_peak,
+                                         tracemalloc.get_traced_memory()[1])
+            self._reset_peak()
+
+        self._stack.append(stage)
+        profiled = None
+        if self.profiler is not None:
+            profiled = self.profiler.stage(name)
+            profiled.__enter__()
+
+        t0 = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.wall_time = time.perf_counter() - t0
+            if profiled is not None:
+                profiled.__exit__(None, None, None)
+            self._stack.pop()
+
+            if tracing:
+                peak = max(tracemalloc.get_traced_memory()[1],
+                           stage._child_peak)
+                stage.peak_memory = peak
+                if self._stack:
+                    parent = self._stack[-1]
+                    parent._child_peak = max(parent._child_peak, peak)
+                self._reset_peak()
+            stage.max_rss = _max_rss()
+
+    def report(self):
+        """
+
+        :synopsis: Get the run report
+        :returns: :py:obj:`dict` with the run info and a list of stages
+
+        """
+
+        return {
+            'eventid': self.eventid,
+            'start_time': self.start_time,
+            'wall_time': time.time() - self.start_time,
+            'max_rss': _max_rss(),
+            'stages': [stage.todict() for stage in self.stages],
+        }
+
+    def to_json(self, filename=None):
+        """
+
+        :synopsis: Get the run report as JSON
+        :param str filename: If set, also save the report to this file
+        :returns: JSON string
+
+        """
+
+        text = json.dumps(self.report(), indent=2)
+        if filename:
+            with open(filename, 'w') as f:
+                f.write(text + '\n')
+        return text
+
+    def to_prometheus(self, filename=None):
+        """
+
+        :synopsis: Get the metrics in Prometheus text exposition format
+        :param str filename: If set, also save the metrics to this file
+        :returns: str
+
+        Stages with the same name and network (e.g. several fetches)
+        are summed. The output can be served by the node_exporter
+        textfile collector.
+
+        """
+
+        metrics = [
+            ('stage_seconds', 'wall_time', 'Wall time of each stage'),
+            ('stage_rows_in', 'rows_in', 'Rows into each stage'),
+            ('stage_rows_out', 'rows_out', 'Rows out of each stage'),
+            ('stage_bytes', 'bytes', 'Bytes transferred in each stage'),
+            ('stage_peak_memory_bytes', 'peak_memory',
+             'Peak traced memory of each stage'),
+        ]
+
+        totals = {}
+        for stage in self.stages:
+            labels = (stage.name, stage.network or '')
+            total = totals.setdefault(labels, {})
+            for _, attrib, _ in metrics:
+                value = getattr(stage, attrib)
+                if value is None:
+                    continue
+                if attrib == 'peak_memory':
+                    total[attrib] = max(total.get(attrib, 0), value)
+                else:
+                    total[attrib] = total.get(attrib, 0) + value
+
+        lines = []
+        for name, attrib, helptext in metrics:
+            name = '%s_%s' % (PROMETHEUS_PREFIX, name)
+            values = [(labels, total[attrib])
+                      for labels, total in totals.items()
+                      if attrib in total]
+            if not values:
+                continue
+            lines.append('# HELP %s %s' % (name, helptext))
+            lines.append('# TYPE %s gauge' % name)
+            for (stage, network), value in values:
+                lines.append('%s{eventid="%s",network="%s",stage="%s"} %s' %
+                             (name, _label(self.eventid), _label(network),
+                              _label(stage), repr(float(value))))
+
+        text = '\n'.join(lines) + '\n'
+        if filename:
+            with open(filename, 'w') as f:
+                f.write(text)
+        return text
+
+    @classmethod
+    def _reset_peak(cls):
+        # tracemalloc.reset_peak is new in python 3.9
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+
+def _max_rss():
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    if sys.platform != 'darwin':
+        maxrss *= 1024
+    return maxrss
+
+
+def _label(value):
+    value = str(value or '')
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,389 @@
+"""
+Local stand-in for the network servers, to test the network layer.
+
+:py:obj:`LocalServer` is a local HTTP server that can add faults to its
+responses: a delay (plus random jitter) before each response, a bandwidth
+limit, a random error rate, or errors on the first requests to each URL.
+It counts the requests and the most requests handled at the same time.
+
+:py:obj:`MockServer` implements the URL shapes of config.ini (the [neic]
+template, the [ga] and [emsc] search and fetcher templates) with synthetic
+data (see :py:obj:`getintensity.synthetic`) for any event ID, e.g.::
+
+  with MockServer(nreports=10000, delay=0.2, fail_first=1) as server:
+      config = server.configure(config, data_path='/tmp/mock')
+      iparser = IntensityParser(config=config, eventid='us1000abcd',
+                                network='emsc')
+      df, msg = iparser.get_dyfi_dataframe_from_network('20200101_0000001')
+
+Requests are made to http://127.0.0.1:PORT/HOST/PATH, where HOST is the
+original host.
+
+"""
+
+import configparser
+import hashlib
+import http.server
+import io
+import json
+import logging
+import re
+import threading
+import time
+import urllib.parse
+import zipfile
+
+import numpy as np
+
+from . import synthetic
+
+logger = logging.getLogger(__name__)
+
+# Templates in config.ini pointing to each network's servers
+TEMPLATES = [
+    ('neic', 'template'),
+    ('ga', 'search_template'),
+    ('ga', 'fetcher_template'),
+    ('emsc', 'search_template'),
+    ('emsc', 'fetcher_template'),
+]
+
+CHUNK_SIZE = 16384  # bytes written at a time with a bandwidth limit
+
+
+class LocalServer:
+    """
+
+    Local HTTP server with fault injection. Subclasses implement
+    :py:meth:`respond`.
+
+    :param float delay: Seconds before each response
+    :param float jitter: Maximum random seconds added to the delay
+    :param float bandwidth: Maximum bytes per second of each response
+    :param float error_rate: Fraction of requests failing at random
+    :param int fail_first: Number of requests to each URL that fail
+        before it succeeds
+    :param int error_status: HTTP status of failed requests
+    :param seed: Random seed for the jitter and errors
+    :param int port: Port, default any free port
+
+    """
+
+    def __init__(self, delay=0, jitter=0, bandwidth=None, error_rate=0,
+                 fail_first=0, error_status=503, seed=None, port=0):
+        self.delay = delay
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.fail_first = fail_first
+        self.error_status = error_status
+
+        # (host, path, status) of each request
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self._attempts = {}
+        self._rng = np.random.RandomState(seed)
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                try:
+                    server._handle(self)
+                except ConnectionError:
+                    # The client gave up (e.g. timed out)
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base(self):
+        return 'http://127.0.0.1:%i' % self.server.server_address[1]
+
+    def url(self, url):
+        # Rewrite a URL (or config.ini template) to point to this server
+        for scheme in ('https://', 'http://'):
+            if url.startswith(scheme):
+                return self.base + '/' + url[len(scheme):]
+        return url
+
+    def configure(self, config, data_path=None):
+        """
+
+        :synopsis: Copy a config pointing the network templates here
+        :param config: :py:obj:`configparser.ConfigParser`
+        :param str data_path: Data path of the copy (optional)
+        :returns: :py:obj:`configparser.ConfigParser`
+
+        """
+
+        local = configparser.ConfigParser()
+        local.read_dict(config)
+        for section, option in TEMPLATES:
+            if local.has_option(section, option):
+                local[section][option] = self.url(local[section][option])
+        if data_path:
+            if not local.has_section('directories'):
+                local.add_section('directories')
+            local['directories']['data_path'] = data_path
+        return local
+
+    def count(self, host=None, path=None):
+        # Number of requests to a host, and paths starting with path
+        return len([1 for h, p, status in self.requests
+                    if (host is None or h == host) and
+                    (path is None or p.startswith(path))])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name='getintensity-localserver',
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def respond(self, host, path, query):
+        """
+
+        :synopsis: Get the response for a request
+        :returns: (status, headers, body)
+
+        """
+
+        return 404, {'Content-Type': 'text/plain'}, b'Not found'
+
+    def _handle(self, handler):
+        url = urllib.parse.urlsplit(handler.path)
+        host, _, path = url.path.lstrip('/').partition('/')
+        path = '/' + path
+
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            key = (host, path, url.query)
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+            fail = attempt < self.fail_first or \
+                (self.error_rate and self._rng.uniform() < self.error_rate)
+            wait = self.delay + self._rng.uniform(0, self.jitter)
+
+        try:
+            if wait:
+                time.sleep(wait)
+            if fail:
+                status, headers, body = self.error_status, \
+                    {'Content-Type': 'text/plain'}, b'Injected error'
+            else:
+                status, headers, body = self.respond(host, path, url.query)
+            with self._lock:
+                self.requests.append((host, path, status))
+
+            handler.send_response(status)
+            for key, value in headers.items():
+                handler.send_header(key, value)
+            handler.send_header('Content-Length', str(len(body)))
+            handler.end_headers()
+            self._write(handler.wfile, body)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def _write(self, wfile, body):
+        if not self.bandwidth:
+            wfile.write(body)
+            return
+        for start in range(0, len(body), CHUNK_SIZE):
+            chunk = body[start:start + CHUNK_SIZE]
+            wfile.write(chunk)
+            wfile.flush()
+            time.sleep(len(chunk) / self.bandwidth)
+
+
+class MockServer(LocalServer):
+    """
+
+    Local stand-in for the Comcat, GA and EMSC servers, serving synthetic
+    data for any event ID:
+
+    ===================  =================================================
+    Comcat event         Detail geojson with a DYFI product
+    Comcat DYFI files    dyfi_geo_1km.geojson and dyfi_geo_10km.geojson
+    GA event search      One event, with an ID from the search parameters
+    GA felt reports      felt_reports_(1km|10km)_filtered.geojson
+    EMSC ID service      One EMSC ID for the source ID
+    EMSC testimonies     Zipped testimony CSV
+    ===================  =================================================
+
+    :param int nreports: Number of felt reports of each event, to set the
+        payload sizes
+    :param str scenario: Epicenter, see
+        :py:obj:`getintensity.synthetic.SCENARIOS`
+
+    Other parameters are passed to :py:obj:`LocalServer`. The data of each
+    event is always the same (it is seeded with the event ID) and is
+    generated once.
+
+    """
+
+    def __init__(self, nreports=1000, scenario='greece', **kwargs):
+        super().__init__(**kwargs)
+        self.nreports = nreports
+        self.scenario = scenario
+        self.lat, self.lon = synthetic.SCENARIOS[scenario]
+        self._payloads = {}
+        self._payload_lock = threading.RLock()
+
+        self.routes = [
+            ('earthquake.usgs.gov', r'/fdsnws/event/1/query$',
+             self._comcat_event),
+            ('earthquake.usgs.gov',
+             r'/product/dyfi/(?P<eid>[^/]+)/'
+             r'(?P<file>dyfi_geo_\d+km\.geojson)$',
+             self._comcat_file),
+            ('skip.gagempa.net', r'/api/events/?$', self._ga_search),
+            ('cdn.gagempa.net',
+             r'/skip/events/(?P<eid>[^/]+)/'
+             r'(?P<file>felt_reports_\d+km_filtered\.geojson)$',
+             self._ga_file),
+            ('www.seismicportal.eu', r'/eventid/api/convert$',
+             self._emsc_search),
+            ('www.seismicportal.eu', r'/testimonies-ws/api/search$',
+             self._emsc_file),
+        ]
+
+    def respond(self, host, path, query):
+        path = urllib.parse.unquote(path)
+        params = dict(urllib.parse.parse_qsl(query))
+        for route_host, pattern, method in self.routes:
+            match = re.match(pattern, path)
+            if host == route_host and match:
+                body = method(params=params, query=query,
+                              **match.groupdict())
+                if body is None:
+                    break
+                return 200, {'Content-Type': 'application/json'}, body
+
+        return 404, {'Content-Type': 'text/plain'}, b'Not found'
+
+    def payload(self, eventid, filename, make):
+        # Generate the data of each file once
+        key = (eventid, filename)
+        with self._payload_lock:
+            if key not in self._payloads:
+                self._payloads[key] = make()
+            return self._payloads[key]
+
+    def reports(self, eventid):
+        return self.payload(eventid, 'reports', lambda: (
+            synthetic.generate_reports(self.nreports, self.scenario,
+                                       seed=_seed(eventid))))
+
+    def _comcat_event(self, params, query):
+        eventid = params.get('eventid')
+        if not eventid:
+            return None
+
+        product = self.base + '/earthquake.usgs.gov/product/dyfi/' + eventid
+        contents = {filename: {'contentType': 'application/json',
+                               'url': '%s/%s' % (product, filename)}
+                    for filename in ('dyfi_geo_1km.geojson',
+                                     'dyfi_geo_10km.geojson')}
+        detail = {
+            'type': 'Feature',
+            'id': eventid,
+            'properties': {
+                'mag': 5.5,
+                'time': 1577836800000,
+                'updated': 1577836800000,
+                'url': 'https://earthquake.usgs.gov/earthquakes/'
+                       'eventpage/' + eventid,
+                'ids': ',%s,' % eventid,
+                'net': eventid[0:2],
+                'code': eventid[2:],
+                'products': {
+                    'dyfi': [{
+                        'id': 'urn:usgs-product:us:dyfi:%s:1' % eventid,
+                        'type': 'dyfi',
+                        'code': eventid,
+                        'source': 'us',
+                        'status': 'UPDATE',
+                        'updateTime': 1577836800000,
+                        'preferredWeight': 1,
+                        'properties': {'eventsource': eventid[0:2]},
+                        'contents': contents,
+                    }],
+                },
+            },
+            'geometry': {'type': 'Point',
+                         'coordinates': [self.lon, self.lat, 10.0]},
+        }
+        return json.dumps(detail).encode('utf-8')
+
+    def _comcat_file(self, eid, file, **kwargs):
+        span = _span(file)
+        return self.payload(eid, file, lambda: synthetic.dyfi_geojson(
+            self.reports(eid), span=span))
+
+    def _ga_search(self, query, **kwargs):
+        # The event is found from the search window, whatever it is
+        start = re.search(r'event_time>([^&]+)', query)
+        if not start:
+            return None
+        start = urllib.parse.unquote(start.group(1))
+        extid = 'ga%s' % hashlib.md5(query.encode('utf-8')).hexdigest()[0:8]
+        events = {'results': [{'event_id': extid, 'event_time': start}]}
+        return json.dumps(events).encode('utf-8')
+
+    def _ga_file(self, eid, file, **kwargs):
+        span = _span(file)
+        return self.payload(eid, file, lambda: synthetic.ga_geojson(
+            self.reports(eid), span=span))
+
+    def _emsc_search(self, params, **kwargs):
+        source_id = params.get('source_id')
+        if not source_id:
+            return None
+        extid = '20200101_%07i' % (_seed(source_id) % 10000000)
+        return json.dumps([{'id': extid, 'source_id': source_id}]).encode(
+            'utf-8')
+
+    def _emsc_file(self, params, **kwargs):
+        extid = params.get('unids', '').strip('[]')
+        if not extid:
+            return None
+
+        def _make():
+            output = io.BytesIO()
+            with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as z:
+                z.writestr('%s.txt' % extid, synthetic.emsc_csv(
+                    self.reports(extid), extid))
+            return output.getvalue()
+
+        return self.payload(extid, 'zip', _make)
+
+
+def _seed(eventid):
+    return int(hashlib.md5(eventid.encode('utf-8')).hexdigest()[0:8], 16)
+
+
+def _span(filename):
+    # UTM box size in meters from a filename with 1km or 10km
+    return int(re.search(r'(\d+)km', filename).group(1)) * 1000
@@ -0,0 +1,414 @@
+import contextlib
+import gzip
+import json
+import math
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from .stations import station_column
+
+# Attributes written for each station, in the order ShakeMap's
+# impactutils.io.table.dataframe_to_xml writes them:
+# (column, attribute, format)
+STATION_ATTRIBUTES = [
+    ('NAME', 'name', None),
+    ('NETID', 'netid', None),
+    ('DISTANCE', 'dist', '%.1f'),
+    ('INTENSITY', 'intensity', '%.1f'),
+    ('INTENSITY_STDDEV', 'intensity_stddev', '%.2f'),
+    ('NRESP', 'nresp', '%i'),
+    ('SOURCE', 'source', None),
+    ('LOC', 'loc', None),
+    ('INSTRUMENT', 'insttype', None),
+    ('ELEV', 'elev', '%.1f'),
+]
+
+REQUIRED_COLUMNS = ['STATION', 'LAT', 'LON', 'NETID']
+
+# Columns with the same value for all stations of a network, which can be
+# kept in df.attrs instead (see materialize_attrs): (column, attribute).
+# STATION can also be made from the index, see getintensity.stations
+ATTRIBUTE_COLUMNS = [
+    ('NETID', 'netid'),
+    ('SOURCE', 'source'),
+]
+CHUNKSIZE = 10000  # Number of station lines to buffer between writes
+
+# Output formats and the extension replacing '.xml' in the output filename
+FORMAT_EXTENSIONS = {
+    'xml': '.xml',
+    'csv': '.csv.gz',
+    'geojson': '.geojson',
+    'parquet': '.parquet',
+}
+
+
+def write_outputs(df, outfile, reference=None, formats=('xml',)):
+    """
+
+    :synopsis: Write a station dataframe in one or more output formats
+    :param df: Postprocessed :py:obj:`DataFrame` (uppercase columns)
+    :param str outfile: Path of the XML output file, e.g. dyfi_dat.xml
+    :param str reference: Reference attribute of the stationlist
+    :param formats: List of formats, see :py:obj:`FORMAT_EXTENSIONS`
+    :returns: :py:obj:`list` of files written
+
+    Each format is written next to :py:obj:`outfile`, replacing the
+    '.xml' extension, e.g. dyfi_dat.csv.gz or dyfi_dat.geojson.
+
+    """
+
+    writers = {
+        'xml': write_station_xml,
+        'csv': write_csv,
+        'geojson': write_geojson,
+        'parquet': write_parquet,
+    }
+
+    formats = parse_formats(formats)
+    base = outfile[:-4] if outfile.endswith('.xml') else outfile
+
+    outfiles = []
+    for fmt in formats:
+        filename = base + FORMAT_EXTENSIONS[fmt]
+        writers[fmt](df, filename, reference)
+        outfiles.append(filename)
+
+    return outfiles
+
+
+def constant_column(value, length):
+    """
+
+    :synopsis: Make a column with the same value in every row
+    :param value: Value, e.g. a network ID
+    :param int length: Number of rows
+    :returns: :py:obj:`pandas.Categorical`, storing the value once
+
+    """
+
+    return pd.Categorical.from_codes(np.zeros(length, dtype=np.int8),
+                                     categories=[value])
+
+
+def materialize_attrs(df):
+    """
+
+    :synopsis: Add the columns kept in df.attrs, for writing
+    :param df: Postprocessed :py:obj:`DataFrame`
+    :returns: :py:obj:`DataFrame`, a shallow copy if columns were added
+
+    Columns of :py:obj:`ATTRIBUTE_COLUMNS` missing from df are made from
+    df.attrs (e.g. df.attrs['netid']) if it has them, and STATION from
+    the index with :py:obj:`getintensity.stations.station_column`.
+
+    """
+
+    missing = [(column, attribute) for column, attribute in
+               ATTRIBUTE_COLUMNS if column not in df.columns and
+               df.attrs.get(attribute) is not None]
+    stations = None
+    if 'STATION' not in df.columns:
+        stations = station_column(df)
+    if not missing and stations is None:
+        return df
+
+    df = df.copy(deep=False)
+    if stations is not None:
+        df['STATION'] = stations
+    for column, attribute in missing:
+        df[column] = constant_column(df.attrs[attribute], len(df))
+    return df
+
+
+def _prepare(df, reference):
+    # Columns and reference from df.attrs, unless given
+    if reference is None:
+        reference = df.attrs.get('reference')
+    return materialize_attrs(df), reference
+
+
+def parse_formats(formats):
+    """
+
+    :synopsis: Check a list of output formats
+    :param formats: Comma-separated string or list of format names
+    :returns: :py:obj:`list` of lowercase format names
+
+    """
+
+    if isinstance(formats, str):
+        formats = formats.split(',')
+    formats = [fmt.strip().lower() for fmt in formats if fmt.strip()]
+
+    for fmt in formats:
+        if fmt not in FORMAT_EXTENSIONS:
+            raise ValueError('Unknown output format %s, must be one of: %s' %
+                             (fmt, ', '.join(FORMAT_EXTENSIONS)))
+    if not formats:
+        raise ValueError('No output format specified')
+
+    return formats
+
+
+def write_station_xml(df, outfile, reference=None):
+    """
+
+    :synopsis: Write a station dataframe as ShakeMap station XML
+    :param df: Postprocessed :py:obj:`DataFrame` (uppercase columns)
+    :param str outfile: Path of the output XML file
+    :param str reference: Reference attribute of the stationlist
+        (default df.attrs['reference'])
+    :returns: Number of stations written
+
+    This produces the same output as
+    :py:obj:`impactutils.io.table.dataframe_to_xml` for intensity data,
+    but writes each station element directly from the column arrays
+    instead of building the XML tree in memory.
+
+    The file is written to a temporary file in the same directory and
+    renamed to :py:obj:`outfile` when complete, so readers never see a
+    partially written file.
+
+    """
+
+    df, reference = _prepare(df, reference)
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise KeyError('Missing required columns: %s' % ', '.join(missing))
+
+    with _atomic_open(outfile) as f:
+        nstations = _write_stations(f, df, reference)
+
+    return nstations
+
+
+def write_csv(df, outfile, reference=None):
+    """
+
+    :synopsis: Write a station dataframe as gzipped CSV
+    :param df: Postprocessed :py:obj:`DataFrame` (uppercase columns)
+    :param str outfile: Path of the output file
+    :param str reference: Not used, for compatibility with the other writers
+    :returns: Number of stations written
+
+    """
+
+    df, reference = _prepare(df, reference)
+    with _atomic_open(outfile) as f:
+        # mtime=0 keeps the output reproducible
+        with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+            text = df.to_csv(index=False)
+            gz.write(text.encode('utf-8'))
+
+    return len(df)
+
+
+def write_geojson(df, outfile, reference=None):
+    """
+
+    :synopsis: Write a station dataframe as a GeoJSON FeatureCollection
+    :param df: Postprocessed :py:obj:`DataFrame` (uppercase columns)
+    :param str outfile: Path of the output file
+    :param str reference: Reference, stored as a FeatureCollection property
+        (default df.attrs['reference'])
+    :returns: Number of stations written
+
+    Each station is a Point feature with the station code as its id and
+    the remaining columns (lowercase) as properties.
+
+    """
+
+    df, reference = _prepare(df, reference)
+    props = [col for col in df.columns if col not in ('LAT', 'LON')]
+    names = [col.lower() for col in props]
+    lats = df['LAT'].tolist()
+    lons = df['LON'].tolist()
+    values = [_json_column(df[col]) for col in props]
+    stations = df['STATION'].tolist() if 'STATION' in df.columns else None
+
+    header = {'type': 'FeatureCollection'}
+    if reference is not None:
+        header['properties'] = {'reference': reference}
+    header = json.dumps(header)[:-1]
+
+    with _atomic_open(outfile) as f:
+        f.write((header + ', "features": [').encode('utf-8'))
+        lines = []
+        separator = ''  # before each chunk after the first
+        for i in range(len(df)):
+            feature = {
+                'type': 'Feature',
+                'geometry': {'type': 'Point',
+                             'coordinates': [lons[i], lats[i]]},
+                'properties': dict(zip(names, [col[i] for col in values]))
+            }
+            if stations:
+                feature['id'] = str(stations[i])
+            lines.append(json.dumps(feature))
+
+            if len(lines) >= CHUNKSIZE:
+                f.write((separator + ',\n'.join(lines)).encode('utf-8'))
+                separator = ',\n'
+                lines = []
+
+        if lines:
+            f.write((separator + ',\n'.join(lines)).encode('utf-8'))
+        f.write(b']}\n')
+
+    return len(df)
+
+
+def write_parquet(df, outfile, reference=None):
+    """
+
+    :synopsis: Write a station dataframe as Parquet
+    :param df: Postprocessed :py:obj:`DataFrame` (uppercase columns)
+    :param str outfile: Path of the output file
+    :param str reference: Reference, stored in the file metadata
+        (default df.attrs['reference'])
+    :returns: Number of stations written
+
+    This requires the optional pyarrow package.
+
+    """
+
+    df, reference = _prepare(df, reference)
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Parquet output requires the pyarrow package.')
+
+    table = pyarrow.Table.from_pandas(df, preserve_index=False)
+    if reference is not None:
+        metadata = dict(table.schema.metadata or {})
+        metadata[b'reference'] = reference.encode('utf-8')
+        table = table.replace_schema_metadata(metadata)
+
+    with _atomic_open(outfile) as f:
+        pyarrow.parquet.write_table(table, f)
+
+    return len(df)
+
+
+@contextlib.contextmanager
+def _atomic_open(outfile):
+    # Write to a temporary file in the same directory, then rename it
+    # into place so readers never see a partially written file
+    outdir = os.path.dirname(os.path.abspath(outfile))
+    fd, tmpfile = tempfile.mkstemp(prefix='.tmp.', dir=outdir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        os.chmod(tmpfile, 0o644)
+        os.replace(tmpfile, outfile)
+    except BaseException:
+        os.remove(tmpfile)
+        raise
+
+
+def _write_stations(f, df, reference):
+
+    stationlist = '  <stationlist created="%i"' % int(time.time())
+    if reference is not None:
+        stationlist += ' reference=%s' % _quote(reference)
+
+    f.write(b'<shakemap-data code_version="3.5" map_version="3">\n')
+    if not len(df):
+        f.write(_encode(stationlist + '/>\n'))
+        f.write(b'</shakemap-data>\n')
+        return 0
+    f.write(_encode(stationlist + '>\n'))
+
+    # Format each column once, then assemble the station lines
+    codes = _format_column(df['STATION'], None, strip=True)
+    netids = _format_column(df['NETID'], None, strip=True)
+    columns = [
+        (' lat=', _format_column(df['LAT'], '%.4f')),
+        (' lon=', _format_column(df['LON'], '%.4f')),
+    ]
+    for column, attribute, fmt in STATION_ATTRIBUTES:
+        if column in df.columns:
+            values = _format_column(df[column], fmt)
+            columns.append((' %s=' % attribute, values))
+
+    seen = set()
+    lines = []
+    nstations = 0
+    for i, (code, netid) in enumerate(zip(codes, netids)):
+        if not code.startswith(netid):
+            code = '%s.%s' % (netid, code)
+
+        # Same as dataframe_to_xml, only write the first of duplicates
+        if code in seen:
+            continue
+        seen.add(code)
+
+        line = ['    <station code=', _quote(code)]
+        for attribute, values in columns:
+            line.append(attribute)
+            line.append(_quote(values[i]))
+        line.append('/>\n')
+        lines.append(''.join(line))
+        nstations += 1
+
+        if len(lines) >= CHUNKSIZE:
+            f.write(_encode(''.join(lines)))
+            lines = []
+
+    lines.append('  </stationlist>\n</shakemap-data>\n')
+    f.write(_encode(''.join(lines)))
+    return nstations
+
+
+def _format_column(series, fmt, strip=False):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Format each category once; code -1 (missing) is the last
+        categories = list(series.cat.categories) + [np.nan]
+        formatted = _format_column(pd.Series(categories, dtype=object),
+                                   fmt, strip)
+        return [formatted[code] for code in series.cat.codes.tolist()]
+    values = series.tolist()
+    if fmt:
+        return [fmt % value for value in values]
+    if strip:
+        return [str(value).strip() for value in values]
+    return [str(value) for value in values]
+
+
+def _json_column(series):
+    # Convert to python types, with NaN as null
+    values = series.tolist()
+    if series.dtype.kind == 'f':
+        values = [None if math.isnan(value) else value for value in values]
+    elif series.dtype.kind not in 'iub':
+        values = [_json_value(value) for value in values]
+    return values
+
+
+def _json_value(value):
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def _quote(value):
+    # Attribute escaping as done by lxml
+    value = value.replace('&', '&amp;').replace('<', '&lt;')
+    value = value.replace('>', '&gt;').replace('"', '&quot;')
+    if '\n' in value or '\r' in value or '\t' in value:
+        value = value.replace('\n', '&#10;').replace('\r', '&#13;')
+        value = value.replace('\t', '&#9;')
+    return '"' + value + '"'
+
+
+def _encode(text):
+    # lxml writes ASCII with character references by default
+    return text.encode('ascii', 'xmlcharrefreplace')
@@ -0,0 +1,172 @@
+import collections
+import cProfile
+import os
+import sys
+import threading
+
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+STACKS_FILE = 'stacks.folded'
+
+
+class Profiler:
+    """
+
+    Profile the stages of a run. This is attached to a
+    :py:obj:`getintensity.metrics.RunMetrics`, so every stage recorded
+    there (fetch, parse, aggregate, postprocess, output) is profiled.
+
+    For each stage, this writes a cProfile file NN_stage.prof to
+    :py:attr:`outdir` (open with pstats or snakeviz). When a stage is
+    nested in another (e.g. aggregate inside parse), the outer stage's
+    profile excludes the time spent in the inner one.
+
+    A sampling thread also records the python stack of each running stage
+    every :py:attr:`interval` seconds. These are saved in 'collapsed'
+    format to stacks.folded, one line per stack prefixed by the stage
+    names, for flamegraph.pl or speedscope.
+
+    """
+
+    def __init__(self, outdir, interval=SAMPLE_INTERVAL):
+        self.outdir = outdir
+        self.interval = interval
+        self.profiles = []
+        self.samples = collections.Counter()
+
+        self._stacks = {}  # Thread ident to list of running stages
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._stop = threading.Event()
+
+    def stage(self, name):
+        return _ProfiledStage(self, name)
+
+    def start(self):
+        if self._sampler:
+            return
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample,
+                                         name='getintensity-profiler',
+                                         daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        if not self._sampler:
+            return
+        self._stop.set()
+        self._sampler.join()
+        self._sampler = None
+
+    def merge(self, other):
+        """
+
+        :synopsis: Add the profiles and stacks of another profiler
+        :param other: :py:obj:`Profiler`, e.g. of a network fetched in
+            another thread
+
+        """
+
+        other.stop()
+        with self._lock:
+            self.profiles.extend(other.profiles)
+            self.samples.update(other.samples)
+
+    def save(self):
+        """
+
+        :synopsis: Save the stage profiles and sampled stacks
+        :returns: :py:obj:`list` of files written
+
+        """
+
+        self.stop()
+        os.makedirs(self.outdir, exist_ok=True)
+
+        outfiles = []
+        for i, (name, profile) in enumerate(self.profiles):
+            outfile = os.path.join(self.outdir, '%02i_%s.prof' % (i, name))
+            profile.dump_stats(outfile)
+            outfiles.append(outfile)
+
+        outfile = os.path.join(self.outdir, STACKS_FILE)
+        with open(outfile, 'w') as f:
+            for stack, count in sorted(self.samples.items()):
+                f.write('%s %i\n' % (stack, count))
+        outfiles.append(outfile)
+
+        return outfiles
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                running = [(ident, list(stages))
+                           for ident, stages in self._stacks.items()
+                           if stages]
+
+            for ident, stages in running:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('%s:%s' % (
+                        os.path.basename(code.co_filename), code.co_name))
+                    frame = frame.f_back
+                names = ['stage:' + stage.name for stage in stages]
+                self.samples[';'.join(names + stack[::-1])] += 1
+
+    def _push(self, stage):
+        ident = threading.get_ident()
+        with self._lock:
+            stages = self._stacks.setdefault(ident, [])
+            parent = stages[-1] if stages else None
+            stages.append(stage)
+        return parent
+
+    def _pop(self):
+        ident = threading.get_ident()
+        with self._lock:
+            stages = self._stacks[ident]
+            stages.pop()
+            return stages[-1] if stages else None
+
+
+class _ProfiledStage:
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.profile = None
+
+    def __enter__(self):
+        self.profiler.start()
+        parent = self.profiler._push(self)
+        if parent:
+            parent._disable()
+
+        self.profile = cProfile.Profile()
+        try:
+            self.profile.enable()
+        except ValueError:
+            # Another profiler is active (e.g. a stage in another thread
+            # on python 3.12+), only the sampled stacks are recorded
+            self.profile = None
+        return self
+
+    def __exit__(self, *args):
+        if self.profile:
+            self._disable()
+            self.profiler.profiles.append((self.name, self.profile))
+
+        parent = self.profiler._pop()
+        if parent and parent.profile:
+            try:
+                parent.profile.enable()
+            except ValueError:
+                parent.profile = None
+
+    def _disable(self):
+        if self.profile:
+            self.profile.disable()
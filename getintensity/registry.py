@@ -0,0 +1,225 @@
+"""
+Registry of the networks (intensity data sources).
+
+Each network is a subclass of :py:obj:`Network`. The built-in networks
+are listed in :py:obj:`BUILTIN_NETWORKS`; other packages can add networks
+without changing getintensity with an entry point in the
+'getintensity.networks' group, e.g. in their setup.py::
+
+  entry_points={
+      'getintensity.networks': ['bgs = mypackage.bgs:BgsNetwork'],
+  }
+
+Network classes are only imported when they are first used.
+
+"""
+
+import importlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = 'getintensity.networks'
+
+# Network name to 'module:Class', in the order to try when guessing the
+# network of an input file
+BUILTIN_NETWORKS = {
+    'neic': 'getintensity.comcat:NeicNetwork',
+    'ga': 'getintensity.ga:GaNetwork',
+    'emsc': 'getintensity.emsc:EmscNetwork',
+}
+
+_classes = {}
+_semaphores = {}
+_lock = threading.Lock()
+
+
+class Network:
+    """
+
+    Base class for a network. Subclasses set the attributes written to the
+    output and the capabilities below, and implement the methods they
+    support. Methods are called with the
+    :py:obj:`getintensity.tools.IntensityParser` running them as
+    :py:attr:`parser` (for its config and metrics).
+
+    ====================  ================================================
+    supports_streaming    Data can be processed in chunks as it is read
+    supports_incremental  Data can be updated without a full fetch
+    preferred_resolution  Aggregation preferred when resolutions tie
+                          ('geo_1km' or 'geo_10km'), None if the network
+                          provides stations
+    external_ids          False if the network uses Comcat event IDs
+    max_concurrency       Maximum number of simultaneous fetches
+    file_patterns         Regexes of input filenames from this network
+    ====================  ================================================
+
+    """
+
+    name = None
+    netid = None
+    source = None
+    reference = None
+    default_outfile = None
+
+    supports_streaming = False
+    supports_incremental = False
+    preferred_resolution = None
+    external_ids = True
+    max_concurrency = 1
+    file_patterns = []
+
+    def __init__(self, parser):
+        self.parser = parser
+
+    def fetch(self, extid):
+        """
+
+        :synopsis: Get the data of an event from the network
+        :param str extid: Event ID in this network
+        :returns: (:py:obj:`DataFrame`, None) or (None, error message)
+
+        """
+
+        raise NotImplementedError
+
+    def get_file_parser(self, inputfile):
+        """
+
+        :synopsis: Get the function to parse an input file
+        :param str inputfile: Input filename
+        :returns: Function taking the file contents (bytes) and returning
+            a :py:obj:`DataFrame`, or None if the file is not supported
+
+        """
+
+        return None
+
+    def resolve_id(self, eventid):
+        """
+
+        :synopsis: Get the ID of a Comcat event in this network
+        :returns: External ID, or None if not found
+
+        """
+
+        if not self.external_ids:
+            return eventid
+        raise NotImplementedError
+
+    def postprocess(self, df):
+        # Network-specific changes before the common postprocess
+        pass
+
+
+def available_networks():
+    """
+
+    :synopsis: Get the names of all networks, without importing them
+    :returns: :py:obj:`list` of names, built-in networks first
+
+    """
+
+    names = list(BUILTIN_NETWORKS)
+    for entry_point in _entry_points():
+        if entry_point.name not in names:
+            names.append(entry_point.name)
+    # Registered with register()
+    names += [name for name in _classes if name not in names]
+    return names
+
+
+def get_network_class(name):
+    """
+
+    :synopsis: Get the class of a network, importing it if needed
+    :param str name: Network name
+    :returns: :py:obj:`Network` subclass, or None if unknown
+
+    Built-in networks take precedence over entry points of the same name.
+
+    """
+
+    if name in _classes:
+        return _classes[name]
+
+    if name in BUILTIN_NETWORKS:
+        cls = _load(BUILTIN_NETWORKS[name])
+    else:
+        cls = None
+        for entry_point in _entry_points():
+            if entry_point.name == name:
+                cls = entry_point.load()
+                break
+        if cls is None:
+            return None
+
+    cls.name = name
+    _classes[name] = cls
+    return cls
+
+
+def register(name, cls):
+    """
+
+    :synopsis: Add or replace a network (e.g. for tests or scripts)
+    :param str name: Network name
+    :param cls: :py:obj:`Network` subclass or 'module:Class'
+
+    """
+
+    if isinstance(cls, str):
+        BUILTIN_NETWORKS[name] = cls
+        _classes.pop(name, None)
+    else:
+        cls.name = name
+        _classes[name] = cls
+    _semaphores.pop(name, None)
+
+
+def limit(name, max_concurrency=None):
+    """
+
+    :synopsis: Get the semaphore limiting simultaneous fetches
+    :param str name: Network name
+    :param int max_concurrency: Limit, default the network's
+        :py:attr:`Network.max_concurrency`; only used the first time
+    :returns: :py:obj:`threading.BoundedSemaphore`, e.g.::
+
+      with registry.limit('emsc'):
+          df, msg = network.fetch(extid)
+
+    """
+
+    with _lock:
+        if name not in _semaphores:
+            if max_concurrency is None:
+                cls = get_network_class(name)
+                max_concurrency = cls.max_concurrency if cls else 1
+            _semaphores[name] = threading.BoundedSemaphore(
+                max(1, int(max_concurrency)))
+        return _semaphores[name]
+
+
+def _load(spec):
+    modulename, classname = spec.split(':')
+    module = importlib.import_module(modulename)
+    return getattr(module, classname)
+
+
+def _entry_points():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        # python < 3.8
+        try:
+            import pkg_resources
+        except ImportError:
+            return []
+        return list(pkg_resources.iter_entry_points(ENTRY_POINT_GROUP))
+
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        return list(eps.select(group=ENTRY_POINT_GROUP))
+    return list(eps.get(ENTRY_POINT_GROUP, []))
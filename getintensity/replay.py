@@ -0,0 +1,404 @@
+"""
+Replay recorded network responses to load test the whole pipeline offline.
+
+:py:obj:`ReplayServer` serves the responses recorded in the VCR cassettes
+(tests/data/vcr_*.yaml) from a local HTTP server, for any event ID: the
+recorded event ID in each URL is matched as a wildcard, and replaced in
+the response by the requested ID. Each event's data can also be varied
+(a random subset of stations or testimonies), so N synthetic events are
+not all the same.
+
+:py:obj:`run_replay` points a copy of config.ini at the server and runs
+the full pipeline (ID lookup, fetch, parse, aggregate, postprocess,
+output) for N events in each network in parallel, then reports the
+events per second and latency percentiles per network. For example::
+
+  python -m getintensity.replay --events 500 --workers 16
+
+This requires PyYAML (installed with vcrpy) to read the cassettes. The
+cassettes and config.ini are read from a source checkout of getintensity
+(they are not installed with the package); elsewhere, give their
+location with --datadir and --config.
+
+"""
+
+import argparse
+import concurrent.futures
+import configparser
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import urllib.parse
+import zipfile
+
+import numpy as np
+
+from .logs import setup_logging
+from .mockserver import LocalServer
+
+logger = logging.getLogger(__name__)
+
+# Test data and config.ini of a source checkout
+CHECKOUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DATADIR = os.path.join(CHECKOUT, 'tests', 'data')
+CONFIGFILE = os.path.join(CHECKOUT, 'config.ini')
+
+# Cassettes and the event ID recorded in each
+CASSETTES = [
+    ('vcr_comcat_geojson.yaml', 'ci14607652'),
+    ('vcr_ga.yaml', 'ga2019nsodfc'),
+    ('vcr_emsc_eventid.yaml', 'nc72282711'),
+    ('vcr_emsc_zip.yaml', '20140824_0000036'),
+]
+
+# Networks whose external IDs are looked up; others use the event ID
+RESOLVE_IDS = ['emsc']
+
+PERCENTILES = [50, 90, 99]
+
+
+class Route:
+    """
+
+    One recorded response. The recorded event ID in the URL path or in a
+    query parameter matches any ID.
+
+    """
+
+    def __init__(self, host, path, query, eventid, status, headers, body):
+        self.host = host
+        self.eventid = eventid
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.param = None
+
+        if eventid in path:
+            before, after = path.split(eventid, 1)
+            self.path = re.compile('%s(?P<eid>[^/]+)%s$' % (
+                re.escape(before), re.escape(after)))
+        else:
+            self.path = re.compile(re.escape(path) + '$')
+            for key, value in urllib.parse.parse_qsl(query):
+                if eventid in value:
+                    before, after = value.split(eventid, 1)
+                    self.param = (key, re.compile('%s(?P<eid>.+)%s$' % (
+                        re.escape(before), re.escape(after))))
+
+    def match(self, host, path, query):
+        # Return the event ID of a matching request, or None
+        if host != self.host:
+            return None
+        match = self.path.match(path)
+        if not match:
+            return None
+        if 'eid' in match.groupdict():
+            return match.group('eid')
+        if self.param is None:
+            return self.eventid
+
+        key, pattern = self.param
+        for value in urllib.parse.parse_qs(query).get(key, []):
+            match = pattern.match(value)
+            if match:
+                return match.group('eid')
+        return None
+
+
+def load_cassettes(cassettes=None, datadir=DATADIR):
+    """
+
+    :synopsis: Read the recorded responses from VCR cassettes
+    :param cassettes: :py:obj:`list` of (filename, recorded event ID),
+        default :py:obj:`CASSETTES`
+    :param str datadir: Directory of the cassettes, default the test
+        data of a source checkout
+    :returns: :py:obj:`list` of :py:obj:`Route`
+    :raises: FileNotFoundError if a cassette is missing
+
+    """
+
+    import yaml
+
+    routes = []
+    for filename, eventid in cassettes or CASSETTES:
+        path = os.path.join(datadir, filename)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(
+                'Cassette %s not found in %s. The replay harness runs from '
+                'a source checkout, or give the directory of the cassettes '
+                '(tests/data) with --datadir.' % (filename, datadir))
+        with open(path, 'r') as f:
+            tape = yaml.safe_load(f)
+        for interaction in tape['interactions']:
+            url = urllib.parse.urlsplit(interaction['request']['uri'])
+            response = interaction['response']
+            body = response['body']['string']
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            headers = {key: values[0]
+                       for key, values in response['headers'].items()
+                       if key.lower() == 'content-type'}
+            routes.append(Route(url.netloc, url.path, url.query, eventid,
+                                response['status']['code'], headers, body))
+    return routes
+
+
+class ReplayServer(LocalServer):
+    """
+
+    Local HTTP server replaying recorded responses, e.g.::
+
+      with ReplayServer(load_cassettes()) as server:
+          url = server.url('https://cdn.gagempa.net/skip/events/...')
+
+    Requests are made to http://127.0.0.1:PORT/HOST/PATH, where HOST is
+    the original host. Recorded URLs in text responses (e.g. Comcat
+    product links) are rewritten to point to the server too.
+
+    If vary is set, each event gets a different random subset (between
+    half and all) of the recorded stations or testimonies. Other
+    parameters (delays, errors) are passed to
+    :py:obj:`getintensity.mockserver.LocalServer`.
+
+    """
+
+    def __init__(self, routes, vary=True, port=0, **kwargs):
+        super().__init__(port=port, **kwargs)
+        self.routes = routes
+        self.vary = vary
+        # Recorded IDs (e.g. the EMSC ID in the EMSC ID service response)
+        # are replaced by the requested one
+        self.eventids = set([route.eventid for route in routes] +
+                            [eventid for _, eventid in CASSETTES])
+        self.hosts = set([route.host for route in routes])
+
+    def respond(self, host, path, query):
+        """
+
+        :synopsis: Get the response for a request
+        :returns: (status, headers, body)
+
+        """
+
+        path = urllib.parse.unquote(path)
+        for route in self.routes:
+            eventid = route.match(host, path, query)
+            if eventid is None:
+                continue
+            body = self._body(route, eventid)
+            return route.status, dict(route.headers), body
+
+        return 404, {'Content-Type': 'text/plain'}, b'Not recorded'
+
+    def _body(self, route, eventid):
+        body = route.body
+        if body[0:2] == b'PK':
+            if self.vary:
+                body = _vary_zip(body, eventid)
+            return body
+
+        try:
+            text = body.decode('utf-8')
+        except UnicodeDecodeError:
+            return body
+
+        for recorded in self.eventids:
+            text = text.replace(recorded, eventid)
+        for host in self.hosts:
+            text = text.replace('https://' + host, self.base + '/' + host)
+            text = text.replace('http://' + host, self.base + '/' + host)
+        if self.vary and text.startswith('{"features"'):
+            text = _vary_geojson(text, eventid)
+        return text.encode('utf-8')
+
+
+def run_replay(nevents=100, networks=('ga', 'emsc'), workers=8,
+               vary=True, cassettes=None, config=None, formats=('xml',),
+               datadir=DATADIR):
+    """
+
+    :synopsis: Run the pipeline for many events against a replay server
+    :param int nevents: Number of events per network
+    :param networks: Networks to run (neic also requires libcomcat)
+    :param int workers: Number of events processed at the same time
+    :param bool vary: Vary the data of each event
+    :param cassettes: See :py:obj:`load_cassettes`
+    :param config: :py:obj:`configparser.ConfigParser`, default the
+        config.ini of a source checkout
+    :param formats: Output formats
+    :param str datadir: Directory of the cassettes, see
+        :py:obj:`load_cassettes`
+    :returns: :py:obj:`dict` of results per network, see below
+
+    For each network, the results have:
+
+    ================  ================================================
+    events            Number of events run
+    errors            Number of events without data (or that failed)
+    stations          Total number of stations written
+    wall_time         Time to run all events (seconds)
+    events_per_sec    Throughput
+    p50, p90, p99     Latency percentiles of one event (seconds)
+    ================  ================================================
+
+    """
+
+    from .tools import IntensityParser
+    from .output import write_outputs
+
+    config = config or _read_config(CONFIGFILE)
+    results = {}
+    routes = load_cassettes(cassettes, datadir)
+    outdir = tempfile.mkdtemp(prefix='getintensity-replay.')
+
+    try:
+        with ReplayServer(routes, vary=vary) as server:
+            replay_config = server.configure(config, data_path=outdir)
+
+            def _run(network, eventid):
+                t0 = time.perf_counter()
+                try:
+                    nstations = _run_event(network, eventid)
+                except Exception as e:
+                    logger.warning('%s %s failed: %r', network, eventid, e)
+                    nstations = None
+                return time.perf_counter() - t0, nstations is not None, \
+                    nstations or 0
+
+            def _run_event(network, eventid):
+                # Number of stations written, or None if no data
+                iparser = IntensityParser(config=replay_config,
+                                          eventid=eventid, network=network)
+                if network in RESOLVE_IDS:
+                    extid = iparser.get_extid_from_network()
+                else:
+                    extid = eventid
+                if not extid:
+                    return None
+                df, msg = iparser.get_dyfi_dataframe_from_network(extid)
+                if df is None:
+                    return None
+                outfile = os.path.join(outdir, '%s_%s' % (
+                    eventid, iparser.default_outfile))
+                write_outputs(df, outfile, iparser.reference, formats)
+                return len(df)
+
+            for network in networks:
+                eventids = ['rp%06i' % i for i in range(nevents)]
+                t0 = time.perf_counter()
+                with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+                    runs = list(pool.map(
+                        lambda eventid: _run(network, eventid), eventids))
+                wall_time = time.perf_counter() - t0
+
+                latencies = np.array([run[0] for run in runs])
+                result = {
+                    'events': nevents,
+                    'errors': sum([1 for run in runs if not run[1]]),
+                    'stations': sum([run[2] for run in runs]),
+                    'wall_time': wall_time,
+                    'events_per_sec': nevents / wall_time,
+                }
+                for percentile in PERCENTILES:
+                    result['p%i' % percentile] = float(
+                        np.percentile(latencies, percentile))
+                results[network] = result
+                logger.info('%s: %i events in %.2fs (%.1f events/s), '
+                            'p50 %.3fs, p99 %.3fs.', network, nevents,
+                            wall_time, result['events_per_sec'],
+                            result['p50'], result['p99'])
+    finally:
+        shutil.rmtree(outdir, ignore_errors=True)
+
+    return results
+
+
+def _read_config(configfile):
+    if not os.path.isfile(configfile):
+        raise FileNotFoundError(
+            'Config file %s not found. The replay harness runs from a '
+            'source checkout, or give a config.ini with --config.' %
+            configfile)
+    config = configparser.ConfigParser()
+    with open(configfile, 'r') as f:
+        config.read_file(f)
+    return config
+
+
+def _rng(eventid):
+    seed = int(hashlib.md5(eventid.encode('utf-8')).hexdigest()[0:8], 16)
+    return np.random.RandomState(seed)
+
+
+def _vary_geojson(text, eventid):
+    # Keep a random subset of the features
+    data = json.loads(text)
+    features = data['features']
+    rng = _rng(eventid)
+    keep = rng.uniform(0.5, 1.0)
+    data['features'] = [feature for feature in features
+                        if rng.uniform() < keep]
+    return json.dumps(data)
+
+
+def _vary_zip(body, eventid):
+    # Keep a random subset of the testimonies (after the header lines)
+    with zipfile.ZipFile(io.BytesIO(body)) as z:
+        name = z.namelist()[0]
+        data = z.read(name)
+
+    lines = data.decode('utf-8').split('\n')
+    header = [line for line in lines if line.startswith('#')]
+    rows = [line for line in lines if line and not line.startswith('#')]
+    rng = _rng(eventid)
+    keep = rng.uniform(0.5, 1.0)
+    rows = [row for row in rows if rng.uniform() < keep]
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr(name, '\n'.join(header + rows) + '\n')
+    return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--events', type=int, default=100,
+                        help='Number of events per network (default 100)')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Events processed at the same time (default 8)')
+    parser.add_argument('--network', default='ga,emsc',
+                        help='Comma-separated networks (default ga,emsc)')
+    parser.add_argument('--no-vary', action='store_true',
+                        help='Serve the same data for every event')
+    parser.add_argument('--datadir', default=DATADIR,
+                        help='Directory of the cassettes (default '
+                        'tests/data of the source checkout)')
+    parser.add_argument('--config', default=CONFIGFILE,
+                        help='Config file (default config.ini of the '
+                        'source checkout)')
+    args = parser.parse_args()
+
+    # Only log the results of each network, not of each event
+    setup_logging('WARNING')
+    logger.setLevel(logging.INFO)
+    try:
+        config = _read_config(args.config)
+        results = run_replay(args.events, args.network.split(','),
+                             workers=args.workers, vary=not args.no_vary,
+                             config=config, datadir=args.datadir)
+    except FileNotFoundError as e:
+        logger.error(e)
+        sys.exit(1)
+    sys.stdout.write(json.dumps(results, indent=2) + "\n")
+
+
+if __name__ == '__main__':
+    main()
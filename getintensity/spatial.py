@@ -0,0 +1,200 @@
+import logging
+import numpy as np
+
+from .metrics import RunMetrics
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6371.0  # km
+CELL_SIZE = 0.1  # Default grid cell size in degrees
+
+
+def distance(lats, lons, lat, lon):
+    """
+
+    :synopsis: Great circle distance in km (haversine)
+    :param lats: Latitudes (array or scalar)
+    :param lons: Longitudes (array or scalar)
+    :param float lat: Latitude of the reference point
+    :param float lon: Longitude of the reference point
+    :returns: Distances in km
+
+    """
+
+    lats = np.radians(lats)
+    lat = np.radians(lat)
+    dlat = lats - lat
+    dlon = np.radians(np.subtract(lons, lon))
+    a = np.sin(dlat/2)**2 + np.cos(lats) * np.cos(lat) * np.sin(dlon/2)**2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+class StationIndex:
+    """
+
+    Grid index of station locations for radius and bounding box queries,
+    e.g.::
+
+      index = StationIndex(df)
+      near = df.iloc[index.query_radius(38.0, 23.0, 100)]
+
+    Stations are sorted by grid cell (:py:attr:`cellsize` degrees of
+    latitude and longitude), so a query only looks at the stations in the
+    cells it overlaps, then checks their exact distance or bounds. Queries
+    return positions (for :py:obj:`DataFrame.iloc`) in the original order.
+    Longitudes wrap around the dateline.
+
+    """
+
+    def __init__(self, df, cellsize=CELL_SIZE):
+        columns = {col.upper(): col for col in df.columns}
+        self.lats = df[columns['LAT']].values.astype(float)
+        lons = df[columns['LON']].values.astype(float)
+        # Only wrap longitudes that need it, to keep the others exact
+        outside = (lons < -180) | (lons >= 180)
+        self.lons = np.where(outside, (lons + 180) % 360 - 180, lons)
+
+        self.cellsize = cellsize
+        self.ncols = int(round(360 / cellsize))
+        self.lonsize = 360 / self.ncols
+
+        rows = self._row(self.lats)
+        cols = self._col(self.lons)
+        keys = rows * self.ncols + cols
+        self._order = np.argsort(keys, kind='stable')
+        cells, self._starts, self._counts = np.unique(
+            keys[self._order], return_index=True, return_counts=True)
+        self._rows = cells // self.ncols
+        self._cols = cells % self.ncols
+
+    def __len__(self):
+        return len(self.lats)
+
+    def query_radius(self, lat, lon, radius):
+        """
+
+        :synopsis: Find stations within a distance of a point
+        :param float lat: Latitude of the point
+        :param float lon: Longitude of the point
+        :param float radius: Distance in km
+        :returns: :py:obj:`numpy.ndarray` of station positions
+
+        """
+
+        dlat = np.degrees(radius / EARTH_RADIUS)
+        latmin = lat - dlat
+        latmax = lat + dlat
+        # Longitude extent of the circle, or all longitudes if it
+        # contains a pole
+        if latmin <= -90 or latmax >= 90 or \
+                radius / EARTH_RADIUS >= np.pi / 2:
+            dlon = 180
+        else:
+            dlon = np.degrees(np.arcsin(
+                np.sin(radius / EARTH_RADIUS) / np.cos(np.radians(lat))))
+
+        positions = self._candidates(latmin, latmax, lon - dlon, lon + dlon)
+        dists = distance(self.lats[positions], self.lons[positions],
+                         lat, lon)
+        return positions[dists <= radius]
+
+    def query_bbox(self, minlat, maxlat, minlon, maxlon):
+        """
+
+        :synopsis: Find stations in a bounding box
+        :param float minlat: Southern edge
+        :param float maxlat: Northern edge
+        :param float minlon: Western edge
+        :param float maxlon: Eastern edge; if less than minlon, the box
+            crosses the dateline
+        :returns: :py:obj:`numpy.ndarray` of station positions
+
+        """
+
+        width = (maxlon - minlon) % 360
+        if maxlon - minlon >= 360:
+            width = 360
+
+        positions = self._candidates(minlat, maxlat, minlon, minlon + width)
+        lats = self.lats[positions]
+        lons = self.lons[positions]
+        inside = (lats >= minlat) & (lats <= maxlat) & \
+            ((lons - minlon) % 360 <= width)
+        return positions[inside]
+
+    def _candidates(self, latmin, latmax, lonmin, lonmax):
+        # Positions of all stations in the cells overlapping this range,
+        # lonmin can be less than -180 and lonmax more than 180
+        cells = (self._rows >= self._row(latmin)) & \
+            (self._rows <= self._row(latmax))
+        if lonmax - lonmin < 360:
+            col0 = int(np.floor((lonmin + 180) / self.lonsize))
+            col1 = int(np.floor((lonmax + 180) / self.lonsize))
+            cells &= (self._cols - col0) % self.ncols <= col1 - col0
+
+        starts = self._starts[cells]
+        counts = self._counts[cells]
+        if not len(starts):
+            return np.zeros(0, dtype=int)
+
+        # Concatenate the ranges of sorted stations in each cell
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        sorted_positions = offsets + np.arange(counts.sum())
+        return np.sort(self._order[sorted_positions])
+
+    def _row(self, lats):
+        return np.floor((np.clip(lats, -90, 90) + 90) / self.cellsize) \
+            .astype('int64')
+
+    def _col(self, lons):
+        return np.floor((lons + 180) / self.lonsize).astype('int64') \
+            % self.ncols
+
+
+def filter_domain(df, center=None, radius=None, bounds=None,
+                  network=None, metrics=None):
+    """
+
+    :synopsis: Keep only the stations in the output domain
+    :param df: :py:obj:`DataFrame` of stations with LAT and LON columns
+    :param center: (lat, lon) of the center for a radius query
+    :param float radius: Maximum distance from center, in km
+    :param bounds: (minlat, maxlat, minlon, maxlon) bounding box
+    :param str network: Network, for the metrics
+    :param metrics: (optional) :py:obj:`RunMetrics` to record this stage
+    :returns: :py:obj:`DataFrame` of the stations in the domain
+
+    If both a radius and bounds are given, stations must be in both.
+    Far-field stations outside the ShakeMap domain are discarded by
+    ShakeMap anyway, so there is no need to write them.
+
+    """
+
+    if radius is None and bounds is None:
+        return df
+    if radius is not None and center is None:
+        raise ValueError('A radius query needs a center')
+
+    metrics = metrics or RunMetrics()
+    with metrics.stage('domain', network=network,
+                       rows_in=len(df)) as stage:
+        index = StationIndex(df)
+        keep = np.ones(len(df), dtype=bool)
+        if radius is not None:
+            inside = np.zeros(len(df), dtype=bool)
+            inside[index.query_radius(center[0], center[1], radius)] = True
+            keep &= inside
+        if bounds is not None:
+            inside = np.zeros(len(df), dtype=bool)
+            inside[index.query_bbox(*bounds)] = True
+            keep &= inside
+
+        nremoved = int((~keep).sum())
+        if nremoved:
+            df = df[keep]
+        stage.rows_out = len(df)
+
+    if nremoved:
+        logger.info('Removed %i stations outside the output domain.',
+                    nremoved)
+    return df
@@ -0,0 +1,69 @@
+"""
+Station IDs (codes) of aggregated locations.
+
+Stations of aggregated networks are named after their box, e.g.
+EMSC.UTM:(667000 7742000 50 K). Instead of a STATION column of strings
+built for each row, a table of boxes can keep the format of its station IDs
+in df.attrs (see :py:obj:`set_station_format`); the IDs are made from its
+index (the box names) when the table is written, see
+:py:obj:`station_column` and :py:obj:`getintensity.output.materialize_attrs`.
+
+Networks that read their boxes from a file (GA) keep an eager STATION
+column, made from all rows at once with :py:obj:`format_stations`.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+STATION_FORMAT = 'station_format'  # df.attrs key
+
+
+def set_station_format(df, fmt):
+    """
+
+    :synopsis: Derive the station IDs of a table from its index
+    :param df: :py:obj:`DataFrame` indexed by location names
+    :param str fmt: Format of the IDs, with one %s for the location name,
+        e.g. 'EMSC.UTM:(%s)'
+    :returns: df
+
+    """
+
+    if fmt.count('%s') != 1:
+        raise ValueError('Station format %s must have one %%s' % fmt)
+    df.attrs[STATION_FORMAT] = fmt
+    return df
+
+
+def station_column(df):
+    """
+
+    :synopsis: Get the station IDs of a table
+    :param df: :py:obj:`DataFrame`
+    :returns: STATION column, IDs made from the index with the station
+        format of df, or None if it has neither
+
+    """
+
+    if 'STATION' in df.columns:
+        return df['STATION']
+    fmt = df.attrs.get(STATION_FORMAT)
+    if fmt is None:
+        return None
+    return pd.Series(format_stations(df.index, fmt), index=df.index)
+
+
+def format_stations(locations, fmt):
+    """
+
+    :synopsis: Make the station IDs of locations
+    :param locations: Location names
+    :param str fmt: Format with one %s, e.g. 'UTM:(%s)'
+    :returns: :py:obj:`numpy.ndarray` of IDs
+
+    """
+
+    prefix, suffix = fmt.split('%s')
+    locations = pd.Index(locations).astype(str)
+    return np.asarray(prefix + locations + suffix, dtype=object)
@@ -0,0 +1,254 @@
+"""
+Models of the standard deviation of intensities (INTENSITY_STDDEV).
+
+==============  ==========================================================
+worden2012      From the number of responses (NRESP), Worden et al. 2012
+                BSSA 102-1, doi: 10.1785/0120110156
+bossu2016       From the intensity, Bossu et al. 2016 SRL 88 (1): 72-81,
+                doi: 10.1785/0220160120
+table:FILE      From the number of responses, interpolated in a CSV file
+                of nresp and stddev columns
+==============  ==========================================================
+
+The model of each network is set in the [stddev] section of config.ini,
+e.g.::
+
+  [stddev]
+  default = worden2012
+  emsc = bossu2016
+
+Models are evaluated on whole columns. Stddevs of the number of responses
+are looked up in a table of the values for 0 to :py:obj:`LOOKUP_SIZE` - 1
+responses, computed once per model. :py:obj:`compare_models` evaluates
+several models on the same stations.
+
+"""
+
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'worden2012'
+
+LOOKUP_SIZE = 4096  # number of responses in the lookup tables
+
+_models = {}
+_lock = threading.Lock()
+
+
+class StddevModel:
+    """
+
+    Base class of the models. Subclasses set the columns the model uses
+    and implement :py:meth:`compute`.
+
+    """
+
+    name = None
+    columns = []
+
+    def applies(self, df):
+        # True if df has the columns of this model
+        return all([column in df.columns for column in self.columns])
+
+    def compute(self, df):
+        """
+
+        :synopsis: Compute the stddev of each row
+        :param df: :py:obj:`DataFrame` with the columns of the model
+        :returns: :py:obj:`numpy.ndarray` of stddevs
+
+        """
+
+        raise NotImplementedError
+
+    def __call__(self, df):
+        return self.compute(df)
+
+
+class NrespModel(StddevModel):
+    """
+
+    Model of the stddev from the number of responses. Subclasses
+    implement :py:meth:`evaluate`, which is used for the lookup table and
+    numbers of responses outside it.
+
+    """
+
+    columns = ['NRESP']
+
+    def __init__(self):
+        self._table = None
+
+    def evaluate(self, nresps):
+        raise NotImplementedError
+
+    @property
+    def table(self):
+        # Stddevs of 0 to LOOKUP_SIZE - 1 responses
+        if self._table is None:
+            self._table = self.evaluate(np.arange(LOOKUP_SIZE, dtype=float))
+        return self._table
+
+    def compute(self, df):
+        nresps = np.asarray(df['NRESP'], dtype=float)
+        stddevs = np.empty(len(nresps))
+        counts = np.rint(np.nan_to_num(nresps, nan=-1.0))
+        lookup = (counts == nresps) & (counts >= 0) & (counts < LOOKUP_SIZE)
+        stddevs[lookup] = self.table[counts[lookup].astype(np.int64)]
+        if not lookup.all():
+            stddevs[~lookup] = self.evaluate(nresps[~lookup])
+        return stddevs
+
+
+class ExponentialModel(NrespModel):
+    """
+
+    Stddev decaying with the number of responses n:
+    scale * exp(-n / decay) + floor
+
+    :param float scale: Stddev with no responses, above the floor
+    :param float decay: Number of responses to reduce it by a factor e
+    :param float floor: Stddev with many responses
+    :param str name: Model name
+
+    """
+
+    def __init__(self, scale, decay, floor, name=None):
+        super().__init__()
+        self.scale = scale
+        self.decay = decay
+        self.floor = floor
+        self.name = name
+
+    def evaluate(self, nresps):
+        return np.exp(nresps * (-1 / self.decay)) * self.scale + self.floor
+
+
+class TableModel(NrespModel):
+    """
+
+    Stddev interpolated in a table of numbers of responses and stddevs
+    (constant beyond its first and last rows).
+
+    :param str filename: CSV file with nresp and stddev columns
+    :param str name: Model name
+
+    """
+
+    def __init__(self, filename, name=None):
+        super().__init__()
+        table = pd.read_csv(filename, skipinitialspace=True)
+        table.columns = table.columns.str.lower()
+        if 'nresp' not in table.columns or 'stddev' not in table.columns:
+            raise ValueError('%s does not have nresp and stddev columns' %
+                             filename)
+        table = table.sort_values('nresp')
+        self.nresps = table['nresp'].values.astype(float)
+        self.stddevs = table['stddev'].values.astype(float)
+        self.name = name or 'table:' + filename
+
+    def evaluate(self, nresps):
+        return np.interp(nresps, self.nresps, self.stddevs)
+
+
+class IntensityModel(StddevModel):
+    """
+
+    Stddev of intensities at or above a threshold, and below it.
+
+    :param float threshold: Intensity threshold
+    :param float above: Stddev at or above the threshold
+    :param float below: Stddev below the threshold
+    :param str name: Model name
+
+    """
+
+    columns = ['INTENSITY']
+
+    def __init__(self, threshold, above, below, name=None):
+        self.threshold = threshold
+        self.above = above
+        self.below = below
+        self.name = name
+
+    def compute(self, df):
+        intensities = np.asarray(df['INTENSITY'], dtype=float)
+        return np.where(intensities >= self.threshold, self.above,
+                        self.below)
+
+
+BUILTIN_MODELS = {
+    'worden2012': lambda: ExponentialModel(0.25, 24.02, 0.09,
+                                           name='worden2012'),
+    'bossu2016': lambda: IntensityModel(3.15, 0.36, 0.49, name='bossu2016'),
+}
+
+
+def get_model(name=DEFAULT_MODEL):
+    """
+
+    :synopsis: Get a stddev model by name
+    :param str name: Model name (see above), e.g. 'worden2012' or
+        'table:stddevs.csv'
+    :returns: :py:obj:`StddevModel`
+    :raises: ValueError for an unknown model
+
+    Models are created once and shared.
+
+    """
+
+    name = name.strip()
+    with _lock:
+        if name not in _models:
+            if name in BUILTIN_MODELS:
+                _models[name] = BUILTIN_MODELS[name]()
+            elif name.startswith('table:'):
+                _models[name] = TableModel(name[len('table:'):].strip(),
+                                           name=name)
+            else:
+                raise ValueError('Unknown stddev model %s (available: %s, '
+                                 'table:FILE)' %
+                                 (name, ', '.join(BUILTIN_MODELS)))
+        return _models[name]
+
+
+def compute_stddev(df, model=DEFAULT_MODEL):
+    """
+
+    :synopsis: Compute the intensity stddev of each row
+    :param df: :py:obj:`DataFrame` with the columns of the model
+    :param model: Model name, or :py:obj:`StddevModel`
+    :returns: :py:obj:`numpy.ndarray` of stddevs
+
+    """
+
+    if not isinstance(model, StddevModel):
+        model = get_model(model)
+    return model.compute(df)
+
+
+def compare_models(df, models):
+    """
+
+    :synopsis: Evaluate several models on the same rows
+    :param df: :py:obj:`DataFrame`
+    :param models: :py:obj:`list` of model names
+    :returns: :py:obj:`DataFrame` with the index of df and a column of
+        stddevs for each model that applies to df
+
+    """
+
+    stddevs = {}
+    for name in models:
+        model = get_model(name)
+        if not model.applies(df):
+            logger.warning('Model %s needs columns %s', name,
+                           ', '.join(model.columns))
+            continue
+        stddevs[name] = model.compute(df)
+    return pd.DataFrame(stddevs, index=df.index)
@@ -0,0 +1,227 @@
+"""
+Synthetic felt reports for benchmarks and stress tests.
+
+Reports are generated as a :py:obj:`DataFrame` with LAT, LON and INTENSITY
+columns, then written in the formats of each network:
+
+- :py:obj:`emsc_csv` for EMSC testimony files (e.g. 20190330_0000065.txt)
+- :py:obj:`dyfi_geojson` for DYFI geocoded files (dyfi_geo_10km.geojson)
+- :py:obj:`ga_geojson` for GA felt report files (felt_reports_1km.geojson)
+
+For example::
+
+  reports = generate_reports(100000, scenario='zone_boundary', seed=1)
+  with open('20200101_0000001.txt', 'wb') as f:
+      f.write(emsc_csv(reports, '20200101_0000001'))
+
+"""
+
+import json
+import numpy as np
+import pandas as pd
+
+from getintensity.aggregate import aggregate, getUtmPolyFromString
+from getintensity.spatial import EARTH_RADIUS, distance
+from getintensity.stddev import compute_stddev
+
+# Epicenters (lat, lon) chosen so reports cross UTM zone, zone letter
+# and hemisphere boundaries
+SCENARIOS = {
+    'greece': (38.0, 23.0),          # Single zone (34S)
+    'zone_boundary': (38.0, 24.0),   # Zones 34 and 35
+    'equator': (0.0, 100.0),         # Northern and southern hemispheres
+    'norway': (60.0, 5.0),           # Norway special case (zone 32V)
+    'svalbard': (78.0, 15.0),        # Svalbard special zones
+    'australia': (-20.5, 120.0),     # Zones 50 and 51 (K)
+    'dateline': (-17.0, 180.0),      # Zones 60 and 1
+}
+
+DISTRIBUTIONS = ['cluster', 'uniform', 'cities']
+INTENSITY_MODELS = ['attenuation', 'uniform']
+
+
+def generate_reports(nreports, scenario='greece', lat=None, lon=None,
+                     distribution='cluster', spread=50.0,
+                     intensity='attenuation', magnitude=5.5, seed=None):
+    """
+
+    :synopsis: Generate synthetic felt reports
+    :param int nreports: Number of reports
+    :param str scenario: Epicenter, one of :py:obj:`SCENARIOS`
+    :param float lat: Epicenter latitude (overrides scenario)
+    :param float lon: Epicenter longitude (overrides scenario)
+    :param str distribution: Spatial distribution (see below)
+    :param float spread: Spatial scale of the distribution, in km
+    :param str intensity: Intensity model, 'attenuation' or 'uniform'
+    :param float magnitude: Magnitude for the attenuation model
+    :param seed: Random seed
+    :returns: :py:obj:`DataFrame` with LAT, LON, INTENSITY and DISTANCE
+
+    Spatial distributions:
+
+    ========  ==========================================================
+    cluster   Exponential distance from the epicenter, mean `spread` km
+    uniform   Uniform in a square of +/- `spread` km around the epicenter
+    cities    Reports clustered around 20 random towns within `spread` km
+    ========  ==========================================================
+
+    The 'attenuation' intensity model decays with epicentral distance
+    (with scatter), 'uniform' draws intensities between 1 and 9.
+
+    """
+
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError('Unknown distribution ' + distribution)
+    if intensity not in INTENSITY_MODELS:
+        raise ValueError('Unknown intensity model ' + intensity)
+
+    if lat is None or lon is None:
+        lat, lon = SCENARIOS[scenario]
+
+    rng = np.random.RandomState(seed)
+
+    if distribution == 'cluster':
+        dist = rng.exponential(spread, nreports)
+        azimuth = rng.uniform(0, 2 * np.pi, nreports)
+        dx = dist * np.sin(azimuth)
+        dy = dist * np.cos(azimuth)
+
+    elif distribution == 'uniform':
+        dx = rng.uniform(-spread, spread, nreports)
+        dy = rng.uniform(-spread, spread, nreports)
+
+    elif distribution == 'cities':
+        ncities = 20
+        cx = rng.uniform(-spread, spread, ncities)
+        cy = rng.uniform(-spread, spread, ncities)
+        # Bigger towns get more reports
+        weights = rng.pareto(1.5, ncities) + 1
+        city = rng.choice(ncities, nreports, p=weights / weights.sum())
+        dx = cx[city] + rng.normal(0, spread / 50, nreports)
+        dy = cy[city] + rng.normal(0, spread / 50, nreports)
+
+    lats = lat + np.degrees(dy / EARTH_RADIUS)
+    coslat = np.maximum(np.cos(np.radians(lats)), 0.01)
+    lons = lon + np.degrees(dx / EARTH_RADIUS) / coslat
+    lats = np.clip(lats, -80, 84)
+    lons = (lons + 180) % 360 - 180
+
+    lats = lats.round(3)
+    lons = lons.round(3)
+    dists = distance(lats, lons, lat, lon)
+
+    if intensity == 'attenuation':
+        ii = 1.5 * magnitude - 3.0 * np.log10(np.sqrt(dists**2 + 100))
+        ii = ii + rng.normal(0, 0.8, nreports)
+    else:
+        ii = rng.uniform(1, 9, nreports)
+    ii = np.clip(ii, 1, 10).round(1)
+
+    return pd.DataFrame({
+        'LAT': lats,
+        'LON': lons,
+        'INTENSITY': ii,
+        'DISTANCE': dists.round(1),
+    })
+
+
+def emsc_csv(reports, eventid='20200101_0000001'):
+    """
+
+    :synopsis: Write reports as an EMSC testimony CSV file
+    :param reports: :py:obj:`DataFrame` from :py:obj:`generate_reports`
+    :param str eventid: EMSC event ID for the header
+    :returns: bytes
+
+    """
+
+    iraw = np.clip(reports['INTENSITY'].values.round(), 1, 10)
+    lines = ['#%s' % eventid,
+             '#thumbnails 1.0',
+             '#Correction from Bossu et al. 2016',
+             '#longitude,latitude,iraw,icorr']
+    lines += ['%.4f,%.4f,%i,%g' % row for row in
+              zip(reports['LON'], reports['LAT'], iraw,
+                  reports['INTENSITY'])]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def dyfi_geojson(reports, span=10000, minresps=1):
+    """
+
+    :synopsis: Aggregate reports into a DYFI geocoded geojson file
+    :param reports: :py:obj:`DataFrame` from :py:obj:`generate_reports`
+    :param int span: UTM box size in meters (1000 or 10000)
+    :param int minresps: Minimum number of responses per box
+    :returns: bytes
+
+    """
+
+    cells = _aggregate_cells(reports, span, minresps)
+    features = []
+    for loc, cell in cells.iterrows():
+        x, y, zone, letter = loc.split()
+        name = 'UTM:(%s%s %03i %03i %i)' % \
+            (zone, letter, int(x) // span, int(y) // span, span)
+        poly = getUtmPolyFromString(loc, span)
+        corners = poly['bounds']['coordinates'][0][0:4]
+        features.append({
+            'geometry': {'coordinates': [corners], 'type': 'Polygon'},
+            'type': 'Feature',
+            'properties': {
+                'stddev': round(cell['INTENSITY_STDDEV'], 2),
+                'nresp': int(cell['NRESP']),
+                'name': name + '<br>' + name,
+                'cdi': round(cell['INTENSITY'], 1),
+                'dist': int(round(cell['DISTANCE'])),
+            }
+        })
+
+    return json.dumps({'features': features,
+                       'type': 'FeatureCollection'}).encode('utf-8')
+
+
+def ga_geojson(reports, span=1000, minresps=1):
+    """
+
+    :synopsis: Aggregate reports into a GA felt reports geojson file
+    :param reports: :py:obj:`DataFrame` from :py:obj:`generate_reports`
+    :param int span: UTM box size in meters (1000 or 10000)
+    :param int minresps: Minimum number of responses per box
+    :returns: bytes
+
+    """
+
+    cells = _aggregate_cells(reports, span, minresps)
+    features = []
+    for loc, cell in cells.iterrows():
+        poly = getUtmPolyFromString(loc, span)
+        features.append({
+            'geometry': {'coordinates': poly['bounds']['coordinates'],
+                         'type': 'Polygon'},
+            'id': loc,
+            'properties': {
+                'center': {'coordinates': poly['center']['coordinates'],
+                           'type': 'Point'},
+                'intensity': round(cell['INTENSITY'], 1),
+                'intensityFine': round(cell['INTENSITY'], 4),
+                'location': loc,
+                'nresp': int(cell['NRESP']),
+            },
+            'type': 'Feature'
+        })
+
+    return json.dumps({'features': features,
+                       'type': 'FeatureCollection'}).encode('utf-8')
+
+
+def _aggregate_cells(reports, span, minresps):
+    producttype = 'geo_%ikm' % (span // 1000)
+
+    # aggregate() adds the LOCATION column to its input
+    df = reports[['LAT', 'LON', 'INTENSITY']].copy()
+    cells = aggregate(df, producttype, minresps=minresps)
+    dists = reports['DISTANCE'].groupby(df['LOCATION']).mean()
+    cells['DISTANCE'] = dists.reindex(cells.index)
+    cells['INTENSITY_STDDEV'] = compute_stddev(cells, 'worden2012')
+    return cells
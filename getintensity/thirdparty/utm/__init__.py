@@ -1,2 +1,3 @@
 from .conversion import to_latlon, from_latlon,latitude_to_zone_letter
+from .conversion import to_latlon_array, from_latlon_array
 from .error import OutOfRangeError
@@ -1,7 +1,8 @@
 import math
+import numpy as np
 from .error import OutOfRangeError
 
-__all__ = ['to_latlon', 'from_latlon']
+__all__ = ['to_latlon', 'from_latlon', 'to_latlon_array', 'from_latlon_array']
 
 K0 = 0.9996
 
@@ -36,6 +37,60 @@ ZONE_LETTERS = [
     (-72, 'D'), (-80, 'C')
 ]
 
+MIN_LAT = -80
+MAX_LAT = 84
+MIN_LON = -180
+MAX_LON = 180
+
+
+def _slot_values(lo, hi):
+    # Lookup tables have two slots per integer degree k: 2k for exactly k,
+    # and 2k+1 for (k, k+1), so bounds that include their edges are exact
+    slots = np.arange(2 * (hi - lo) + 1)
+    return lo + slots // 2 + 0.5 * (slots % 2)
+
+
+def _zone_letters(latitudes):
+    letters = []
+    for latitude in latitudes:
+        letter = None
+        for lat_min, zone_letter in ZONE_LETTERS:
+            if latitude >= lat_min:
+                letter = zone_letter
+                break
+        # 84 deg N is the northern edge of band X
+        if latitude == MAX_LAT:
+            letter = 'X'
+        letters.append(letter or '')
+    return np.array(letters)
+
+
+def _zone_numbers(latitudes, longitudes):
+    lat = latitudes[:, np.newaxis]
+    lon = longitudes[np.newaxis, :]
+
+    # 180 deg E is the same as 180 deg W (zone 1)
+    numbers = ((lon + 180) // 6).astype(np.int8) % 60 + 1
+    numbers = np.repeat(numbers, len(latitudes), axis=0)
+
+    # Norway
+    numbers[(56 <= lat) & (lat <= 64) & (3 <= lon) & (lon <= 12)] = 32
+
+    # Svalbard
+    svalbard = (72 <= lat) & (lat <= 84) & (lon >= 0)
+    for lon_min, lon_max, number in ((0, 9, 31), (9, 21, 33),
+                                     (21, 33, 35), (33, 42, 37)):
+        edges = (lon > lon_min) if lon_min else (lon >= lon_min)
+        numbers[svalbard & edges & (lon <= lon_max)] = number
+    return numbers
+
+
+# Zone letter by latitude slot, and zone number by latitude and longitude
+# slots (see _slot_values); '' and 0 outside of the UTM range
+ZONE_LETTER_TABLE = _zone_letters(_slot_values(MIN_LAT, MAX_LAT))
+ZONE_NUMBER_TABLE = _zone_numbers(_slot_values(MIN_LAT, MAX_LAT),
+                                  _slot_values(MIN_LON, MAX_LON))
+
 
 def to_latlon(easting, northing, zone_number, zone_letter=None, northern=None):
 
@@ -141,7 +196,7 @@ def from_latlon(latitude, longitude, force_zone_number=None):
     n = R / math.sqrt(1 - E * lat_sin**2)
     c = E_P2 * lat_cos**2
 
-    a = lat_cos * (lon_rad - central_lon_rad)
+    a = lat_cos * _wrap_angle(lon_rad - central_lon_rad)
     a2 = a * a
     a3 = a2 * a
     a4 = a3 * a
@@ -168,29 +223,177 @@ def from_latlon(latitude, longitude, force_zone_number=None):
 
 
 def latitude_to_zone_letter(latitude):
-    for lat_min, zone_letter in ZONE_LETTERS:
-        if latitude >= lat_min:
-            return zone_letter
+    if not MIN_LAT <= latitude <= MAX_LAT:
+        return None
 
-    return None
+    return str(ZONE_LETTER_TABLE[_slot(latitude, MIN_LAT)])
 
 
 def latlon_to_zone_number(latitude, longitude):
-    if 56 <= latitude <= 64 and 3 <= longitude <= 12:
-        return 32
+    if MIN_LAT <= latitude <= MAX_LAT and MIN_LON <= longitude <= MAX_LON:
+        return int(ZONE_NUMBER_TABLE[_slot(latitude, MIN_LAT),
+                                     _slot(longitude, MIN_LON)])
+
+    return int((longitude + 180) / 6) % 60 + 1
+
+
+def _slot(value, lo):
+    # Index of a value in a lookup table, see _slot_values()
+    k = math.floor(value)
+    return 2 * (k - lo) + (value != k)
 
-    if 72 <= latitude <= 84 and longitude >= 0:
-        if longitude <= 9:
-            return 31
-        elif longitude <= 21:
-            return 33
-        elif longitude <= 33:
-            return 35
-        elif longitude <= 42:
-            return 37
 
-    return int((longitude + 180) / 6) + 1
+def _slots(values, lo):
+    k = np.floor(values)
+    return (2 * (k - lo) + (values != k)).astype(np.intp)
+
+
+def _wrap_angle(radians):
+    # Wrap a longitude difference to [-pi, pi] (180 deg E is in zone 1)
+    if np.ndim(radians) == 0:
+        if radians > math.pi:
+            return radians - 2 * math.pi
+        if radians < -math.pi:
+            return radians + 2 * math.pi
+        return radians
+    return np.where(radians > math.pi, radians - 2 * math.pi,
+                    np.where(radians < -math.pi, radians + 2 * math.pi,
+                             radians))
 
 
 def zone_number_to_central_longitude(zone_number):
     return (zone_number - 1) * 6 - 180 + 3
+
+
+def from_latlon_array(latitudes, longitudes, force_zone_number=None):
+    """Vectorized from_latlon() for arrays of coordinates.
+
+    Returns arrays of eastings, northings, zone numbers and zone letters.
+    Instead of raising OutOfRangeError, coordinates out of range get NaN
+    eastings and northings, zone number 0 and zone letter ''.
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+
+    valid = ((MIN_LAT <= latitudes) & (latitudes <= MAX_LAT) &
+             (MIN_LON <= longitudes) & (longitudes <= MAX_LON))
+    lat_slots = _slots(np.where(valid, latitudes, 0), MIN_LAT)
+    lon_slots = _slots(np.where(valid, longitudes, 0), MIN_LON)
+
+    zone_letters = np.where(valid, ZONE_LETTER_TABLE[lat_slots], '')
+    if force_zone_number is None:
+        zone_numbers = ZONE_NUMBER_TABLE[lat_slots, lon_slots].astype(int)
+    else:
+        zone_numbers = np.broadcast_to(force_zone_number,
+                                       latitudes.shape).astype(int)
+    zone_numbers = np.where(valid, zone_numbers, 0)
+
+    lat_rad = np.radians(latitudes)
+    lat_sin = np.sin(lat_rad)
+    lat_cos = np.cos(lat_rad)
+
+    lat_tan = lat_sin / lat_cos
+    lat_tan2 = lat_tan * lat_tan
+    lat_tan4 = lat_tan2 * lat_tan2
+
+    lon_rad = np.radians(longitudes)
+    central_lon = zone_number_to_central_longitude(zone_numbers)
+    central_lon_rad = np.radians(central_lon)
+
+    n = R / np.sqrt(1 - E * lat_sin**2)
+    c = E_P2 * lat_cos**2
+
+    a = lat_cos * _wrap_angle(lon_rad - central_lon_rad)
+    a2 = a * a
+    a3 = a2 * a
+    a4 = a3 * a
+    a5 = a4 * a
+    a6 = a5 * a
+
+    m = R * (M1 * lat_rad -
+             M2 * np.sin(2 * lat_rad) +
+             M3 * np.sin(4 * lat_rad) -
+             M4 * np.sin(6 * lat_rad))
+
+    eastings = K0 * n * (a +
+                         a3 / 6 * (1 - lat_tan2 + c) +
+                         a5 / 120 * (5 - 18 * lat_tan2 + lat_tan4 + 72 * c - 58 * E_P2)) + 500000
+
+    northings = K0 * (m + n * lat_tan * (a2 / 2 +
+                                         a4 / 24 * (5 - lat_tan2 + 9 * c + 4 * c**2) +
+                                         a6 / 720 * (61 - 58 * lat_tan2 + lat_tan4 + 600 * c - 330 * E_P2)))
+    northings = np.where(latitudes < 0, northings + 10000000, northings)
+
+    eastings = np.where(valid, eastings, np.nan)
+    northings = np.where(valid, northings, np.nan)
+    return eastings, northings, zone_numbers, zone_letters
+
+
+def to_latlon_array(eastings, northings, zone_numbers, zone_letters):
+    """Vectorized to_latlon() for arrays of UTM coordinates.
+
+    Returns arrays of latitudes and longitudes. Instead of raising
+    OutOfRangeError, coordinates out of range get NaN.
+    """
+    eastings = np.asarray(eastings, dtype=float)
+    northings = np.asarray(northings, dtype=float)
+    zone_numbers = np.asarray(zone_numbers, dtype=int)
+    zone_letters = np.char.upper(np.asarray(zone_letters, dtype=str))
+
+    valid = ((100000 <= eastings) & (eastings < 1000000) &
+             (0 <= northings) & (northings <= 10000000) &
+             (1 <= zone_numbers) & (zone_numbers <= 60) &
+             ('C' <= zone_letters) & (zone_letters <= 'X') &
+             (zone_letters != 'I') & (zone_letters != 'O'))
+    northern = zone_letters >= 'N'
+
+    x = eastings - 500000
+    y = np.where(northern, northings, northings - 10000000)
+
+    m = y / K0
+    mu = m / (R * M1)
+
+    p_rad = (mu +
+             P2 * np.sin(2 * mu) +
+             P3 * np.sin(4 * mu) +
+             P4 * np.sin(6 * mu) +
+             P5 * np.sin(8 * mu))
+
+    p_sin = np.sin(p_rad)
+    p_sin2 = p_sin * p_sin
+
+    p_cos = np.cos(p_rad)
+
+    p_tan = p_sin / p_cos
+    p_tan2 = p_tan * p_tan
+    p_tan4 = p_tan2 * p_tan2
+
+    ep_sin = 1 - E * p_sin2
+    ep_sin_sqrt = np.sqrt(1 - E * p_sin2)
+
+    n = R / ep_sin_sqrt
+    r = (1 - E) / ep_sin
+
+    c = _E * p_cos**2
+    c2 = c * c
+
+    d = x / (n * K0)
+    d2 = d * d
+    d3 = d2 * d
+    d4 = d3 * d
+    d5 = d4 * d
+    d6 = d5 * d
+
+    latitudes = (p_rad - (p_tan / r) *
+                 (d2 / 2 -
+                  d4 / 24 * (5 + 3 * p_tan2 + 10 * c - 4 * c2 - 9 * E_P2)) +
+                  d6 / 720 * (61 + 90 * p_tan2 + 298 * c + 45 * p_tan4 - 252 * E_P2 - 3 * c2))
+
+    longitudes = (d -
+                  d3 / 6 * (1 + 2 * p_tan2 + c) +
+                  d5 / 120 * (5 - 2 * c + 28 * p_tan2 - 3 * c2 + 8 * E_P2 + 24 * p_tan4)) / p_cos
+
+    latitudes = np.degrees(latitudes)
+    longitudes = np.degrees(longitudes) + zone_number_to_central_longitude(zone_numbers)
+    return (np.where(valid, latitudes, np.nan),
+            np.where(valid, longitudes, np.nan))
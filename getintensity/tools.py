@@ -1,23 +1,57 @@
 # Copy some functionality from shakemap.coremods.dyfi_dat
 
+import os
 import re
-from numpy import exp
+import logging
+from numpy import hypot
 
 import getintensity.comcat as comcat
-import getintensity.emsc as emsc
-import getintensity.ga as ga
+import getintensity.registry as registry
+import getintensity.stddev as stddev
+from getintensity.aggregate import getUtmZone
+from getintensity.fetch import fetch_url, TIMEOUT, RETRIES, BACKOFF
+from getintensity.metrics import RunMetrics
+from getintensity.profiling import Profiler
+from getintensity.spatial import distance
+from getintensity.validate import validate
+from getintensity.association import IdCache, CACHE_FILE, resolve_extids
+from getintensity.catalog import EventCatalog, CATALOG_FILE
+
+logger = logging.getLogger(__name__)
 
 
 class IntensityParser:
 
     def __init__(self, config=None, eventid=None,
-                 extid=None, network=None):
+                 extid=None, network=None, profile=None,
+                 lookup_origin=False, trace_memory=False):
 
         self.config = config
         self.eventid = eventid
         self.extid = extid
         self.network = network
 
+        # If profile is a directory, profile each stage and save there
+        # with save_profiles(). With trace_memory, the peak python memory
+        # of each stage is traced (see RunMetrics), which slows down the run
+        self.profiler = Profiler(profile) if profile else None
+        self.metrics = RunMetrics(eventid=eventid, profiler=self.profiler,
+                                  trace_memory=trace_memory)
+
+        # Event origin (lat, lon, depth) for distances, see get_origin().
+        # With lookup_origin, it is looked up when needed (see
+        # find_origin); Comcat data sets it from the event fetched.
+        self.origin = None
+        self.lookup_origin = lookup_origin
+
+        # Known external IDs, see get_extid_from_network(), and events
+        # seen so far, see get_catalog()
+        self.idcache = None
+        self.catalog = None
+
+        # Network sources used so far, see get_network()
+        self.networks = {}
+
         # These need to be filled out by postprocess()
         self.netid = None
         self.source = None
@@ -39,56 +73,175 @@ class IntensityParser:
                 msg = 'This looks like an EMSC ZIP file. Please unzip \
                     this and rerun this program on the unzipped (.txt) file.'
                 return None, msg
-            elif re.search('felt_reports_', inputfile):
-                network = 'ga'
-            elif re.search('dyfi_geo_', inputfile):
-                network = 'neic'
-            elif 'cdi_geo.txt' in inputfile:
-                network = 'neic'
-            elif re.search(r'\d{8}_\d{7}.txt', inputfile):
-                network = 'emsc'
-            else:
+            network = self.get_network_from_file(inputfile)
+            if not network:
                 return None, 'No network found for %s.' % inputfile
             self.network = network
 
-        is_csv = re.search(r'\.csv$|\.txt$', inputfile)
-        if '.geojson' in inputfile:
-            parser = comcat._parse_dyfi_geocoded_json
-        elif network == 'neic' and is_csv:
-            parser = comcat._parse_dyfi_geocoded_csv
-        elif network == 'emsc' and is_csv:
-            parser = emsc.process_emsc_csv
-        else:
-            return None, 'Unknown file type for ' % inputfile
+        source = self.get_network(network)
+        parser = source.get_file_parser(inputfile) if source else None
+        if parser is None:
+            return None, 'Unknown file type for %s' % inputfile
 
-        with open(inputfile, 'rb') as f:
-            df = parser(f.read())
+        with self.metrics.stage('read', network=network) as stage:
+            with open(inputfile, 'rb') as f:
+                data = f.read()
+            stage.bytes += len(data)
+
+        with self.metrics.stage('parse', network=network) as stage:
+            df = parser(data)
             if df is None:
                 return None, 'Could not read file %s' % inputfile
+            stage.rows_out = len(df)
 
+        df = validate(df, network=network, metrics=self.metrics)
         return self.postprocess(df, self.network)
 
     def get_dyfi_dataframe_from_network(self, extid, network=None):
         if not network:
             network = self.network
 
-        getters = {
-            'neic': comcat.get_dyfi_dataframe_from_comcat,
-            'ga':   ga.get_dyfi_dataframe_from_ga,
-            'emsc': emsc.get_dyfi_dataframe_from_emsc
-        }
-        if network in getters:
-            getter = getters[network]
-            df, msg = getter(self, extid)
-        else:
+        source = self.get_network(network)
+        if source is None:
             return None, 'No support for network: ' + network
 
+        # Limit simultaneous fetches from each network (e.g. for fusion),
+        # the default can be changed with 'max_concurrency' in config.ini
+        limit = registry.limit(
+            network, self.get_option(network, 'max_concurrency'))
+        with limit:
+            df, msg = source.fetch(extid)
+
         if df is None:
             return None, msg
+
+        catalog = self.get_catalog()
+        if catalog:
+            catalog.add_product(network, extid, 'intensity', len(df))
+
+        df = validate(df, network=network, metrics=self.metrics)
         return self.postprocess(df, network)
 
-    @classmethod
-    def get_network_from_id(cls, extid):
+    def get_network(self, network):
+        """
+
+        :synopsis: Get a network source (see :py:obj:`getintensity.registry`)
+        :param str network: Network name
+        :returns: :py:obj:`getintensity.registry.Network`, or None if there
+            is no such network
+
+        """
+
+        if network not in self.networks:
+            cls = registry.get_network_class(network)
+            self.networks[network] = cls(self) if cls else None
+        return self.networks[network]
+
+    def get_network_from_file(self, inputfile):
+        # Guess the network from the input filename
+        for network in registry.available_networks():
+            cls = registry.get_network_class(network)
+            for pattern in cls.file_patterns:
+                if re.search(pattern, inputfile):
+                    return network
+        return None
+
+    def fetch_url(self, url):
+        # Read a URL with the timeout and retries in [fetch] of config.ini
+        return fetch_url(
+            url,
+            timeout=float(self.get_option('fetch', 'timeout', TIMEOUT)),
+            retries=int(self.get_option('fetch', 'retries', RETRIES)),
+            backoff=float(self.get_option('fetch', 'backoff', BACKOFF)))
+
+    def get_option(self, section, option, fallback=None):
+        # Get a config.ini option, or fallback if there is no config
+        if self.config is None:
+            return fallback
+        return self.config.get(section, option, fallback=fallback)
+
+    def get_origin(self, eventid=None):
+        """
+
+        :synopsis: Get the event origin, used to compute distances
+        :param str eventid: Comcat event ID (default self.eventid)
+        :returns: :py:obj:`dict` with lat, lon and depth, or None
+
+        The origin is read from Comcat, or the event record cached in the
+        raw directory by a previous run. If it cannot be found, stations
+        without a distance are left without one.
+
+        """
+
+        eventid = eventid or self.eventid
+        if not eventid:
+            return None
+        if eventid == self.eventid and self.origin is not None:
+            return self.origin
+
+        try:
+            origin = comcat.get_origin_from_comcat(self, eventid)
+        except Exception as e:
+            logger.warning('Could not get the origin of %s: %s', eventid, e)
+            return None
+        if eventid == self.eventid:
+            self.origin = origin
+
+        catalog = self.get_catalog()
+        if catalog:
+            catalog.add_event('neic', eventid, origin)
+        return origin
+
+    def find_origin(self):
+        # The origin if known, else looked up (with lookup_origin and an
+        # event ID), or None
+        if self.origin is None and self.lookup_origin and self.eventid:
+            self.get_origin()
+        return self.origin
+
+    def get_zone(self, df=None):
+        """
+
+        :synopsis: Get the UTM zone to aggregate the reports of this event
+        :param df: (optional) Reports with LAT and LON columns, used if the
+            origin is not known
+        :returns: Zone number, or None to use the zone of each report
+
+        If 'fixed_zone' is set in the [aggregate] section of config.ini,
+        all reports are aggregated in the zone of the epicenter (or of the
+        median report location), so there are no sliver boxes at zone
+        boundaries.
+
+        """
+
+        if self.get_option('aggregate', 'fixed_zone', 'no') != 'yes':
+            return None
+
+        origin = self.find_origin()
+        if origin is not None:
+            lat, lon = origin['lat'], origin['lon']
+        elif df is not None and len(df):
+            lat, lon = df['LAT'].median(), df['LON'].median()
+        else:
+            return None
+        zone = getUtmZone(lat, lon)
+        logger.info('Aggregating in UTM zone %i.', zone)
+        return zone
+
+    def save_profiles(self):
+        if not self.profiler:
+            return []
+        return self.profiler.save()
+
+    def get_network_from_id(self, extid):
+        # Look for the ID in the catalog, or guess from its format
+        catalog = self.get_catalog()
+        network = catalog.get_network(extid) if catalog else None
+        if network:
+            logger.info('Found %s in the catalog, network: %s.',
+                        extid, network)
+            return network
+
         if extid[0:2] == 'ga':
             network = 'ga'
         elif re.match(r'\d{6}', extid):
@@ -96,10 +249,10 @@ class IntensityParser:
         elif re.match(r'[^ 0-9]{2}', extid):
             network = 'neic'
         else:
-            print('Cannot guess network from id. Stopping.', extid)
-            exit()
+            logger.error('Cannot guess network from id %s.', extid)
+            return None
 
-        print('Guessing %s to be network: %s.' % (extid, network))
+        logger.info('Guessing %s to be network: %s.', extid, network)
         return network
 
     def get_extid_from_network(self, eventid=None, network=None):
@@ -108,56 +261,130 @@ class IntensityParser:
         if not network:
             network = self.network
 
-        if network == 'neic':
-            return eventid
-        elif network == 'ga':
-            extid_retriever = ga.get_extid_from_ga
-        elif network == 'emsc':
-            extid_retriever = emsc.get_extid_from_emsc
+        return self.resolve_extids([eventid], network)[eventid]
+
+    def resolve_extids(self, eventids, network=None):
+        """
+
+        :synopsis: Get the external IDs of several events in one network
+        :param eventids: :py:obj:`list` of Comcat event IDs
+        :param str network: Network of the external IDs
+        :returns: :py:obj:`dict` of {eventid: extid}, None if not found
+
+        IDs found before are read from the event catalog, then from the
+        ID cache (the 'catalog_file' and 'cache_file' in the [association]
+        section of config.ini); the others are looked up on the network.
+        IDs found are added to both, so they hold the same IDs.
+
+        """
+
+        if not network:
+            network = self.network
 
-        return extid_retriever(self, eventid)
+        source = self.get_network(network)
+        if source is None:
+            logger.error('No external ID lookup for network %s.', network)
+            return {eventid: None for eventid in eventids}
+        if not source.external_ids:
+            return {eventid: eventid for eventid in eventids}
+
+        cache = self.get_idcache()
+        catalog = self.get_catalog()
+        extids = {}
+        if catalog:
+            extids = catalog.get_extids(eventids, network)
+            for eventid, extid in extids.items():
+                cache.set(network, eventid, extid)
+
+        missing = [eventid for eventid in eventids if eventid not in extids]
+        found = resolve_extids(source.resolve_id, missing, network, cache)
+        if catalog:
+            catalog.add_ids(network, found)
+        extids.update(found)
+        return {eventid: extids[eventid] for eventid in eventids}
+
+    def get_idcache(self):
+        if self.idcache is None:
+            self.idcache = IdCache(self._data_file('cache_file', CACHE_FILE))
+        return self.idcache
+
+    def get_catalog(self):
+        # The event catalog ('catalog_file' in the [association] section),
+        # or None without a config
+        if self.catalog is None and self.config is not None:
+            filename = self._data_file('catalog_file', CATALOG_FILE)
+            self.catalog = EventCatalog(filename)
+        return self.catalog
+
+    def _data_file(self, option, default):
+        # Path of an [association] file, relative to the data path
+        if self.config is None:
+            return None
+        filename = self.get_option('association', option, default)
+        data_path = self.get_option('directories', 'data_path', '.')
+        return os.path.join(data_path, filename)
 
     def postprocess(self, df, network=None):
-        # - From the network module, define:
+        # - From the network source, define:
         #     netid, source, reference, default_outfile
+        #   and store them in df.attrs (the NETID and SOURCE columns are
+        #   only added when written, see output.materialize_attrs)
         # - Convert column names to uppercase
-        # - Calculate stddev from nresps
+        # - Calculate stddev with the network's model (see get_stddev_model)
+        # - Calculate distance from the origin (if known)
         if not network:
             return None, 'Cannot postprocess without network'
 
-        module_list = {'neic': comcat,
-                       'emsc': emsc,
-                       'ga': ga}
-
-        if network in module_list:
-            module = module_list[network]
-        else:
+        source = self.get_network(network)
+        if source is None:
             return None, 'Cannot postprocess unknown network %s' % network
 
         # Get network-specific attributes
         for attrib in ('netid', 'source', 'reference', 'default_outfile'):
-            setattr(self, attrib, getattr(module, attrib))
+            setattr(self, attrib, getattr(source, attrib))
 
-        # Try network-specific postprocess, if it exists
-        try:
-            _postprocess_func = getattr(module, 'postprocess')
-            _postprocess_func(df)
-        except AttributeError:
-            pass
+        with self.metrics.stage('postprocess', network=network,
+                                rows_in=len(df)) as stage:
+
+            # Network-specific postprocess, in place
+            source.postprocess(df)
+
+            df.rename(columns=str.upper, inplace=True)
+
+            # These are set from network source
+            df.attrs.update(network=network, netid=self.netid,
+                            source=self.source, reference=self.reference)
 
-        # These are set from network module
-        df['netid'] = self.netid
-        df['source'] = self.source
+            model = self.get_stddev_model(network)
+            if model.applies(df) and 'INTENSITY_STDDEV' not in df.columns:
+                df['INTENSITY_STDDEV'] = model.compute(df)
+            if 'DISTANCE' not in df.columns:
+                origin = self.find_origin()
+                if origin is not None:
+                    df['DISTANCE'] = self._compute_distance(df, origin)
 
-        df.columns = df.columns.str.upper()
-        if 'NRESP' in df.columns and 'INTENSITY_STDDEV' not in df.columns:
-            df['INTENSITY_STDDEV'] = self._compute_stddev(df)
+            stage.rows_out = len(df)
 
         return df, None
 
+    def get_stddev_model(self, network=None):
+        # The stddev model of a network ([stddev] section of config.ini),
+        # see getintensity.stddev
+        name = self.get_option('stddev', 'default', stddev.DEFAULT_MODEL)
+        if network:
+            name = self.get_option('stddev', network, name)
+        return stddev.get_model(name)
+
     @classmethod
     def _compute_stddev(cls, df):
         # Worden 2012  BSSA 102-1 Feb. 2012, doi: 10.1785/0120110156
-        nresps = df['NRESP']
-        stddevs = exp(nresps * (-1/24.02)) * 0.25 + 0.09
-        return stddevs
+        return stddev.compute_stddev(df, 'worden2012')
+
+    @classmethod
+    def _compute_distance(cls, df, origin):
+        # Hypocentral distance in km, or epicentral without a depth
+        dists = distance(df['LAT'].values, df['LON'].values,
+                         origin['lat'], origin['lon'])
+        if origin.get('depth') is not None:
+            dists = hypot(dists, origin['depth'])
+        return dists
@@ -0,0 +1,214 @@
+import logging
+import numpy as np
+import pandas as pd
+
+from .logs import WarningCounter
+from .metrics import RunMetrics
+
+logger = logging.getLogger(__name__)
+
+MIN_INTENSITY = 1.0
+MAX_INTENSITY = 12.0
+
+# UTM (and so aggregate()) only covers these latitudes
+UTM_MIN_LAT = -80.0
+UTM_MAX_LAT = 84.0
+
+# Rejection reasons, in the order they are checked. A row is counted
+# under the first reason that applies.
+REASONS = [
+    'bad coordinates',
+    'outside UTM range',
+    'bad intensity',
+    'bad nresp',
+    'suspect',
+    'duplicate station',
+]
+
+DEDUP_PRECISION = 3  # Decimal places of lat/lon for duplicate reports
+
+
+def validate_dataframe(df, utm=False):
+    """
+
+    :synopsis: Remove invalid entries from a parsed dataframe
+    :param df: :py:obj:`DataFrame` from a parser, with lat, lon and
+        intensity columns (upper or lower case)
+    :param bool utm: If true, also reject locations outside the UTM
+        latitude range (for reports that will be aggregated)
+    :returns: (:py:obj:`DataFrame`, :py:obj:`dict` of counts per reason)
+
+    All checks are done on whole columns, then the rows are removed in
+    one step:
+
+    =================  ==================================================
+    bad coordinates    lat/lon missing or out of range
+    outside UTM range  lat outside -80 to 84 (only if utm is set)
+    bad intensity      intensity missing or not between 1 and 12
+    bad nresp          nresp missing or less than 1
+    suspect            suspect flag is set; the column is then dropped
+    duplicate station  station already seen in a previous row
+    =================  ==================================================
+
+    Columns that are not present are not checked.
+
+    """
+
+    columns = {col.upper(): col for col in df.columns}
+    nrows = len(df)
+    reject = np.zeros(nrows, dtype=bool)
+    counts = {}
+
+    def _check(reason, bad):
+        bad = np.asarray(bad, dtype=bool) & ~reject
+        counts[reason] = int(bad.sum())
+        reject[bad] = True
+
+    lat = _column(df, columns, 'LAT')
+    lon = _column(df, columns, 'LON')
+    if lat is not None and lon is not None:
+        with np.errstate(invalid='ignore'):
+            _check('bad coordinates',
+                   ~((lat >= -90) & (lat <= 90) &
+                     (lon >= -180) & (lon <= 180)))
+            if utm:
+                _check('outside UTM range',
+                       ~((lat >= UTM_MIN_LAT) & (lat <= UTM_MAX_LAT)))
+
+    intensity = _column(df, columns, 'INTENSITY')
+    if intensity is not None:
+        with np.errstate(invalid='ignore'):
+            _check('bad intensity', ~((intensity >= MIN_INTENSITY) &
+                                      (intensity <= MAX_INTENSITY)))
+
+    nresp = _column(df, columns, 'NRESP')
+    if nresp is not None:
+        with np.errstate(invalid='ignore'):
+            _check('bad nresp', ~(nresp >= 1))
+
+    if 'SUSPECT' in columns:
+        suspect = _column(df, columns, 'SUSPECT')
+        _check('suspect', np.nan_to_num(suspect) != 0)
+
+    if 'STATION' in columns:
+        _check('duplicate station',
+               df[columns['STATION']].duplicated().values)
+
+    counts = {reason: n for reason, n in counts.items() if n}
+    if reject.any():
+        df = df[~reject]
+    if 'SUSPECT' in columns:
+        df = df.drop(columns=[columns['SUSPECT']])
+
+    return df, counts
+
+
+def validate(df, utm=False, network=None, metrics=None):
+    """
+
+    :synopsis: Validate a dataframe as a stage of a run
+    :param df: :py:obj:`DataFrame` from a parser
+    :param bool utm: See :py:obj:`validate_dataframe`
+    :param str network: Network, for the metrics
+    :param metrics: (optional) :py:obj:`RunMetrics` to record this stage
+    :returns: Valid rows of :py:obj:`df`
+
+    The number of rejected rows for each reason is logged once, and
+    recorded with the stage metrics.
+
+    """
+
+    metrics = metrics or RunMetrics()
+    with metrics.stage('validate', network=network,
+                       rows_in=len(df)) as stage:
+        df, counts = validate_dataframe(df, utm=utm)
+        stage.rows_out = len(df)
+        stage.extra['rejected'] = counts
+
+    warnings = WarningCounter(logger, 'validate')
+    for reason in REASONS:
+        warnings.count(reason, counts.get(reason, 0))
+    warnings.report()
+
+    return df
+
+
+def find_duplicates(df, precision=DEDUP_PRECISION, time_column=None):
+    """
+
+    :synopsis: Find repeated reports
+    :param df: :py:obj:`DataFrame` of reports with lat, lon and intensity
+        columns (upper or lower case)
+    :param int precision: Decimal places of lat/lon to compare
+    :param str time_column: (optional) Also compare this column, e.g. the
+        submission time
+    :returns: Boolean :py:obj:`numpy.ndarray`, true for each row that
+        repeats an earlier row
+
+    Rows are keyed by their rounded coordinates and intensity (and time),
+    converted to integers and hashed together into one 64-bit value per
+    row, so finding duplicates is a single hash table pass.
+
+    """
+
+    columns = {col.upper(): col for col in df.columns}
+    for name in ('LAT', 'LON', 'INTENSITY'):
+        if name not in columns:
+            raise KeyError('Cannot find duplicates without column ' + name)
+
+    scale = 10 ** precision
+    keys = {
+        'lat': np.rint(_column(df, columns, 'LAT') * scale),
+        'lon': np.rint(_column(df, columns, 'LON') * scale),
+        'intensity': np.rint(_column(df, columns, 'INTENSITY') * 100),
+    }
+    if time_column:
+        keys['time'] = pd.util.hash_array(df[time_column].values)
+
+    keys = pd.DataFrame({key: np.nan_to_num(values).astype('int64')
+                         for key, values in keys.items()})
+    hashes = pd.util.hash_pandas_object(keys, index=False)
+    return hashes.duplicated().values
+
+
+def deduplicate(df, precision=DEDUP_PRECISION, time_column=None,
+                network=None, metrics=None):
+    """
+
+    :synopsis: Remove repeated reports as a stage of a run
+    :param df: :py:obj:`DataFrame` of reports
+    :param int precision: See :py:obj:`find_duplicates`
+    :param str time_column: See :py:obj:`find_duplicates`
+    :param str network: Network, for the metrics
+    :param metrics: (optional) :py:obj:`RunMetrics` to record this stage
+    :returns: :py:obj:`df` without the repeated reports
+
+    """
+
+    metrics = metrics or RunMetrics()
+    with metrics.stage('deduplicate', network=network,
+                       rows_in=len(df)) as stage:
+        duplicates = find_duplicates(df, precision, time_column)
+        nduplicates = int(duplicates.sum())
+        if nduplicates:
+            df = df[~duplicates]
+        stage.rows_out = len(df)
+        stage.extra['rejected'] = {'duplicate report': nduplicates}
+
+    warnings = WarningCounter(logger, 'deduplicate')
+    warnings.count('duplicate report', nduplicates)
+    warnings.report()
+
+    return df
+
+
+def _column(df, columns, name):
+    # Get a column as a float array, or None if missing
+    if name not in columns:
+        return None
+    values = df[columns[name]].values
+    try:
+        return values.astype(float)
+    except (TypeError, ValueError):
+        # Non-numeric strings are treated as missing
+        return pd.to_numeric(df[columns[name]], errors='coerce').values
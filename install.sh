@@ -89,6 +89,7 @@ dev_list=(
     "autopep8"
     "flake8"
     "pyflakes"
+    "pytest-benchmark"
     "rope"
     "yapf"
     "sphinx"
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+import numpy as np
+import pandas as pd
+
+from getintensity.aggregate import aggregate, getUtmFromCoordinates, \
+    getUtmArrayFromCoordinates, getUtmCenters, getUtmPolyFromString, \
+    getUtmZone, aggregate_adaptive
+from getintensity.synthetic import generate_reports
+from getintensity.thirdparty.utm import from_latlon, to_latlon, \
+    from_latlon_array, to_latlon_array
+from getintensity.thirdparty.utm.conversion import latlon_to_zone_number, \
+    latitude_to_zone_letter
+
+
+def test_zone_tables():
+    # Norway and Svalbard special cases, including their edges
+    assert latlon_to_zone_number(60.0, 5.0) == 32
+    assert latlon_to_zone_number(64.0, 12.0) == 32
+    assert latlon_to_zone_number(64.5, 5.0) == 31
+    assert latlon_to_zone_number(56.0, 2.9) == 31
+    assert latlon_to_zone_number(78.0, 9.0) == 31
+    assert latlon_to_zone_number(78.0, 9.5) == 33
+    assert latlon_to_zone_number(78.0, 21.0) == 33
+    assert latlon_to_zone_number(78.0, 33.0) == 35
+    assert latlon_to_zone_number(78.0, 42.0) == 37
+    assert latlon_to_zone_number(78.0, 42.5) == 38
+    assert latlon_to_zone_number(-33.9, 151.2) == 56
+    # 180 deg E is zone 1
+    assert latlon_to_zone_number(-17.0, 180.0) == 1
+    # and projects like 180 deg W
+    expected = from_latlon(-17.0, -180.0)
+    np.testing.assert_allclose(from_latlon(-17.0, 180.0)[:2], expected[:2])
+    eastings, northings, zones, letters = from_latlon_array([-17.0], [180.0])
+    np.testing.assert_allclose([eastings[0], northings[0]], expected[:2])
+
+    assert latitude_to_zone_letter(-80.0) == 'C'
+    assert latitude_to_zone_letter(-0.5) == 'M'
+    assert latitude_to_zone_letter(0.0) == 'N'
+    assert latitude_to_zone_letter(71.9) == 'W'
+    assert latitude_to_zone_letter(84.0) == 'X'
+    assert latitude_to_zone_letter(84.1) is None
+    assert latitude_to_zone_letter(-80.1) is None
+
+
+def test_latlon_arrays():
+    rng = np.random.RandomState(1)
+    lats = np.append(rng.uniform(-80, 84, 1000), [60.0, 78.0, 95.0])
+    lons = np.append(rng.uniform(-180, 180, 1000), [5.0, 15.0, 0.0])
+
+    eastings, northings, zones, letters = from_latlon_array(lats, lons)
+    for i in range(len(lats) - 1):
+        easting, northing, zone, letter = from_latlon(lats[i], lons[i])
+        np.testing.assert_almost_equal(eastings[i], easting, 6)
+        np.testing.assert_almost_equal(northings[i], northing, 6)
+        assert zones[i] == zone
+        assert letters[i] == letter
+
+    # Out of range
+    assert np.isnan(eastings[-1])
+    assert zones[-1] == 0
+    assert letters[-1] == ''
+
+    lats2, lons2 = to_latlon_array(eastings[:-1], northings[:-1],
+                                   zones[:-1], letters[:-1])
+    for i in range(0, len(lats) - 1, 50):
+        if np.isnan(lats2[i]):
+            continue
+        lat, lon = to_latlon(eastings[i], northings[i], zones[i],
+                             letters[i])
+        np.testing.assert_almost_equal(lats2[i], lat, 9)
+        np.testing.assert_almost_equal(lons2[i], lon, 9)
+
+
+def test_utm_array():
+    lats = [38.0, 38.5, 60.0, -33.9, 91.0, np.nan]
+    lons = [23.0, 24.1, 5.0, 151.2, 0.0, 0.0]
+    for span in (1000, 10000):
+        locs = getUtmArrayFromCoordinates(lats, lons, span)
+        expected = [getUtmFromCoordinates(lat, lon, span)
+                    for lat, lon in zip(lats[:-1], lons[:-1])]
+        assert list(locs[:-1]) == expected
+        assert locs[-2] is None
+        assert locs[-1] is None
+
+        clats, clons = getUtmCenters(locs[:4], span)
+        for loc, lat, lon in zip(locs[:4], clats, clons):
+            center = getUtmPolyFromString(loc, span)['center']
+            assert list(center['coordinates']) == [lon, lat]
+
+
+def test_aggregate_vectorized():
+    # Same boxes and centers as the scalar functions
+    reports = generate_reports(2000, 'zone_boundary', spread=200, seed=2)
+    df = reports[['LAT', 'LON', 'INTENSITY']].copy()
+    agg_df = aggregate(df, 'geo_10km', minresps=1)
+
+    locs = [getUtmFromCoordinates(lat, lon, 10000)
+            for lat, lon in zip(reports['LAT'], reports['LON'])]
+    assert df['LOCATION'].tolist() == locs
+    counts = pd.Series(locs).value_counts()
+    assert agg_df['NRESP'].sort_index().tolist() == \
+        counts.sort_index().tolist()
+
+    loc = agg_df.index[0]
+    lon, lat = getUtmPolyFromString(loc, 10000)['center']['coordinates']
+    assert agg_df.loc[loc, 'LAT'] == lat
+    assert agg_df.loc[loc, 'LON'] == lon
+
+    # Reports at 180 deg E are aggregated in zone 1
+    df = pd.DataFrame({'LAT': [-17.0], 'LON': [180.0], 'INTENSITY': [3.0]})
+    agg_df = aggregate(df, 'geo_10km')
+    assert agg_df.index[0].split()[2] == '1'
+
+
+def test_fixed_zone():
+    # Reports across the zone 34/35 boundary (24 deg E)
+    reports = generate_reports(5000, 'zone_boundary', distribution='uniform',
+                               spread=100, seed=3)
+    zone = getUtmZone(38.0, 23.5)
+    assert zone == 34
+
+    df = reports[['LAT', 'LON', 'INTENSITY']].copy()
+    by_zone = aggregate(df.copy(), 'geo_10km')
+    fixed = aggregate(df.copy(), 'geo_10km', zone=zone)
+    assert set([loc.split()[2] for loc in by_zone.index]) == {'34', '35'}
+    assert set([loc.split()[2] for loc in fixed.index]) == {'34'}
+    assert fixed['NRESP'].sum() == by_zone['NRESP'].sum()
+    # No boxes cut in two by the boundary
+    assert len(fixed) < len(by_zone)
+
+    # Boxes east of the zone are not cut at its boundary
+    loc = fixed.index[np.argmax(fixed['LON'].values)]
+    assert fixed.loc[loc, 'LON'] > 24.0
+    poly = getUtmPolyFromString(loc, 10000, clip=False)
+    lons = [point[0] for point in poly['bounds']['coordinates'][0]]
+    assert min(lons) > 24.0
+
+    # Too far from the zone for a valid easting: use the report's zone
+    locs = getUtmArrayFromCoordinates([38.0], [60.0], 10000, zone=zone)
+    assert locs[0] == getUtmFromCoordinates(38.0, 60.0, 10000)
+
+
+def test_aggregate_adaptive():
+    # Same boxes as aggregate() at the resolution with the most boxes
+    for spread, expected in ((5, 'geo_1km'), (300, 'geo_10km')):
+        reports = generate_reports(3000, 'greece', spread=spread, seed=5)
+        df = reports[['LAT', 'LON', 'INTENSITY']]
+        agg_df, producttype = aggregate_adaptive(df.copy(), minresps=3)
+        assert producttype == expected
+        by_type = {ptype: aggregate(df.copy(), ptype, minresps=3)
+                   for ptype in ('geo_1km', 'geo_10km')}
+        nboxes = [len(boxes) for boxes in by_type.values()]
+        assert len(by_type[expected]) == max(nboxes)
+        assert agg_df.index.equals(by_type[expected].index)
+        assert agg_df['NRESP'].tolist() == \
+            by_type[expected]['NRESP'].tolist()
+        np.testing.assert_allclose(agg_df['INTENSITY'],
+                                   by_type[expected]['INTENSITY'])
+
+    # Ties go to the finest boxes
+    df = pd.DataFrame({'LAT': [38.0, 38.0001], 'LON': [23.0, 23.0001],
+                       'INTENSITY': [3.0, 4.0]})
+    agg_df, producttype = aggregate_adaptive(
+        df, ['geo_10km', 'geo_1km'], minresps=1)
+    assert producttype == 'geo_1km'
+    assert len(agg_df) == 1
+
+    # Unless another resolution is preferred
+    agg_df, producttype = aggregate_adaptive(
+        df, ['geo_1km', 'geo_10km'], minresps=1, preferred='geo_10km')
+    assert producttype == 'geo_10km'
+    assert agg_df.index.equals(
+        aggregate(df.copy(), 'geo_10km', minresps=1).index)
+
+
+def test_aggregate_mixed():
+    reports = generate_reports(3000, 'greece', spread=30, seed=6)
+    df = reports[['LAT', 'LON', 'INTENSITY']]
+    agg_df, producttype = aggregate_adaptive(df.copy(), minresps=3,
+                                             mixed=True)
+    assert producttype == 'mixed'
+    spans = set([loc.split()[-1] for loc in agg_df.index])
+    assert spans == {'1000', '10000'}
+    assert not agg_df.index.duplicated().any()
+
+    # Each report is counted once, in a 1km or 10km box
+    fine = aggregate(df.copy(), 'geo_1km', minresps=3)
+    fine_df = agg_df[agg_df.index.str.endswith(' 1000')]
+    assert sorted(fine_df['NRESP'].tolist()) == \
+        sorted(fine['NRESP'].tolist())
+    coarse = aggregate(df.copy(), 'geo_10km', minresps=1)
+    assert agg_df['NRESP'].sum() <= coarse['NRESP'].sum()
+    assert agg_df['NRESP'].sum() > fine['NRESP'].sum()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+import os.path
+import configparser
+
+from getintensity.association import IdCache, resolve_extids
+from getintensity.tools import IntensityParser
+
+
+def get_config():
+
+    homedir = os.path.dirname(os.path.abspath(__file__))
+    configfile = os.path.join(homedir, '..', 'config.ini')
+    config = configparser.ConfigParser()
+
+    with open(configfile, 'r') as f:
+        config.read_file(f)
+
+    return config
+
+
+def test_idcache(tmpdir):
+    filename = os.path.join(str(tmpdir), 'raw', 'eventids.json')
+    cache = IdCache(filename)
+    assert cache.get('emsc', 'nc72282711') is None
+
+    cache.set('emsc', 'nc72282711', '20140824_0000036')
+    cache.save()
+    assert not cache.changed
+
+    cache = IdCache(filename)
+    assert cache.get('emsc', 'nc72282711') == '20140824_0000036'
+    assert cache.get('ga', 'nc72282711') is None
+
+
+def test_resolve_extids(tmpdir):
+    cache = IdCache(os.path.join(str(tmpdir), 'eventids.json'))
+    cache.set('emsc', 'us1', 'emsc1')
+
+    looked_up = []
+
+    def retriever(eventid):
+        looked_up.append(eventid)
+        return {'us2': 'emsc2'}.get(eventid)
+
+    extids = resolve_extids(retriever, ['us1', 'us2', 'us3'], 'emsc', cache)
+    assert extids == {'us1': 'emsc1', 'us2': 'emsc2', 'us3': None}
+    assert looked_up == ['us2', 'us3']
+
+    # Found IDs are not looked up again
+    looked_up.clear()
+    extids = resolve_extids(retriever, ['us1', 'us2'], 'emsc', cache)
+    assert extids == {'us1': 'emsc1', 'us2': 'emsc2'}
+    assert looked_up == []
+
+
+def test_get_extid_from_network(tmpdir):
+    config = get_config()
+    config['directories']['data_path'] = str(tmpdir)
+
+    # Known events are found in the cache, without the network
+    iparser = IntensityParser(config=config, eventid='nc72282711')
+    iparser.get_idcache().set('emsc', 'nc72282711', '20140824_0000036')
+    iparser.get_idcache().save()
+
+    iparser = IntensityParser(config=config, eventid='nc72282711')
+    assert iparser.get_extid_from_network(network='emsc') == \
+        '20140824_0000036'
+    assert iparser.get_extid_from_network(network='neic') == 'nc72282711'
+    assert os.path.exists(os.path.join(str(tmpdir), 'raw', 'eventids.json'))
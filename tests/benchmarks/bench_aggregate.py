@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import pytest
+
+from getintensity.aggregate import aggregate, getUtmPolyFromString
+from getintensity.emsc import _parse_emsc_raw
+
+PRODUCTTYPES = ['geo_1km', 'geo_10km']
+
+
+@pytest.fixture(scope='module')
+def emsc_df(emsc_data):
+    return _parse_emsc_raw(emsc_data)
+
+
+@pytest.fixture(scope='module')
+def emsc_scaled_df(emsc_scaled):
+    return _parse_emsc_raw(emsc_scaled)
+
+
+def _run_aggregate(benchmark, df, producttype, rounds):
+    # aggregate() adds a column to its input, so give it a fresh copy
+    def setup():
+        return (df.copy(), producttype), {'minresps': 3}
+
+    return benchmark.pedantic(aggregate, setup=setup, rounds=rounds)
+
+
+@pytest.mark.parametrize('producttype', PRODUCTTYPES)
+def test_aggregate(benchmark, emsc_df, producttype):
+    benchmark.group = 'aggregate_' + producttype
+    agg_df = _run_aggregate(benchmark, emsc_df, producttype, rounds=10)
+    assert len(agg_df)
+
+
+@pytest.mark.parametrize('producttype', PRODUCTTYPES)
+def test_aggregate_scaled(benchmark, emsc_scaled_df, producttype, size):
+    benchmark.group = 'aggregate_' + producttype
+    benchmark.extra_info['size'] = size
+    agg_df = _run_aggregate(benchmark, emsc_scaled_df, producttype, rounds=1)
+    assert len(agg_df)
+
+
+@pytest.mark.parametrize('producttype', PRODUCTTYPES)
+def test_getUtmPolyFromString(benchmark, emsc_df, producttype):
+    benchmark.group = 'getUtmPolyFromString'
+    span = 1000 if producttype == 'geo_1km' else 10000
+    locations = aggregate(emsc_df.copy(), producttype).index.tolist()
+
+    def _polys():
+        return [getUtmPolyFromString(loc, span) for loc in locations]
+
+    polys = benchmark(_polys)
+    assert len(polys) == len(locations)
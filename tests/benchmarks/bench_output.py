@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+import os.path
+import tempfile
+from shutil import rmtree
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from getintensity.output import write_station_xml
+
+
+def make_stations(nstations, seed=0):
+    # A postprocessed station dataframe with nstations 1km UTM stations
+    rng = np.random.RandomState(seed)
+    x = rng.randint(100, 999, nstations) * 1000
+    y = rng.randint(4000, 4999, nstations) * 1000
+    nresp = rng.randint(3, 100, nstations)
+    return pd.DataFrame({
+        'INTENSITY': rng.uniform(1, 9, nstations),
+        'NRESP': nresp,
+        'LAT': rng.uniform(35, 45, nstations),
+        'LON': rng.uniform(20, 30, nstations),
+        'STATION': ['UTM:(%i %i 34 S)' % xy for xy in zip(x, y)],
+        'NETID': 'INTENSITY',
+        'SOURCE': 'European-Mediterranean Seismic Center',
+        'INTENSITY_STDDEV': np.exp(nresp * (-1/24.02)) * 0.25 + 0.09,
+    })
+
+
+@pytest.fixture(scope='module')
+def stations(size):
+    return make_stations(size)
+
+
+@pytest.fixture
+def outfile():
+    tempdir = tempfile.mkdtemp(prefix='tmp.bench.')
+    yield os.path.join(tempdir, 'dyfi_dat.xml')
+    rmtree(tempdir)
+
+
+def test_write_station_xml(benchmark, stations, outfile, size):
+    benchmark.group = 'write_xml_%i' % size
+    benchmark.extra_info['size'] = size
+    nstations = benchmark.pedantic(write_station_xml,
+                                   args=(stations, outfile, 'TEST'),
+                                   rounds=3)
+    assert nstations <= size
+
+
+def test_dataframe_to_xml(benchmark, stations, outfile, size):
+    # Reference: the impactutils writer that write_station_xml replaces
+    table = pytest.importorskip('impactutils.io.table')
+    benchmark.group = 'write_xml_%i' % size
+    benchmark.extra_info['size'] = size
+    benchmark.pedantic(table.dataframe_to_xml,
+                       args=(stations, outfile, 'TEST'), rounds=1)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+import pytest
+
+from getintensity.comcat import _parse_dyfi_geocoded_json, \
+    _parse_dyfi_geocoded_csv
+from getintensity.emsc import _parse_emsc_raw
+
+from conftest import read_data, read_cdi_geo, GA_FILE
+
+
+def test_parse_dyfi_geocoded_json(benchmark, dyfi_data):
+    benchmark.group = 'parse_dyfi_geocoded_json'
+    df = benchmark(_parse_dyfi_geocoded_json, dyfi_data)
+    assert len(df)
+
+
+def test_parse_dyfi_geocoded_json_ga(benchmark):
+    benchmark.group = 'parse_dyfi_geocoded_json'
+    df = benchmark(_parse_dyfi_geocoded_json, read_data(GA_FILE))
+    assert len(df)
+
+
+def test_parse_dyfi_geocoded_json_scaled(benchmark, dyfi_scaled, size):
+    benchmark.group = 'parse_dyfi_geocoded_json'
+    benchmark.extra_info['size'] = size
+    df = benchmark.pedantic(_parse_dyfi_geocoded_json, args=(dyfi_scaled,),
+                            rounds=3)
+    assert len(df)
+
+
+def test_parse_dyfi_geocoded_csv(benchmark):
+    benchmark.group = 'parse_dyfi_geocoded_csv'
+    df = benchmark(_parse_dyfi_geocoded_csv, read_cdi_geo())
+    assert len(df)
+
+
+@pytest.fixture(scope='module')
+def cdi_geo_scaled(size):
+    lines = read_cdi_geo().split(b'\n')
+    header = lines[0]
+    rows = [line for line in lines[1:] if line]
+    rows = (rows * (size // len(rows) + 1))[0:size]
+    return b'\n'.join([header] + rows)
+
+
+def test_parse_dyfi_geocoded_csv_scaled(benchmark, cdi_geo_scaled, size):
+    benchmark.group = 'parse_dyfi_geocoded_csv'
+    benchmark.extra_info['size'] = size
+    df = benchmark.pedantic(_parse_dyfi_geocoded_csv, args=(cdi_geo_scaled,),
+                            rounds=3)
+    assert len(df)
+
+
+def test_parse_emsc_raw(benchmark, emsc_data):
+    benchmark.group = 'parse_emsc_raw'
+    df = benchmark(_parse_emsc_raw, emsc_data)
+    assert len(df)
+
+
+def test_parse_emsc_raw_scaled(benchmark, emsc_scaled, size):
+    benchmark.group = 'parse_emsc_raw'
+    benchmark.extra_info['size'] = size
+    df = benchmark.pedantic(_parse_emsc_raw, args=(emsc_scaled,), rounds=3)
+    assert len(df) == size
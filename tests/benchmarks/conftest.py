@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# Fixtures for the benchmark suite. Run with:
+#   py.test tests/benchmarks/bench_*.py --benchmark-autosave
+#
+# Dataset sizes (number of reports or stations) for the scaled-up
+# benchmarks are set with the BENCH_SIZES environment variable, e.g.
+#   BENCH_SIZES=10000,100000,1000000,10000000
+
+import os.path
+import pytest
+import yaml
+
+from getintensity import synthetic
+
+DEFAULT_SIZES = '10000,100000'
+SIZES = [int(size) for size in
+         os.environ.get('BENCH_SIZES', DEFAULT_SIZES).split(',')]
+
+EMSC_FILE = '20190330_0000065.txt'
+DYFI_FILE = 'nc72282711_dyfi_geo_10km.geojson'
+GA_FILE = 'felt_reports_1km_filtered.geojson'
+CDI_GEO_TAPE = 'vcr_comcat_txt.yaml'
+
+
+def get_datadir():
+    # this returns the test data directory
+
+    homedir = os.path.dirname(os.path.abspath(__file__))
+    datadir = os.path.join(homedir, '..', 'data')
+    return datadir
+
+
+def read_data(filename):
+    with open(os.path.join(get_datadir(), filename), 'rb') as f:
+        return f.read()
+
+
+def read_cdi_geo():
+    # The only cdi_geo.txt example is inside a VCR cassette
+    with open(os.path.join(get_datadir(), CDI_GEO_TAPE), 'r') as f:
+        tape = yaml.safe_load(f)
+    for interaction in tape['interactions']:
+        if interaction['request']['uri'].endswith('cdi_geo.txt'):
+            return interaction['response']['body']['string'].encode('utf-8')
+
+
+def synthetic_reports(nreports, seed=0):
+    # Reports spread across the zone 34/35 boundary
+    return synthetic.generate_reports(nreports, scenario='zone_boundary',
+                                      distribution='cities', spread=200,
+                                      seed=seed)
+
+
+@pytest.fixture(scope='session', params=SIZES)
+def size(request):
+    return request.param
+
+
+@pytest.fixture(scope='session')
+def emsc_data():
+    return read_data(EMSC_FILE)
+
+
+@pytest.fixture(scope='session')
+def emsc_scaled(size):
+    return synthetic.emsc_csv(synthetic_reports(size))
+
+
+@pytest.fixture(scope='session')
+def dyfi_data():
+    return read_data(DYFI_FILE)
+
+
+@pytest.fixture(scope='session')
+def dyfi_scaled(size):
+    # About one box per report, which is slow to generate for large sizes
+    reports = synthetic.generate_reports(size, distribution='uniform',
+                                         spread=size**0.5 * 5, seed=0)
+    return synthetic.dyfi_geojson(reports, span=10000)
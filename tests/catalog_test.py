@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import os.path
+import configparser
+
+from getintensity.catalog import EventCatalog
+from getintensity.tools import IntensityParser
+
+
+def get_config():
+
+    homedir = os.path.dirname(os.path.abspath(__file__))
+    configfile = os.path.join(homedir, '..', 'config.ini')
+    config = configparser.ConfigParser()
+
+    with open(configfile, 'r') as f:
+        config.read_file(f)
+
+    return config
+
+
+def test_catalog(tmpdir):
+    filename = os.path.join(str(tmpdir), 'raw', 'catalog.sqlite')
+    catalog = EventCatalog(filename)
+    origin = {'lat': -18.0, 'lon': 120.0, 'depth': 10.0,
+              'time': '2019-07-14T05:39:24', 'magnitude': 6.6}
+    catalog.add_event('neic', 'us70004jxe', origin)
+    catalog.add_ids('ga', {'us70004jxe': 'ga2019nsodfc', 'us1': None})
+    catalog.add_ids('emsc', {'us70004jxe': '20190714_0000023'})
+    catalog.add_product('ga', 'ga2019nsodfc', 'intensity', 126)
+    catalog.close()
+
+    catalog = EventCatalog(filename)
+    assert catalog.get_event('neic', 'us70004jxe') == origin
+    assert catalog.get_event('neic', 'us1') is None
+    assert catalog.get_network('ga2019nsodfc') == 'ga'
+    assert catalog.get_network('20190714_0000023') == 'emsc'
+    assert catalog.get_network('us70004jxe') == 'neic'
+    assert catalog.get_network('unknown') is None
+    assert catalog.get_extid('us70004jxe', 'ga') == 'ga2019nsodfc'
+    assert catalog.get_eventid('ga2019nsodfc') == 'us70004jxe'
+    assert catalog.get_extids(['us70004jxe', 'us1'], 'ga') == {
+        'us70004jxe': 'ga2019nsodfc'}
+
+    assert catalog.plan(['us70004jxe', 'us1'], 'ga') == {
+        'us70004jxe': ('ga2019nsodfc', 126),
+        'us1': (None, None),
+    }
+    assert catalog.plan(['us70004jxe'], 'emsc') == {
+        'us70004jxe': ('20190714_0000023', None),
+    }
+
+
+def test_get_network_from_id(tmpdir):
+    config = get_config()
+    config['directories']['data_path'] = str(tmpdir)
+    iparser = IntensityParser(config=config)
+
+    assert iparser.get_network_from_id('ga2019nsodfc') == 'ga'
+    assert iparser.get_network_from_id('20140824_0000036') == 'emsc'
+    assert iparser.get_network_from_id('nc72282711') == 'neic'
+    assert iparser.get_network_from_id('1234') is None
+
+    # IDs in the catalog do not need to match a pattern
+    iparser.get_catalog().add_ids('emsc', {'nc72282711': '1234'})
+    assert iparser.get_network_from_id('1234') == 'emsc'
+
+
+def test_resolve_from_catalog(tmpdir):
+    config = get_config()
+    config['directories']['data_path'] = str(tmpdir)
+
+    # IDs in the catalog are not looked up, and are added to the ID cache
+    iparser = IntensityParser(config=config)
+    iparser.get_catalog().add_ids('emsc', {'us1': '20200101_0000001'})
+    iparser.get_network('emsc').resolve_id = lambda eventid: None
+    assert iparser.resolve_extids(['us1', 'us2'], 'emsc') == {
+        'us1': '20200101_0000001', 'us2': None}
+    iparser = IntensityParser(config=config)
+    assert iparser.get_idcache().get('emsc', 'us1') == '20200101_0000001'
+
+    # IDs in the ID cache are added to the catalog
+    iparser.get_idcache().set('emsc', 'us3', '20200101_0000003')
+    iparser.get_network('emsc').resolve_id = lambda eventid: None
+    assert iparser.resolve_extids(['us3'], 'emsc') == {
+        'us3': '20200101_0000003'}
+    assert iparser.get_catalog().get_extid('us3', 'emsc') == \
+        '20200101_0000003'
@@ -120,6 +120,35 @@ you can safely ignore this warning.'
         rmtree(tempdir)
         warnings.warn(msg)
 
+
+def test_parse_geocoded_json():
+    datadir = get_datadir()
+    testfile = os.path.join(datadir, 'nc72282711_dyfi_geo_10km.geojson')
+    with open(testfile, 'rb') as f:
+        df = comcat._parse_dyfi_geocoded_json(f.read())
+
+    assert len(df) == 203
+    for column in ('intensity', 'distance', 'intensity_stddev', 'lat', 'lon'):
+        assert df[column].dtype == np.float64
+    assert df['nresp'].dtype == np.int64
+    assert df['station'].str.match(r'UTM:\(\d+\w \d+ \d+ 10000\)$').all()
+    assert not df['station'].str.contains('<br>').any()
+
+    # Boxes with different numbers of points, a missing distance
+    box = [[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]]
+    jdict = {'features': [
+        {'properties': {'name': 'A<br>A', 'cdi': 3.0, 'nresp': 5,
+                        'dist': 10},
+         'geometry': {'coordinates': [box]}},
+        {'properties': {'name': 'B', 'cdi': 4.0, 'nresp': 3},
+         'geometry': {'coordinates': [box[0:4]]}},
+    ]}
+    df = comcat._geocoded_json_dataframe(jdict)
+    assert df['station'].tolist() == ['A', 'B']
+    assert df['lat'].tolist() == [0.4, 0.5]
+    assert np.isnan(df['distance'].iloc[1])
+
+
 if __name__ == '__main__':
     os.environ['CALLED_FROM_PYTEST'] = 'True'
     test_comcat_data()
@@ -29,10 +29,11 @@ def get_config():
     return config
 
 
-def test_emsc_file():
+def test_emsc_file(tmpdir):
     eventid = 'unknown'
     datadir = get_datadir()
     config = get_config()
+    config['directories']['data_path'] = str(tmpdir)
     iparser = IntensityParser(eventid=eventid, config=config, network='emsc')
 
     # Test reading an emsc ZIP file
@@ -43,13 +44,14 @@ def test_emsc_file():
     np.testing.assert_equal(df['NRESP'].sum(), 227)
 
 
-def test_emsc_zip():
+def test_emsc_zip(tmpdir):
     # Test output from EMSC testimonials feed
 
     eventid = 'nc72282711'
     extid = '20140824_0000036'
     datadir = get_datadir()
     config = get_config()
+    config['directories']['data_path'] = str(tmpdir)
 
     tape_file1 = os.path.join(datadir, 'vcr_emsc_zip.yaml')
 
@@ -63,13 +65,14 @@ def test_emsc_zip():
     return
 
 
-def test_emsc_retrieve():
+def test_emsc_retrieve(tmpdir):
     # Test output from EMSC name server
 
     eventid = 'nc72282711'
     extid = '20140824_0000036'
     datadir = get_datadir()
     config = get_config()
+    config['directories']['data_path'] = str(tmpdir)
 
     tape_file1 = os.path.join(datadir, 'vcr_emsc_eventid.yaml')
 
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+import configparser
+import io
+import os.path
+import zipfile
+import numpy as np
+import pandas as pd
+
+import getintensity.registry as registry
+from getintensity.registry import Network
+from getintensity.tools import IntensityParser
+from getintensity.fusion import fuse, fuse_stations
+from getintensity.aggregate import aggregate, getUtmFromCoordinates
+from getintensity.synthetic import generate_reports
+from getintensity.output import materialize_attrs
+
+
+def get_config():
+
+    homedir = os.path.dirname(os.path.abspath(__file__))
+    configfile = os.path.join(homedir, '..', 'config.ini')
+    config = configparser.ConfigParser()
+
+    with open(configfile, 'r') as f:
+        config.read_file(f)
+
+    return config
+
+
+def _stations(netid, lats, lons, intensities, nresps):
+    return pd.DataFrame({
+        'STATION': ['%s%i' % (netid, i) for i in range(len(lats))],
+        'LAT': lats,
+        'LON': lons,
+        'INTENSITY': intensities,
+        'NRESP': nresps,
+        'NETID': netid,
+        'SOURCE': netid + ' source',
+    })
+
+
+def test_fuse_stations():
+    # Two networks with stations in the same 10km box, one elsewhere
+    dyfi = _stations('DYFI', [38.01, 39.0], [23.01, 23.0], [4.0, 3.0],
+                     [10, 5])
+    emsc = _stations('INTENSITY', [38.012, 38.013], [23.012, 23.011],
+                     [2.0, 3.0], [5, 5])
+
+    fused = fuse_stations([dyfi, emsc], 'geo_10km', minresps=3)
+    assert len(fused) == 2
+    shared = fused[fused['NNETWORKS'] == 2].iloc[0]
+    assert shared['NRESP'] == 20
+    np.testing.assert_almost_equal(shared['INTENSITY'],
+                                   (40 + 10 + 15) / 20)
+    assert shared['SOURCE'] == 'DYFI source, INTENSITY source'
+    loc = getUtmFromCoordinates(38.01, 23.01, 'geo_10km')
+    assert shared['STATION'] == 'FUSED.UTM:(%s)' % loc
+    assert (materialize_attrs(fused)['NETID'] == 'FUSED').all()
+
+    # The box center is in the box
+    assert getUtmFromCoordinates(shared['LAT'], shared['LON'],
+                                 'geo_10km') == loc
+
+    fused = fuse_stations([dyfi, emsc], 'geo_10km', minresps=6)
+    assert fused['NRESP'].tolist() == [20]
+
+
+def test_fuse_aggregate():
+    # Single reports are fused into the same boxes as aggregate()
+    reports = generate_reports(2000, 'greece', spread=100, seed=7)
+    df = reports[['LAT', 'LON', 'INTENSITY']]
+    df.attrs = {'netid': 'INTENSITY', 'source': 'EMSC'}
+    for producttype in ('geo_10km', 'geo_2.5km'):
+        agg_df = aggregate(df.copy(), producttype, minresps=3)
+        fused = fuse_stations([df], producttype, minresps=3)
+        assert fused['STATION'].tolist() == \
+            ['FUSED.UTM:(%s)' % loc for loc in agg_df.index]
+        for column in ('NRESP', 'LAT', 'LON'):
+            assert fused[column].tolist() == agg_df[column].tolist()
+        np.testing.assert_allclose(fused['INTENSITY'], agg_df['INTENSITY'])
+        assert (fused['SOURCE'] == 'EMSC').all()
+
+
+class FakeDyfi(Network):
+    netid = 'DYFI'
+    source = 'Fake DYFI'
+    reference = 'Fake DYFI reference'
+    external_ids = False
+
+    def fetch(self, extid):
+        df = _stations('DYFI', [38.01], [23.01], [4.0], [10])
+        df.columns = df.columns.str.lower()
+        return df.drop(columns=['netid', 'source']), None
+
+
+class FakeEmsc(Network):
+    netid = 'INTENSITY'
+    source = 'Fake EMSC'
+    reference = 'Fake EMSC reference'
+
+    def fetch(self, extid):
+        df = _stations('INTENSITY', [38.012], [23.012], [2.0], [5])
+        return df.drop(columns=['NETID', 'SOURCE']), None
+
+    def resolve_id(self, eventid):
+        return 'emsc_' + eventid
+
+
+class FakeEmpty(Network):
+    def resolve_id(self, eventid):
+        return None
+
+
+def test_fuse():
+    fakes = {'fakedyfi': FakeDyfi, 'fakeemsc': FakeEmsc,
+             'fakeempty': FakeEmpty}
+    for name, cls in fakes.items():
+        registry.register(name, cls)
+    try:
+        iparser = IntensityParser(eventid='us1')
+        iparser.origin = {'lat': 38.0, 'lon': 23.0, 'depth': 10.0}
+        df, msg = fuse(iparser, list(fakes))
+        assert msg is None
+        assert len(df) == 1
+        assert df['NRESP'].tolist() == [15]
+        assert 'INTENSITY_STDDEV' in df.columns
+        assert 'DISTANCE' in df.columns
+        assert iparser.netid == 'FUSED'
+        assert iparser.reference == \
+            'Fused: Fake DYFI reference, Fake EMSC reference'
+
+        # Stages from each network are in the run metrics
+        networks = set([stage.network for stage in iparser.metrics.stages])
+        assert {'fakedyfi', 'fakeemsc'} <= networks
+
+        df, msg = fuse(iparser, ['fakeempty'])
+        assert df is None
+
+        # Any UTM grid
+        df, msg = fuse(iparser, list(fakes), producttype='geo_25km')
+        assert len(df) == 1
+    finally:
+        for name in fakes:
+            registry._classes.pop(name, None)
+            registry._semaphores.pop(name, None)
+
+
+def test_fuse_profile(tmpdir):
+    fakes = {'fakedyfi': FakeDyfi, 'fakeemsc': FakeEmsc}
+    for name, cls in fakes.items():
+        registry.register(name, cls)
+    try:
+        iparser = IntensityParser(eventid='us1', profile=str(tmpdir))
+        iparser.origin = {'lat': 38.0, 'lon': 23.0, 'depth': 10.0}
+        df, msg = fuse(iparser, list(fakes))
+        assert msg is None
+
+        # Stages of each network are profiled, like the parent's
+        names = [name for name, profile in iparser.profiler.profiles]
+        assert names.count('postprocess') == 2
+        assert 'fuse' in names
+        outfiles = iparser.save_profiles()
+        assert len(outfiles) == len(names) + 1
+    finally:
+        for name in fakes:
+            registry._classes.pop(name, None)
+            registry._semaphores.pop(name, None)
+
+
+def test_fuse_empty_zip(tmpdir, monkeypatch):
+    # An empty EMSC zip only fails that network
+    buf = io.BytesIO()
+    zipfile.ZipFile(buf, 'w').close()
+    monkeypatch.setattr(IntensityParser, 'fetch_url',
+                        lambda self, url: buf.getvalue())
+
+    config = get_config()
+    config['directories']['data_path'] = str(tmpdir)
+    registry.register('fakedyfi', FakeDyfi)
+    try:
+        iparser = IntensityParser(config=config, eventid='us1')
+        iparser.origin = {'lat': 38.0, 'lon': 23.0, 'depth': 10.0}
+        iparser.get_idcache().set('emsc', 'us1', '20190330_0000065')
+        df, msg = fuse(iparser, ['fakedyfi', 'emsc'], minresps=1)
+        assert msg is None
+        assert df['SOURCE'].tolist() == ['Fake DYFI']
+    finally:
+        registry._classes.pop('fakedyfi', None)
+        registry._semaphores.pop('fakedyfi', None)
+    assert not os.path.exists('tmp.badzipfile.zip')
@@ -1,11 +1,18 @@
 #!/usr/bin/env python
 
+import io
 import os.path
+import json
 import configparser
 import numpy as np
 import vcr
 
 from getintensity.tools import IntensityParser
+import getintensity.ga as ga
+import getintensity.fetch as fetch
+from getintensity.comcat import _load_geocoded_json, \
+    _count_geocoded_json, _select_geocoded_json, _parse_dyfi_geocoded_json
+from getintensity.metrics import RunMetrics
 
 
 def get_datadir():
@@ -41,6 +48,8 @@ def test_ga_file():
     assert len(df) == 126
     np.testing.assert_almost_equal(df['INTENSITY'].sum(), 471.3)
     np.testing.assert_equal(df['NRESP'].sum(), 1316)
+    assert 'LOCATION' not in df.columns
+    assert df['STATION'].iloc[0].startswith('UTM:(')
 
     # Test reading a dyfi format file
     testfile = os.path.join(datadir, 'felt_reports_10km_filtered.geojson')
@@ -52,15 +61,14 @@ def test_ga_file():
     return
 
 
-def test_ga():
+def test_ga(tmpdir):
     # Test output from GA feed
 
     eventid = 'us70004jxe'
     extid = 'ga2019nsodfc'
     datadir = get_datadir()
     config = get_config()
-    config['directories']['data_path'] = datadir
-    print('config.directories.data_path is now', datadir)
+    config['directories']['data_path'] = str(tmpdir)
 
     tape_file1 = os.path.join(datadir, 'vcr_ga.yaml')
 
@@ -74,6 +82,75 @@ def test_ga():
     return
 
 
-def test_ga_retrieve():
+def test_ga_retrieve(monkeypatch):
+    # Test finding the GA ID from a GA event search
+
+    eventid = 'us70004jxe'
+    config = get_config()
+    iparser = IntensityParser(eventid=eventid, config=config, network='ga')
+    iparser.origin = {'lat': -18.0, 'lon': 120.0, 'depth': 10.0,
+                      'time': '2019-07-14T05:39:24', 'magnitude': 6.6}
+
+    urls = []
+    results = {'results': [
+        {'event_id': 'ga2019nsodfa', 'event_time': '2019-07-14T05:38:50Z'},
+        {'event_id': 'ga2019nsodfc', 'event_time': '2019-07-14T05:39:25Z'},
+    ]}
+
+    def urlopen(url, timeout=None):
+        urls.append(url)
+        return io.BytesIO(json.dumps(results).encode('utf-8'))
+
+    monkeypatch.setattr(fetch.request, 'urlopen', urlopen)
+    assert ga.get_extid_from_ga(iparser, eventid) == 'ga2019nsodfc'
+    assert 'magnitude>6.1' in urls[0]
+    assert 'event_time>2019-07-14T05:38:24' in urls[0]
+
+    results = []
+    assert ga.get_extid_from_ga(iparser, eventid) is None
+
+    return
+
+
+def test_ga_select():
+    # Stations are counted in both files, only the selected one is parsed
+    datadir = get_datadir()
+    jdicts = {}
+    for geotype in ('1km', '10km'):
+        testfile = os.path.join(datadir,
+                                'felt_reports_%s_filtered.geojson' % geotype)
+        with open(testfile, 'rb') as f:
+            data = f.read()
+        jdicts[geotype] = _load_geocoded_json(data)
+        assert _count_geocoded_json(jdicts[geotype]) == \
+            len(_parse_dyfi_geocoded_json(data))
+
+    metrics = RunMetrics()
+    df = _select_geocoded_json(jdicts, metrics, 'ga')
+    counts = {geotype: _count_geocoded_json(jdict)
+              for geotype, jdict in jdicts.items()}
+    assert len(df) == max(counts.values())
+    assert len([stage for stage in metrics.stages
+                if stage.name == 'parse']) == 1
+
+    # 1km is preferred if there is a tie
+    df = _select_geocoded_json({'10km': jdicts['1km'],
+                                '1km': jdicts['1km']}, metrics, 'ga')
+    assert len(df) == counts['1km']
+    assert _select_geocoded_json({}, metrics, 'ga') is None
+
+    # Otherwise the network's preferred resolution, if there is a tie
+    kept = {geotype: [feature for feature in jdict['features']
+                      if feature['properties']['nresp'] >= 3]
+            for geotype, jdict in jdicts.items()}
+    n = min([len(features) for features in kept.values()])
+    tied = {geotype: {'features': features[:n]}
+            for geotype, features in kept.items()}
+    for geotype in tied:
+        df = _select_geocoded_json(tied, metrics, 'ga',
+                                   preferred='geo_' + geotype)
+        assert df['location'].tolist() == [
+            feature['properties']['location']
+            for feature in tied[geotype]['features']]
 
     return
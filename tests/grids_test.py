@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import numpy as np
+import pytest
+
+from getintensity.aggregate import aggregate, getUtmFromCoordinates
+from getintensity.grids import get_grid, aggregate_levels, UtmGrid, \
+    GeohashGrid
+from getintensity.synthetic import generate_reports
+
+
+def _reports(scenario='zone_boundary'):
+    reports = generate_reports(3000, scenario, distribution='uniform',
+                               spread=150, seed=4)
+    return reports[['LAT', 'LON', 'INTENSITY']]
+
+
+def test_get_grid():
+    assert get_grid('geo_1km').span == 1000
+    assert get_grid('10km').span == 10000
+    assert get_grid('geo_2.5km').span == 2500
+    assert get_grid('geo_2.5km').name == 'geo_2.5km'
+    assert get_grid(25000).name == 'geo_25km'
+    assert get_grid('geo_10km', zone=34).zone == 34
+    assert get_grid('geohash_5').precision == 5
+
+    for producttype in ('geo_0.0001km', 'geo_km', 'hex_5', 'geohash_13'):
+        with pytest.raises(ValueError):
+            get_grid(producttype)
+
+
+def test_utm_grid():
+    df = _reports()
+    grid = UtmGrid(2500)
+    keys = grid.assign(df['LAT'].values, df['LON'].values)
+    assert (keys >= 0).all()
+    names = grid.names(keys[0:50])
+    for i, name in enumerate(names):
+        assert name == getUtmFromCoordinates(df['LAT'].values[i],
+                                             df['LON'].values[i], 2500)
+
+    # Parent keys are the keys of the coarser grid
+    for span in (5000, 10000, 25000):
+        coarse = UtmGrid(span)
+        assert grid.is_parent(coarse)
+        np.testing.assert_array_equal(
+            grid.parent(keys, coarse),
+            coarse.assign(df['LAT'].values, df['LON'].values))
+    assert not grid.is_parent(UtmGrid(1000))
+    assert not grid.is_parent(UtmGrid(7500 + 1))
+    with pytest.raises(ValueError):
+        grid.parent(keys, GeohashGrid(5))
+
+    assert grid.assign([91.0, np.nan], [0.0, 0.0]).tolist() == [-1, -1]
+
+
+def test_geohash_grid():
+    # Example from https://en.wikipedia.org/wiki/Geohash
+    grid = GeohashGrid(11)
+    keys = grid.assign([57.64911], [10.40744])
+    assert grid.names(keys)[0] == 'u4pruydqqvj'
+    lats, lons = grid.centers(keys)
+    assert abs(lats[0] - 57.64911) < 1e-5
+    assert abs(lons[0] - 10.40744) < 1e-5
+
+    df = _reports('equator')
+    fine = GeohashGrid(6)
+    keys = fine.assign(df['LAT'].values, df['LON'].values)
+    for precision in (5, 4):
+        coarse = GeohashGrid(precision)
+        np.testing.assert_array_equal(
+            fine.parent(keys, coarse),
+            coarse.assign(df['LAT'].values, df['LON'].values))
+        names = coarse.names(fine.parent(keys, coarse))
+        assert all([name == fine_name[0:precision] for name, fine_name in
+                    zip(names, fine.names(keys))])
+
+    assert grid.assign([-91.0], [0.0]).tolist() == [-1]
+
+
+def test_aggregate_grids():
+    df = _reports()
+    agg_df = aggregate(df.copy(), 'geo_2.5km', minresps=1)
+    assert agg_df['NRESP'].sum() == len(df)
+    assert agg_df.index[0].split()[0].endswith('500') or \
+        agg_df.index[0].split()[0].endswith('000')
+
+    agg_df = aggregate(df.copy(), 'geohash_5', minresps=1)
+    assert agg_df['NRESP'].sum() == len(df)
+    assert all([len(name) == 5 for name in agg_df.index])
+
+
+@pytest.mark.parametrize('producttypes', [
+    ['geo_1km', 'geo_10km'],
+    ['geo_10km', 'geo_2.5km', 'geo_5km'],
+    ['geohash_6', 'geohash_4', 'geohash_5'],
+])
+def test_aggregate_levels(producttypes):
+    # Rolling up one pass gives the same cells as aggregating again
+    df = _reports()
+    results = aggregate_levels(df, producttypes, minresps=3)
+    for producttype in producttypes:
+        expected = aggregate(df.copy(), producttype, minresps=3)
+        result = results[producttype]
+        assert result.index.equals(expected.index)
+        assert result['NRESP'].tolist() == expected['NRESP'].tolist()
+        np.testing.assert_allclose(result['INTENSITY'],
+                                   expected['INTENSITY'])
+        np.testing.assert_array_equal(result['LAT'], expected['LAT'])
+        np.testing.assert_array_equal(result['LON'], expected['LON'])
+
+    with pytest.raises(ValueError):
+        aggregate_levels(df, ['geo_1km', 'geohash_5'])
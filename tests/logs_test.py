@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+import io
+import json
+import logging
+import pandas as pd
+
+from getintensity.logs import setup_logging, WarningCounter
+from getintensity.aggregate import aggregate
+
+
+def test_aggregate_warnings():
+    stream = io.StringIO()
+    setup_logging('INFO', stream=stream)
+
+    # Two rows cannot be geocoded (outside the UTM latitude range)
+    df = pd.DataFrame({
+        'LAT': [38.1, 38.1, 38.1, 89.0, -85.0],
+        'LON': [23.1, 23.1, 23.1, 10.0, 10.0],
+        'INTENSITY': [3.0, 4.0, 5.0, 3.0, 3.0],
+    })
+    agg_df = aggregate(df, 'geo_10km', minresps=3)
+    assert len(agg_df) == 1
+
+    lines = stream.getvalue().splitlines()
+    assert lines[0] == 'WARNING: aggregate_geo_10km: ' \
+        '2 entries with no valid UTM location.'
+    assert lines[1] == 'Geocoded geo_10km got 3 entries with valid locations.'
+
+    reset_logging()
+
+
+def test_json_logging():
+    stream = io.StringIO()
+    logger = setup_logging('WARNING', json_format=True, stream=stream)
+
+    logger.getChild('test').info('Not logged')
+    warnings = WarningCounter(logger.getChild('test'), 'validate')
+    warnings.count('bad coordinates', 3)
+    warnings.count('bad coordinates')
+    warnings.count('bad intensity', 0)
+    counts = warnings.report()
+    assert counts == {'bad coordinates': 4}
+    assert warnings.report() == {}
+
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    assert record['level'] == 'WARNING'
+    assert record['logger'] == 'getintensity.test'
+    assert record['message'] == 'validate: 4 entries with bad coordinates.'
+    assert record['stage'] == 'validate'
+    assert record['count'] == 4
+
+    reset_logging()
+
+
+def reset_logging():
+    logger = logging.getLogger('getintensity')
+    logger.handlers = []
+    logger.propagate = True
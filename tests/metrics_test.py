@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import os.path
+import json
+import tracemalloc
+
+from getintensity.metrics import RunMetrics
+from getintensity.aggregate import aggregate
+from getintensity.emsc import _parse_emsc_raw
+from getintensity.tools import IntensityParser
+
+
+def get_datadir():
+    # this returns the test data directory
+
+    homedir = os.path.dirname(os.path.abspath(__file__))
+    datadir = os.path.join(homedir, 'data')
+    return datadir
+
+
+def test_metrics(tmpdir):
+    testfile = os.path.join(get_datadir(), '20190330_0000065.txt')
+    metrics = RunMetrics(eventid='test', trace_memory=True)
+
+    with metrics.stage('parse', network='emsc') as stage:
+        with open(testfile, 'rb') as f:
+            data = f.read()
+        stage.bytes += len(data)
+        df = _parse_emsc_raw(data)
+        stage.rows_out = len(df)
+
+        # Nested stages inherit the network
+        aggregate(df, 'geo_10km', minresps=3, metrics=metrics)
+
+    report = metrics.report()
+    assert report['eventid'] == 'test'
+    parse, agg = report['stages']
+    assert parse['stage'] == 'parse'
+    assert parse['bytes'] == len(data)
+    assert parse['rows_out'] == 509
+    assert agg['stage'] == 'aggregate_geo_10km'
+    assert agg['network'] == 'emsc'
+    assert agg['rows_in'] == 509
+    assert agg['rows_out'] == 27
+    assert parse['wall_time'] >= agg['wall_time'] > 0
+    assert parse['peak_memory'] >= agg['peak_memory'] > 0
+
+    jsonfile = str(tmpdir.join('metrics.json'))
+    metrics.to_json(jsonfile)
+    with open(jsonfile, 'r') as f:
+        assert json.load(f)['stages'][1]['rows_out'] == 27
+
+    text = metrics.to_prometheus()
+    assert '# TYPE getintensity_stage_seconds gauge' in text
+    assert 'getintensity_stage_rows_out{eventid="test",network="emsc",' \
+        'stage="aggregate_geo_10km"} 27.0' in text
+
+
+def test_parser_trace_memory():
+    testfile = os.path.join(get_datadir(), '20190330_0000065.txt')
+    iparser = IntensityParser(network='emsc')
+    iparser.get_dyfi_dataframe_from_file(testfile)
+    assert iparser.metrics.stages[0].peak_memory is None
+
+    tracing = tracemalloc.is_tracing()
+    try:
+        iparser = IntensityParser(network='emsc', trace_memory=True)
+        iparser.get_dyfi_dataframe_from_file(testfile)
+        stages = iparser.metrics.report()['stages']
+        assert all([stage['peak_memory'] > 0 for stage in stages])
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+
+def test_nested_peak_memory():
+    tracing = tracemalloc.is_tracing()
+    try:
+        metrics = RunMetrics(trace_memory=True)
+        with metrics.stage('outer'):
+            data = bytearray(50 * 2**20)
+            del data
+            with metrics.stage('inner'):
+                data = bytearray(2**20)
+                del data
+        outer, inner = metrics.stages
+        # The outer peak is from before the inner stage
+        assert outer.peak_memory >= 50 * 2**20
+        assert 2**20 <= inner.peak_memory < 50 * 2**20
+    finally:
+        if not tracing:
+            tracemalloc.stop()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+import concurrent.futures
+import json
+import os.path
+import configparser
+import time
+import urllib.error as urlerror
+
+import pytest
+
+from getintensity.fetch import fetch_url
+from getintensity.mockserver import MockServer
+from getintensity.tools import IntensityParser
+
+
+def get_config():
+
+    homedir = os.path.dirname(os.path.abspath(__file__))
+    configfile = os.path.join(homedir, '..', 'config.ini')
+    config = configparser.ConfigParser()
+
+    with open(configfile, 'r') as f:
+        config.read_file(f)
+
+    return config
+
+
+def test_mockserver_urls(tmpdir):
+    with MockServer(nreports=500, seed=1) as server:
+        config = server.configure(get_config(), str(tmpdir))
+        assert config['directories']['data_path'] == str(tmpdir)
+        assert config['neic']['template'].startswith(server.base)
+
+        url = config['neic']['template'].replace('[EID]', 'us1000abcd')
+        detail = json.loads(fetch_url(url).decode('utf-8'))
+        contents = detail['properties']['products']['dyfi'][0]['contents']
+        data = json.loads(fetch_url(
+            contents['dyfi_geo_10km.geojson']['url']).decode('utf-8'))
+        assert len(data['features']) > 0
+
+        url = config['ga']['fetcher_template'].replace(
+            '[EID]', 'ga2020abcd').replace(
+            '[FILE]', 'felt_reports_1km_filtered.geojson')
+        data = json.loads(fetch_url(url).decode('utf-8'))
+        assert len(data['features']) > 0
+        # Each file is generated once
+        assert fetch_url(url) == fetch_url(url)
+
+        with pytest.raises(urlerror.HTTPError) as e:
+            fetch_url(server.url('https://cdn.gagempa.net/unknown'),
+                      retries=0)
+        assert e.value.code == 404
+
+
+def test_emsc_from_mockserver(tmpdir):
+    with MockServer(nreports=500) as server:
+        config = server.configure(get_config(), str(tmpdir))
+        iparser = IntensityParser(config=config, eventid='us1000abcd',
+                                  network='emsc')
+        extid = iparser.get_extid_from_network()
+        assert extid.startswith('20200101_')
+        df, msg = iparser.get_dyfi_dataframe_from_network(extid)
+        assert df is not None
+        assert len(df) > 0
+        assert server.count('www.seismicportal.eu') == 2
+
+
+def test_fetch_retries(tmpdir):
+    # The first two requests to each URL fail
+    with MockServer(fail_first=2) as server:
+        url = server.url('https://www.seismicportal.eu/eventid/api/'
+                         'convert?source_id=us1000abcd')
+        with pytest.raises(urlerror.HTTPError) as e:
+            fetch_url(url, retries=1, backoff=0.01)
+        assert e.value.code == 503
+
+        url = url.replace('us1000abcd', 'us1000efgh')
+        data = json.loads(fetch_url(url, retries=2, backoff=0.01))
+        assert data[0]['source_id'] == 'us1000efgh'
+        assert server.count(path='/eventid') == 5
+
+        # Failed fetches are errors, not exits
+        config = server.configure(get_config(), str(tmpdir))
+        config['fetch']['retries'] = '0'
+        iparser = IntensityParser(config=config, eventid='us1000ijkl',
+                                  network='emsc')
+        assert iparser.get_extid_from_network() is None
+        df, msg = iparser.get_dyfi_dataframe_from_network('20200101_0000001')
+        assert df is None
+        assert 'Could not get data' in msg
+
+
+def test_fetch_timeout():
+    with MockServer(delay=0.5) as server:
+        url = server.url('https://www.seismicportal.eu/eventid/api/'
+                         'convert?source_id=us1000abcd')
+        t0 = time.perf_counter()
+        with pytest.raises(urlerror.URLError):
+            fetch_url(url, timeout=0.1, retries=1, backoff=0.01)
+        assert time.perf_counter() - t0 < 0.5
+        assert fetch_url(url, timeout=2)
+
+
+def test_fetch_bandwidth():
+    bandwidth = 1000000
+    with MockServer(nreports=2000, bandwidth=bandwidth) as server:
+        url = server.url('https://cdn.gagempa.net/skip/events/ga1/'
+                         'felt_reports_1km_filtered.geojson')
+        # Generate the file before timing
+        server.respond('cdn.gagempa.net',
+                       '/skip/events/ga1/felt_reports_1km_filtered.geojson',
+                       '')
+        t0 = time.perf_counter()
+        data = fetch_url(url)
+        assert time.perf_counter() - t0 >= 0.9 * len(data) / bandwidth
+
+
+def test_concurrency(tmpdir):
+    # Fetches from each network are limited to its max_concurrency
+    nevents = 6
+    delay = 0.5
+    with MockServer(nreports=200, delay=delay) as server:
+        config = server.configure(get_config(), str(tmpdir))
+
+        def _fetch(i):
+            iparser = IntensityParser(config=config, network='emsc')
+            return iparser.get_dyfi_dataframe_from_network(
+                '20200101_%07i' % i)
+
+        t0 = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(nevents) as pool:
+            results = list(pool.map(_fetch, range(nevents)))
+        elapsed = time.perf_counter() - t0
+
+    assert all([df is not None for df, msg in results])
+    assert server.max_active == 2
+    assert elapsed < nevents * delay
+
+
+def test_idcache_avoids_lookups(tmpdir):
+    origin = {'lat': 38.0, 'lon': 23.0, 'depth': 10.0,
+              'time': '2020-01-01T00:00:00', 'magnitude': 5.5}
+    with MockServer() as server:
+        config = server.configure(get_config(), str(tmpdir))
+        extids = []
+        for i in range(3):
+            iparser = IntensityParser(config=config, eventid='us1000abcd',
+                                      network='ga')
+            iparser.origin = origin
+            extids.append(iparser.get_extid_from_network())
+
+        assert extids[0].startswith('ga')
+        assert extids[0] == extids[1] == extids[2]
+        assert server.count('skip.gagempa.net') == 1
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+import os.path
+import re
+import gzip
+import json
+import tempfile
+import configparser
+from shutil import rmtree
+from xml.etree import ElementTree
+import pandas as pd
+
+from getintensity.tools import IntensityParser
+import getintensity.output as output
+from getintensity.output import write_station_xml, write_outputs, \
+    parse_formats, materialize_attrs, write_geojson
+from getintensity.stations import station_column, format_stations
+
+
+def get_datadir():
+    # this returns the test data directory
+
+    homedir = os.path.dirname(os.path.abspath(__file__))
+    datadir = os.path.join(homedir, 'data')
+    return datadir
+
+
+def get_config():
+
+    homedir = os.path.dirname(os.path.abspath(__file__))
+    configfile = os.path.join(homedir, '..', 'config.ini')
+    config = configparser.ConfigParser()
+
+    with open(configfile, 'r') as f:
+        config.read_file(f)
+
+    return config
+
+
+def get_dataframe(filename, network):
+    iparser = IntensityParser(eventid='unknown', config=get_config(),
+                              network=network)
+    testfile = os.path.join(get_datadir(), filename)
+    df, msg = iparser.get_dyfi_dataframe_from_file(testfile)
+    return df, iparser.reference
+
+
+def _strip_created(text):
+    return re.sub(r'created="\d+"', 'created=""', text)
+
+
+def test_station_xml():
+    df, reference = get_dataframe('20190330_0000065.txt', 'emsc')
+
+    tempdir = tempfile.mkdtemp(prefix='tmp.', dir=get_datadir())
+    outfile = os.path.join(tempdir, 'emsc_ii_dat.xml')
+    try:
+        nstations = write_station_xml(df, outfile, reference)
+        assert nstations == 49
+
+        # Only the output file should be left, no temporary files
+        assert os.listdir(tempdir) == ['emsc_ii_dat.xml']
+
+        root = ElementTree.parse(outfile).getroot()
+        stationlist = root.find('stationlist')
+        assert stationlist.get('reference') == reference
+        stations = stationlist.findall('station')
+        assert len(stations) == 49
+        assert stations[0].get('code').startswith('INTENSITY.EMSC.UTM:(')
+        assert sum([int(s.get('nresp')) for s in stations]) == 227
+
+    finally:
+        rmtree(tempdir)
+
+
+def test_station_xml_matches_impactutils():
+    from impactutils.io.table import dataframe_to_xml
+
+    tempdir = tempfile.mkdtemp(prefix='tmp.', dir=get_datadir())
+    try:
+        for filename, network in (
+                ('20190330_0000065.txt', 'emsc'),
+                ('nc72282711_dyfi_geo_10km.geojson', 'neic'),
+                ('felt_reports_1km_filtered.geojson', 'ga')):
+
+            df, reference = get_dataframe(filename, network)
+            outfile1 = os.path.join(tempdir, 'impactutils.xml')
+            outfile2 = os.path.join(tempdir, 'streaming.xml')
+            # STATION is made when written (see getintensity.stations)
+            dataframe_to_xml(materialize_attrs(df), outfile1, reference)
+            write_station_xml(df, outfile2, reference)
+
+            with open(outfile1, 'r') as f:
+                expected = _strip_created(f.read())
+            with open(outfile2, 'r') as f:
+                got = _strip_created(f.read())
+            assert got == expected, filename
+
+    finally:
+        rmtree(tempdir)
+
+
+def test_output_formats():
+    df, reference = get_dataframe('20190330_0000065.txt', 'emsc')
+
+    tempdir = tempfile.mkdtemp(prefix='tmp.', dir=get_datadir())
+    outfile = os.path.join(tempdir, 'emsc_ii_dat.xml')
+    try:
+        outfiles = write_outputs(df, outfile, reference, 'csv, geojson')
+        assert [os.path.basename(f) for f in outfiles] == \
+            ['emsc_ii_dat.csv.gz', 'emsc_ii_dat.geojson']
+        assert not os.path.exists(outfile)
+
+        with gzip.open(outfiles[0], 'rt') as f:
+            df_csv = pd.read_csv(f)
+        assert len(df_csv) == 49
+        assert df_csv['NRESP'].sum() == 227
+
+        with open(outfiles[1], 'r') as f:
+            jdict = json.load(f)
+        assert jdict['properties']['reference'] == reference
+        assert len(jdict['features']) == 49
+        feature = jdict['features'][0]
+        assert feature['id'].startswith('EMSC.UTM:(')
+        assert 'nresp' in feature['properties']
+
+    finally:
+        rmtree(tempdir)
+
+    try:
+        parse_formats('xml,shapefile')
+        assert False, 'Should have rejected unknown format'
+    except ValueError:
+        pass
+
+
+def test_geojson_chunks(monkeypatch):
+    # Station counts at and around a multiple of the chunk size
+    df, reference = get_dataframe('20190330_0000065.txt', 'emsc')
+    monkeypatch.setattr(output, 'CHUNKSIZE', 3)
+
+    tempdir = tempfile.mkdtemp(prefix='tmp.', dir=get_datadir())
+    outfile = os.path.join(tempdir, 'emsc_ii_dat.geojson')
+    try:
+        for nstations in (0, 1, 3, 4, 6):
+            write_geojson(df.iloc[0:nstations], outfile, reference)
+            with open(outfile, 'r') as f:
+                jdict = json.loads(f.read())
+            assert len(jdict['features']) == nstations
+    finally:
+        rmtree(tempdir)
+
+
+def test_postprocess_attrs():
+    df, reference = get_dataframe('20190330_0000065.txt', 'emsc')
+    assert df.attrs['netid'] == 'INTENSITY'
+    assert df.attrs['network'] == 'emsc'
+    assert df.attrs['reference'] == reference
+    # Only added when written, with one string per column
+    assert 'NETID' not in df.columns
+    assert 'SOURCE' not in df.columns
+    written = materialize_attrs(df)
+    for column in ('NETID', 'SOURCE'):
+        assert isinstance(written[column].dtype, pd.CategoricalDtype)
+        assert len(written[column].cat.categories) == 1
+    assert (written['NETID'] == 'INTENSITY').all()
+
+    # Written from df.attrs without the columns
+    tempdir = tempfile.mkdtemp(prefix='tmp.', dir=get_datadir())
+    try:
+        outfile = os.path.join(tempdir, 'emsc_ii_dat.xml')
+        write_station_xml(df, outfile, reference)
+        with open(outfile) as f:
+            expected = _strip_created(f.read())
+
+        # Same as with the columns
+        write_station_xml(written, outfile)
+        with open(outfile) as f:
+            assert _strip_created(f.read()) == expected
+    finally:
+        rmtree(tempdir)
+
+
+def test_station_ids():
+    df, reference = get_dataframe('20190330_0000065.txt', 'emsc')
+    # Made from the box names when written
+    assert 'STATION' not in df.columns
+    assert station_column(df).iloc[0] == 'EMSC.UTM:(%s)' % df.index[0]
+    assert materialize_attrs(df)['STATION'].tolist() == \
+        ['EMSC.UTM:(%s)' % loc for loc in df.index]
+    assert format_stations(['a'], 'X.%s.Y').tolist() == ['X.a.Y']
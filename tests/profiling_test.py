@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+import os.path
+import pstats
+import time
+
+from getintensity.metrics import RunMetrics
+from getintensity.profiling import Profiler
+from getintensity.aggregate import aggregate
+from getintensity.emsc import _parse_emsc_raw
+
+
+def get_datadir():
+    # this returns the test data directory
+
+    homedir = os.path.dirname(os.path.abspath(__file__))
+    datadir = os.path.join(homedir, 'data')
+    return datadir
+
+
+def test_profiler(tmpdir):
+    testfile = os.path.join(get_datadir(), '20190330_0000065.txt')
+    with open(testfile, 'rb') as f:
+        data = f.read()
+
+    profiler = Profiler(str(tmpdir), interval=0.001)
+    metrics = RunMetrics(eventid='test', profiler=profiler)
+    with metrics.stage('parse', network='emsc'):
+        df = _parse_emsc_raw(data)
+        aggregate(df, 'geo_1km', metrics=metrics)
+
+    outfiles = profiler.save()
+    names = [os.path.basename(f) for f in outfiles]
+    # Inner stages finish first
+    assert names == ['00_aggregate_geo_1km.prof', '01_parse.prof',
+                     'stacks.folded']
+
+    # The aggregate stage is excluded from the parse profile
+    stats = pstats.Stats(outfiles[0])
+    assert any([func[2] == '_aggregate' for func in stats.stats])
+    stats = pstats.Stats(outfiles[1])
+    assert not any([func[2] == '_aggregate' for func in stats.stats])
+
+    # The sampler may not catch a short stage, only check the format
+    with open(outfiles[2], 'r') as f:
+        lines = f.read().splitlines()
+    for line in lines:
+        stack, count = line.rsplit(' ', 1)
+        assert stack.startswith('stage:parse')
+        assert int(count) > 0
+
+
+def test_sampled_stacks(tmpdir):
+    # Run a stage until its stack is sampled
+    profiler = Profiler(str(tmpdir), interval=0.001)
+    metrics = RunMetrics(profiler=profiler)
+    deadline = time.time() + 10
+    with metrics.stage('busy'):
+        while not profiler.samples and time.time() < deadline:
+            sum(range(1000))
+
+    outfile = profiler.save()[-1]
+    with open(outfile, 'r') as f:
+        lines = f.read().splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(' ', 1)
+        assert stack.startswith('stage:busy;')
+        assert int(count) > 0
+
+
+def test_no_profiler():
+    metrics = RunMetrics()
+    assert metrics.profiler is None
+    with metrics.stage('parse'):
+        pass
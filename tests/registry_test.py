@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import pandas as pd
+
+import getintensity.registry as registry
+from getintensity.registry import Network
+from getintensity.output import materialize_attrs
+from getintensity.tools import IntensityParser
+
+
+class FakeNetwork(Network):
+
+    netid = 'FAKE'
+    source = 'Fake network'
+    reference = 'Fake network'
+    default_outfile = 'fake_dat.xml'
+    max_concurrency = 3
+    file_patterns = [r'fake_']
+
+    def fetch(self, extid):
+        df = pd.DataFrame({
+            'station': ['A', 'B'],
+            'lat': [38.0, 38.1],
+            'lon': [23.0, 23.1],
+            'intensity': [3.0, 4.0],
+            'nresp': [5, 10],
+        })
+        return df, None
+
+    def resolve_id(self, eventid):
+        return 'fake_' + eventid
+
+
+def test_builtin_networks():
+    assert registry.available_networks()[0:3] == ['neic', 'ga', 'emsc']
+    emsc = registry.get_network_class('emsc')
+    assert emsc.__name__ == 'EmscNetwork'
+    assert emsc.name == 'emsc'
+    assert emsc.netid == 'INTENSITY'
+    assert registry.get_network_class('unknown') is None
+
+    iparser = IntensityParser()
+    assert iparser.get_network_from_file('felt_reports_1km.geojson') == 'ga'
+    assert iparser.get_network_from_file('dyfi_geo_10km.geojson') == 'neic'
+    assert iparser.get_network_from_file('20190330_0000065.txt') == 'emsc'
+    assert iparser.get_network_from_file('unknown.txt') is None
+
+
+def test_register():
+    registry.register('fake', FakeNetwork)
+    try:
+        assert registry.get_network_class('fake') is FakeNetwork
+        assert 'fake' in registry.available_networks()
+        assert registry.limit('fake')._initial_value == 3
+
+        iparser = IntensityParser(network='fake')
+        df, msg = iparser.get_dyfi_dataframe_from_network('fake1')
+        assert msg is None
+        assert df.attrs['netid'] == 'FAKE'
+        assert materialize_attrs(df)['NETID'].tolist() == ['FAKE', 'FAKE']
+        assert 'INTENSITY_STDDEV' in df.columns
+        assert iparser.default_outfile == 'fake_dat.xml'
+        assert iparser.resolve_extids(['us1']) == {'us1': 'fake_us1'}
+        assert iparser.get_network_from_file('fake_1.geojson') == 'fake'
+    finally:
+        registry.BUILTIN_NETWORKS.pop('fake', None)
+        registry._classes.pop('fake', None)
+        registry._semaphores.pop('fake', None)
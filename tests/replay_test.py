@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import json
+import urllib.request as request
+
+import pytest
+
+from getintensity.replay import ReplayServer, load_cassettes, run_replay
+
+
+def test_replay_server():
+    routes = load_cassettes([('vcr_ga.yaml', 'ga2019nsodfc'),
+                             ('vcr_emsc_eventid.yaml', 'nc72282711')])
+    with ReplayServer(routes, vary=False) as server:
+        # Any event ID gets the recorded data
+        url = server.url('https://cdn.gagempa.net/skip/events/ga2020abc/'
+                         'felt_reports_1km_filtered.geojson')
+        with request.urlopen(url) as fh:
+            data = json.loads(fh.read().decode('utf-8'))
+        assert len(data['features']) > 100
+
+        url = server.url('https://www.seismicportal.eu/eventid/api/convert'
+                         '?source_id=us1000abcd&source_catalog=USGS')
+        with request.urlopen(url) as fh:
+            data = json.loads(fh.read().decode('utf-8'))
+        assert data[0]['id'] == 'us1000abcd'
+
+        status, headers, body = server.respond('cdn.gagempa.net',
+                                               '/unknown', '')
+        assert status == 404
+
+    # Varied data is different for each event, but repeatable
+    with ReplayServer(routes, vary=True) as server:
+        path = '/skip/events/%s/felt_reports_1km_filtered.geojson'
+        bodies = [server.respond('cdn.gagempa.net', path % eventid, '')[2]
+                  for eventid in ('ga1', 'ga2', 'ga1')]
+    assert bodies[0] != bodies[1]
+    assert bodies[0] == bodies[2]
+
+
+def test_run_replay():
+    results = run_replay(nevents=4, networks=['emsc'], workers=2)
+    result = results['emsc']
+    assert result['events'] == 4
+    assert result['errors'] == 0
+    assert result['stations'] > 0
+    assert result['events_per_sec'] > 0
+    assert result['p50'] <= result['p99']
+
+
+def test_missing_cassettes(tmpdir):
+    # e.g. an installed package, without the test data
+    with pytest.raises(FileNotFoundError, match='--datadir'):
+        load_cassettes(datadir=str(tmpdir))
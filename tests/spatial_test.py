@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from getintensity.spatial import StationIndex, distance, filter_domain
+from getintensity.synthetic import generate_reports
+from getintensity.metrics import RunMetrics
+
+
+def test_query_radius():
+    for scenario in ('greece', 'dateline', 'svalbard'):
+        df = generate_reports(2000, scenario=scenario, spread=100, seed=1)
+        index = StationIndex(df)
+        assert len(index) == 2000
+
+        lat, lon = df['LAT'].iloc[0], df['LON'].iloc[0]
+        for radius in (0, 10, 150, 1000, 30000):
+            positions = index.query_radius(lat, lon, radius)
+            dists = distance(df['LAT'].values, df['LON'].values, lat, lon)
+            expected = np.nonzero(dists <= radius)[0]
+            assert np.array_equal(positions, expected)
+
+    # Circle containing the pole
+    df = pd.DataFrame({'lat': [89.5, 89.5, 80.0], 'lon': [0, 180, 0]})
+    assert StationIndex(df).query_radius(89.5, 0, 120).tolist() == [0, 1]
+
+
+def test_query_bbox():
+    df = pd.DataFrame({
+        'LAT': [-17.0, -17.0, -17.0, -16.0, -20.0],
+        'LON': [179.5, -179.5, 170.0, 180.0, 179.9],
+    })
+    index = StationIndex(df)
+    assert index.query_bbox(-18, -16, 170, 180).tolist() == [0, 2, 3]
+    # Crossing the dateline
+    assert index.query_bbox(-18, -16, 179, -179).tolist() == [0, 1, 3]
+    assert index.query_bbox(-21, -16, -180, 180).tolist() == [0, 1, 2, 3, 4]
+    assert index.query_bbox(10, 20, -180, 180).tolist() == []
+
+    df = generate_reports(2000, scenario='zone_boundary', seed=1)
+    positions = StationIndex(df).query_bbox(37.8, 38.2, 23.5, 24.5)
+    expected = df['LAT'].between(37.8, 38.2) & df['LON'].between(23.5, 24.5)
+    assert np.array_equal(positions, np.nonzero(expected.values)[0])
+
+
+def test_filter_domain():
+    df = pd.DataFrame({
+        'STATION': ['A', 'B', 'C'],
+        'LAT': [38.0, 38.5, 45.0],
+        'LON': [23.0, 23.0, 23.0],
+    })
+    assert filter_domain(df) is df
+
+    metrics = RunMetrics()
+    near = filter_domain(df, center=(38.0, 23.0), radius=100,
+                         network='emsc', metrics=metrics)
+    assert near['STATION'].tolist() == ['A', 'B']
+    assert metrics.stages[0].name == 'domain'
+    assert metrics.stages[0].rows_out == 2
+
+    near = filter_domain(df, center=(38.0, 23.0), radius=100,
+                         bounds=(38.2, 50, 20, 25))
+    assert near['STATION'].tolist() == ['B']
+
+    with pytest.raises(ValueError):
+        filter_domain(df, radius=100)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import os.path
+import configparser
+import numpy as np
+import pandas as pd
+import pytest
+
+from getintensity.stddev import get_model, compute_stddev, compare_models, \
+    LOOKUP_SIZE
+from getintensity.tools import IntensityParser
+
+
+def get_config():
+
+    homedir = os.path.dirname(os.path.abspath(__file__))
+    configfile = os.path.join(homedir, '..', 'config.ini')
+    config = configparser.ConfigParser()
+
+    with open(configfile, 'r') as f:
+        config.read_file(f)
+
+    return config
+
+
+def test_worden2012():
+    nresps = np.array([1, 3, 10, 100, LOOKUP_SIZE + 5, 2.5, np.nan])
+    df = pd.DataFrame({'NRESP': nresps})
+    stddevs = compute_stddev(df)
+    expected = np.exp(nresps * (-1/24.02)) * 0.25 + 0.09
+    np.testing.assert_allclose(stddevs, expected, rtol=1e-15)
+    assert np.isnan(stddevs[-1])
+
+    # Same values from the lookup table and the formula
+    model = get_model('worden2012')
+    np.testing.assert_array_equal(
+        model.table[[1, 3, 10, 100]],
+        model.evaluate(np.array([1.0, 3.0, 10.0, 100.0])))
+    assert get_model('worden2012') is model
+
+
+def test_bossu2016():
+    df = pd.DataFrame({'INTENSITY': [2.0, 3.15, 5.0]})
+    assert compute_stddev(df, 'bossu2016').tolist() == [0.49, 0.36, 0.36]
+    assert not get_model('bossu2016').applies(pd.DataFrame({'NRESP': [1]}))
+
+
+def test_table_model(tmpdir):
+    tablefile = str(tmpdir.join('stddevs.csv'))
+    with open(tablefile, 'w') as f:
+        f.write('nresp, stddev\n1, 0.5\n11, 0.3\n101, 0.1\n')
+    df = pd.DataFrame({'NRESP': [0, 1, 6, 56.0, 500]})
+    stddevs = compute_stddev(df, 'table:' + tablefile)
+    np.testing.assert_allclose(stddevs, [0.5, 0.5, 0.4, 0.2, 0.1])
+
+    with open(tablefile, 'w') as f:
+        f.write('n, s\n1, 0.5\n')
+    with pytest.raises(ValueError):
+        get_model('table: ' + tablefile)
+    with pytest.raises(ValueError):
+        get_model('worden2013')
+
+
+def test_compare_models():
+    df = pd.DataFrame({'NRESP': [1, 10], 'INTENSITY': [2.0, 4.0]},
+                      index=['a', 'b'])
+    stddevs = compare_models(df, ['worden2012', 'bossu2016'])
+    assert list(stddevs.columns) == ['worden2012', 'bossu2016']
+    assert list(stddevs.index) == ['a', 'b']
+    stddevs = compare_models(df[['NRESP']], ['worden2012', 'bossu2016'])
+    assert list(stddevs.columns) == ['worden2012']
+
+
+def test_network_models():
+    config = get_config()
+    iparser = IntensityParser(config=config)
+    assert iparser.get_stddev_model('emsc').name == 'worden2012'
+
+    config['stddev']['emsc'] = 'bossu2016'
+    assert iparser.get_stddev_model('emsc').name == 'bossu2016'
+    assert iparser.get_stddev_model('ga').name == 'worden2012'
+
+    df = pd.DataFrame({'intensity': [2.0, 4.0], 'nresp': [3, 4],
+                       'lat': [38.0, 38.1], 'lon': [23.0, 23.1]})
+    df, msg = iparser.postprocess(df, 'emsc')
+    assert df['INTENSITY_STDDEV'].tolist() == [0.49, 0.36]
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import json
+import numpy as np
+
+from getintensity import synthetic
+from getintensity.tools import IntensityParser
+from getintensity.comcat import _parse_dyfi_geocoded_json
+from getintensity.emsc import process_emsc_csv
+
+
+def test_generate_reports():
+    for scenario in synthetic.SCENARIOS:
+        for distribution in synthetic.DISTRIBUTIONS:
+            df = synthetic.generate_reports(500, scenario=scenario,
+                                            distribution=distribution,
+                                            seed=1)
+            assert len(df) == 500
+            assert df['LAT'].between(-80, 84).all()
+            assert df['LON'].between(-180, 180).all()
+            assert df['INTENSITY'].between(1, 10).all()
+
+    # Same seed, same reports
+    df1 = synthetic.generate_reports(100, seed=2)
+    df2 = synthetic.generate_reports(100, seed=2)
+    assert df1.equals(df2)
+
+    # Reports on both sides of the zone 34/35 boundary
+    df = synthetic.generate_reports(1000, scenario='zone_boundary', seed=1)
+    assert (df['LON'] < 24).any() and (df['LON'] > 24).any()
+
+    try:
+        synthetic.generate_reports(10, distribution='gaussian')
+        assert False, 'Should have rejected unknown distribution'
+    except ValueError:
+        pass
+
+
+def test_synthetic_files():
+    reports = synthetic.generate_reports(3000, scenario='australia',
+                                         distribution='cities', seed=3)
+
+    iparser = IntensityParser(eventid='unknown', network='emsc')
+    df = process_emsc_csv(iparser, synthetic.emsc_csv(reports))
+    assert len(df)
+    assert df['NRESP'].sum() <= 3000
+
+    df = _parse_dyfi_geocoded_json(synthetic.dyfi_geojson(reports))
+    assert len(df)
+    assert (df['nresp'] >= 3).all()
+    assert not df['station'].str.contains('<br>').any()
+
+    jdict = json.loads(synthetic.ga_geojson(reports).decode('utf-8'))
+    nresp = [f['properties']['nresp'] for f in jdict['features']]
+    np.testing.assert_equal(sum(nresp), 3000)
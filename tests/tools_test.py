@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import os.path
+import json
+import configparser
+import numpy as np
+import pandas as pd
+
+from getintensity.tools import IntensityParser
+from getintensity.spatial import distance
+
+
+def get_datadir():
+    # this returns the test data directory
+
+    homedir = os.path.dirname(os.path.abspath(__file__))
+    datadir = os.path.join(homedir, 'data')
+    return datadir
+
+
+def get_config():
+
+    homedir = os.path.dirname(os.path.abspath(__file__))
+    configfile = os.path.join(homedir, '..', 'config.ini')
+    config = configparser.ConfigParser()
+
+    with open(configfile, 'r') as f:
+        config.read_file(f)
+
+    return config
+
+
+def test_postprocess_distance():
+    datadir = get_datadir()
+    testfile = os.path.join(datadir, '20190330_0000065.txt')
+
+    # Without an origin there is no distance
+    iparser = IntensityParser(network='emsc')
+    df, msg = iparser.get_dyfi_dataframe_from_file(testfile)
+    assert 'DISTANCE' not in df.columns
+
+    iparser = IntensityParser(network='emsc')
+    iparser.origin = {'lat': 37.0, 'lon': 28.0, 'depth': 10.0}
+    df, msg = iparser.get_dyfi_dataframe_from_file(testfile)
+    epicentral = distance(df['LAT'].values, df['LON'].values, 37.0, 28.0)
+    np.testing.assert_allclose(df['DISTANCE'].values,
+                               np.sqrt(epicentral**2 + 100))
+
+
+def test_get_origin(tmpdir):
+    config = get_config()
+    config['directories']['data_path'] = str(tmpdir)
+    origin = {'lat': 35.77, 'lon': -117.6, 'depth': 8.0,
+              'time': '2019-07-06T03:19:53', 'magnitude': 7.1}
+
+    # Read from the raw directory, without Comcat
+    os.makedirs(os.path.join(str(tmpdir), 'raw'))
+    rawfile = os.path.join(str(tmpdir), 'raw', 'origin.ci38457511.json')
+    with open(rawfile, 'w') as f:
+        json.dump(origin, f)
+
+    iparser = IntensityParser(config=config, eventid='ci38457511')
+    assert iparser.get_origin() == origin
+    assert iparser.origin == origin
+
+    # Only looked up when needed, and allowed
+    iparser = IntensityParser(config=config, eventid='ci38457511')
+    assert iparser.find_origin() is None
+    iparser = IntensityParser(config=config, eventid='ci38457511',
+                              lookup_origin=True)
+    assert iparser.find_origin() == origin
+    testfile = os.path.join(get_datadir(), '20190330_0000065.txt')
+    iparser = IntensityParser(config=config, eventid='ci38457511',
+                              network='emsc', lookup_origin=True)
+    df, msg = iparser.get_dyfi_dataframe_from_file(testfile)
+    assert iparser.origin == origin
+    assert 'DISTANCE' in df.columns
+
+    # No event ID, no lookup
+    iparser = IntensityParser(config=config, lookup_origin=True)
+    assert iparser.get_origin() is None
+    assert iparser.find_origin() is None
+
+
+def test_get_zone():
+    config = get_config()
+    iparser = IntensityParser(config=config, network='emsc')
+    assert iparser.get_zone() is None
+
+    config['aggregate']['fixed_zone'] = 'yes'
+    df = pd.DataFrame({'LAT': [38.0, 38.1, 38.2], 'LON': [24.5, 24.6, 22.0]})
+    assert iparser.get_zone(df) == 35
+    iparser.origin = {'lat': 38.0, 'lon': 23.0, 'depth': 10.0}
+    assert iparser.get_zone(df) == 34
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+import numpy as np
+import pandas as pd
+
+from getintensity.validate import validate_dataframe, validate, \
+    find_duplicates, deduplicate
+from getintensity.metrics import RunMetrics
+
+
+def test_validate_dataframe():
+    df = pd.DataFrame({
+        'lat': [38.1, np.nan, 95.0, 85.0, 38.1, 38.1, 38.1, 38.1, 38.1],
+        'lon': [23.1, 23.1, 23.1, 23.1, 23.1, 23.1, 23.1, 23.1, 23.1],
+        'intensity': [3.0, 3.0, 3.0, 3.0, 0.5, np.nan, 3.0, 3.0, 3.0],
+        'nresp': [5, 5, 5, 5, 5, 5, 0, 5, 5],
+        'suspect': [0, 0, 0, 0, 0, 0, 0, 1, 0],
+        'station': ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'A'],
+    })
+
+    valid, counts = validate_dataframe(df)
+    assert valid['station'].tolist() == ['A', 'D']
+    assert 'suspect' not in valid.columns
+    assert counts == {
+        'bad coordinates': 2,
+        'bad intensity': 2,
+        'bad nresp': 1,
+        'suspect': 1,
+        'duplicate station': 1,
+    }
+
+    # Reports to be aggregated must also be within the UTM range
+    valid, counts = validate_dataframe(df, utm=True)
+    assert valid['station'].tolist() == ['A']
+    assert counts['outside UTM range'] == 1
+
+
+def test_validate_stage():
+    df = pd.DataFrame({
+        'LAT': [38.1, 38.2, -81.0],
+        'LON': [23.1, 23.2, 23.1],
+        'INTENSITY': [3.0, 13.0, 3.0],
+    })
+
+    metrics = RunMetrics()
+    valid = validate(df, utm=True, network='emsc', metrics=metrics)
+    assert len(valid) == 1
+
+    stage = metrics.report()['stages'][0]
+    assert stage['stage'] == 'validate'
+    assert stage['rows_in'] == 3
+    assert stage['rows_out'] == 1
+    assert stage['rejected'] == {'outside UTM range': 1, 'bad intensity': 1}
+
+
+def test_find_duplicates():
+    df = pd.DataFrame({
+        'LAT': [38.1, 38.101, 38.1, 38.1, 38.2],
+        'LON': [23.1, 23.1, 23.1, 23.1, 23.1],
+        'INTENSITY': [3.0, 3.0, 3.1, 3.0, 3.0],
+        'TIME': ['t1', 't1', 't1', 't2', 't1'],
+    })
+
+    np.testing.assert_equal(find_duplicates(df),
+                            [False, False, False, True, False])
+    np.testing.assert_equal(find_duplicates(df, precision=2),
+                            [False, True, False, True, False])
+    np.testing.assert_equal(find_duplicates(df, time_column='TIME'),
+                            [False, False, False, False, False])
+
+    metrics = RunMetrics()
+    deduped = deduplicate(df, precision=2, metrics=metrics)
+    assert len(deduped) == 3
+    stage = metrics.report()['stages'][0]
+    assert stage['rejected'] == {'duplicate report': 2}